@@ -17,7 +17,11 @@ import {
   Typography,
 } from "@mui/material";
 import React, { useContext, useEffect, useState } from "react";
-import { getGraphItems, addGraphItem } from "../../shared/api";
+import {
+  getGraphItems,
+  addGraphItem,
+  autocompleteNodeNames,
+} from "../../shared/api";
 import { useParams } from "react-router-dom";
 import CloseIcon from "@mui/icons-material/Close";
 import CircleIcon from "@mui/icons-material/Circle";
@@ -44,7 +48,6 @@ const AddGraphItem = ({ handleClose }) => {
   const [loading, setLoading] = useState(true);
   const [values, setValues] = useState(INITIAL_STATE);
   const [data, setData] = useState({
-    nodeNames: [],
     nodeTypes: [],
     edgeTypes: [],
   });
@@ -59,7 +62,6 @@ const AddGraphItem = ({ handleClose }) => {
 
         if (response.status === 200) {
           setData({
-            nodeNames: response.data.node_names,
             nodeTypes: response.data.node_types,
             edgeTypes: response.data.edge_types,
           });
@@ -226,11 +228,38 @@ const AddItemComponent = ({ data, values, setValues }) => {
   );
 };
 
-const NodeAutoComplete = ({ context, existingNodeNames, value, setValue }) => {
+const NodeAutoComplete = ({ context, nodeType, value, setValue }) => {
+  const { graphId } = useParams();
+  const [inputValue, setInputValue] = useState("");
+  const [options, setOptions] = useState([]);
+
+  useEffect(() => {
+    // Fetch matching node names once the user pauses typing
+    let active = true;
+    const timeout = setTimeout(async () => {
+      try {
+        const response = await autocompleteNodeNames(
+          graphId,
+          inputValue,
+          nodeType
+        );
+        if (active) {
+          setOptions([...new Set(response.data.map((n) => n.name))]);
+        }
+      } catch (error) {}
+    }, 200);
+
+    return () => {
+      active = false;
+      clearTimeout(timeout);
+    };
+  }, [graphId, inputValue, nodeType]);
+
   return (
     <Autocomplete
       freeSolo
       autoHighlight
+      filterOptions={(x) => x}
       value={value}
       onChange={(event, newValue) => {
         if (newValue) {
@@ -239,6 +268,11 @@ const NodeAutoComplete = ({ context, existingNodeNames, value, setValue }) => {
           setValue("");
         }
       }}
+      inputValue={inputValue}
+      onInputChange={(event, newInputValue) => {
+        setInputValue(newInputValue);
+        setValue(newInputValue);
+      }}
       renderInput={(params) => (
         <TextField
           {...params}
@@ -246,7 +280,7 @@ const NodeAutoComplete = ({ context, existingNodeNames, value, setValue }) => {
           placeholder="Select or type name"
         />
       )}
-      options={existingNodeNames}
+      options={options}
     />
   );
 };
@@ -275,7 +309,7 @@ const NodeFormComponent = ({ isHead, data, values, setValues }) => {
       <Box width={400}>
         <NodeAutoComplete
           context={name}
-          existingNodeNames={data.nodeNames.sort((a, b) => a.localeCompare(b))}
+          nodeType={values[key].type}
           value={values[key].name}
           setValue={setName}
         />
@@ -32,18 +32,18 @@ const ErrorsOrSuggestions = ({ context, handleClose }) => {
     const getData = async () => {
       if (loading) {
         try {
-          let response;
-          if (isErrors) {
-            response = await getErrors(graphId);
-          } else {
-            response = await getSuggestions(graphId);
-          }
-
-          if (response.status === 200) {
-            setData(response.data);
-          } else {
-            throw new Error();
-          }
+          const getPage = isErrors ? getErrors : getSuggestions;
+          const items = [];
+          let cursor = null;
+          do {
+            const response = await getPage(graphId, cursor);
+            if (response.status !== 200) {
+              throw new Error();
+            }
+            items.push(...response.data.items);
+            cursor = response.data.next_cursor;
+          } while (cursor);
+          setData(items);
         } catch (error) {
           openSnackbar("error", "Error", `Failed to retrieve ${context}.`);
         } finally {
@@ -18,6 +18,23 @@ export const getGraphData = (graphId) => {
   return axios.get(`/graph/${graphId}`);
 };
 
+export const getGraphChanges = (graphId, since) => {
+  // Nodes/edges/triples changed since a graph version ("reset" means reload).
+  return axios.get(`/graph/changes/${graphId}`, { params: { since: since } });
+};
+
+export const getGraphAnalytics = (graphId, activeOnly = false) => {
+  // Degree stats, hubs, components, PageRank and class counts of a graph.
+  return axios.get(`/graph/analytics/${graphId}`, {
+    params: { active_only: activeOnly },
+  });
+};
+
+export const getGraphStats = (graphId) => {
+  // Node/edge counts per class (active, reviewed, with open errors).
+  return axios.get(`/graph/stats/${graphId}`);
+};
+
 export const updateSettings = (graphId, data) => {
   return axios.patch(`/graph/settings/${graphId}`, data);
 };
@@ -68,12 +85,12 @@ export const deleteProperty = (isNode, itemId, propertyId) => {
   });
 };
 
-export const getErrors = (graphId) => {
-  return axios.get(`/errors/${graphId}`);
+export const getErrors = (graphId, cursor = null, limit = 1000) => {
+  return axios.get(`/errors/${graphId}`, { params: { cursor, limit } });
 };
 
-export const getSuggestions = (graphId) => {
-  return axios.get(`/suggestions/${graphId}`);
+export const getSuggestions = (graphId, cursor = null, limit = 1000) => {
+  return axios.get(`/suggestions/${graphId}`, { params: { cursor, limit } });
 };
 
 //
@@ -119,6 +136,13 @@ export const getGraphItems = (graphId) => {
   return axios.get(`/graph/items/${graphId}`);
 };
 
+export const autocompleteNodeNames = (graphId, prefix, nodeType, limit = 20) => {
+  // Node names of a graph starting with prefix (optionally of one node class).
+  return axios.get(`/graph/autocomplete/${graphId}`, {
+    params: { q: prefix, node_type: nodeType || undefined, limit: limit },
+  });
+};
+
 export const addGraphItem = (graphId, payload) => {
   return axios.post(`/graph/item/${graphId}`, payload);
 };
@@ -0,0 +1,172 @@
+"""
+Synthetic knowledge graph generator for benchmarks.
+
+Graphs are generated deterministically from a seed so runs are comparable over time.
+The output is an `InputGraph` in the same shape as an upload from the client.
+"""
+import random
+import string
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from models import graph as graph_model
+
+
+class GeneratorConfig(BaseModel):
+    nodes: int = Field(default=1000, ge=2, description="Number of distinct nodes")
+    triples: int = Field(default=3000, ge=1, description="Number of triples")
+    node_types: int = Field(default=10, ge=1, description="Number of node classes")
+    edge_types: int = Field(default=20, ge=1, description="Number of relation classes")
+    degree_distribution: str = Field(
+        default="powerlaw",
+        description='How triple endpoints are drawn: "uniform" or "powerlaw"',
+    )
+    powerlaw_exponent: float = Field(
+        default=1.0, gt=0, description="Zipf exponent used by the powerlaw distribution"
+    )
+    property_density: float = Field(
+        default=0.3,
+        ge=0,
+        le=1,
+        description="Probability a node or relation in a triple carries properties",
+    )
+    properties_per_item: int = Field(default=3, ge=0)
+    near_duplicate_fraction: float = Field(
+        default=0.05,
+        ge=0,
+        le=1,
+        description="Fraction of nodes whose name is a one-edit typo of another node",
+    )
+    seed: int = 42
+
+
+def _random_word(rng: random.Random, length: int) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=length))
+
+
+def _typo(rng: random.Random, name: str) -> str:
+    """Returns `name` with a single character inserted, removed or substituted."""
+    i = rng.randrange(len(name))
+    op = rng.choice(["insert", "delete", "substitute"])
+    c = rng.choice(string.ascii_lowercase)
+    if op == "insert":
+        return name[:i] + c + name[i:]
+    if op == "delete" and len(name) > 1:
+        return name[:i] + name[i + 1 :]
+    return name[:i] + c + name[i + 1 :]
+
+
+def generate_nodes(config: GeneratorConfig, rng: random.Random) -> List[Dict]:
+    """Generates node names/types, including near-duplicate names.
+
+    Near-duplicates carry a "duplicate_of" (name, type) key pointing at their original.
+    """
+    node_types = [f"NodeType{i}" for i in range(config.node_types)]
+    n_duplicates = int(config.nodes * config.near_duplicate_fraction)
+
+    nodes = []
+    seen = set()
+    while len(nodes) < config.nodes - n_duplicates:
+        name = f"{_random_word(rng, 6)} {_random_word(rng, 4)}"
+        key = (name, rng.choice(node_types))
+        if key not in seen:
+            seen.add(key)
+            nodes.append({"name": key[0], "type": key[1]})
+
+    originals = list(nodes)
+    while len(nodes) < config.nodes:
+        original = rng.choice(originals)
+        key = (_typo(rng, original["name"]), original["type"])
+        if key not in seen:
+            seen.add(key)
+            nodes.append(
+                {
+                    "name": key[0],
+                    "type": key[1],
+                    "duplicate_of": (original["name"], original["type"]),
+                }
+            )
+
+    rng.shuffle(nodes)
+    return nodes
+
+
+def _endpoint_weights(config: GeneratorConfig) -> Optional[List[float]]:
+    if config.degree_distribution == "uniform":
+        return None
+    if config.degree_distribution == "powerlaw":
+        return [
+            1 / (rank**config.powerlaw_exponent)
+            for rank in range(1, config.nodes + 1)
+        ]
+    raise ValueError(f"Unknown degree distribution: {config.degree_distribution}")
+
+
+def _properties(config: GeneratorConfig, rng: random.Random) -> Optional[Dict]:
+    if config.properties_per_item == 0 or rng.random() >= config.property_density:
+        return None
+    return {
+        _random_word(rng, 5): str(
+            rng.choice([rng.randint(0, 1000), _random_word(rng, 8)])
+        )
+        for _ in range(config.properties_per_item)
+    }
+
+
+def generate_graph(
+    config: GeneratorConfig, name: str = "benchmark", plugins: Optional[Dict] = None
+) -> graph_model.InputGraph:
+    """Generates a synthetic typed property graph.
+
+    Triples connect distinct nodes; with the "powerlaw" distribution a few hub nodes
+    take part in a large share of triples, as in real extracted knowledge graphs.
+    """
+    rng = random.Random(config.seed)
+    nodes = generate_nodes(config, rng)
+    edge_types = [f"relation_{i}" for i in range(config.edge_types)]
+    weights = _endpoint_weights(config)
+    cum_weights = None
+    if weights is not None:
+        cum_weights = []
+        total = 0
+        for w in weights:
+            total += w
+            cum_weights.append(total)
+
+    triples = []
+    for _ in range(config.triples):
+        head, tail = rng.choices(nodes, cum_weights=cum_weights, k=2)
+        while tail is head:
+            tail = rng.choice(nodes)
+        triples.append(
+            graph_model.Triple(
+                head=head["name"],
+                head_type=head["type"],
+                head_properties=_properties(config, rng),
+                relation=rng.choice(edge_types),
+                relation_properties=_properties(config, rng),
+                tail=tail["name"],
+                tail_type=tail["type"],
+                tail_properties=_properties(config, rng),
+            )
+        )
+
+    return graph_model.InputGraph(
+        name=name,
+        node_classes=[],
+        edge_classes=[],
+        filename=f"{name}.json",
+        plugins=graph_model.Plugins(**(plugins or {})),
+        triples=triples,
+    )
+
+
+def near_duplicate_pairs(config: GeneratorConfig) -> List[Tuple[Tuple, Tuple]]:
+    """Returns the (duplicate, original) node keys planted by `generate_graph`."""
+    nodes = generate_nodes(config, random.Random(config.seed))
+    return [
+        ((n["name"], n["type"]), n["duplicate_of"])
+        for n in nodes
+        if "duplicate_of" in n
+    ]
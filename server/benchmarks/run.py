@@ -0,0 +1,445 @@
+"""
+run.py
+
+Runs the service layer against a synthetic graph and writes timings as JSON.
+
+Usage (from the `server` directory):
+
+    python -m benchmarks.run --nodes 5000 --triples 20000 --output bench.json
+    python -m benchmarks.run --backend memory  # requires `mongomock-motor`
+
+Graph and subgraph reads are also timed with `plain=True` (see
+`services.serialization`), and the serialization of their results is timed for both
+the standard path (re-validation against the response model, `jsonable_encoder` and
+`json`) and the orjson path; `serialization_share.*` entries report which fraction
+of each read's latency is spent serializing.
+
+The "mongo" backend uses `MONGO_URI` with a throwaway database which is dropped after
+the run. The "memory" backend uses mongomock, which does not implement every
+aggregation operator; operations it cannot run are reported with status "error".
+"""
+import asyncio
+import json
+import platform
+import random
+import statistics
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import typer
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from loguru import logger
+from pydantic import BaseModel
+
+from settings import settings
+from logging_utils import set_logger
+from models import graph as graph_model
+from models.misc import ReviewBody
+import services.create_graph as create_graph_services
+import services.deletion as deletion_services
+import services.graph as graph_services
+import services.item as item_services
+import services.plugins as plugin_services
+from services.analytics import load_analytics
+from services.serialization import dumps
+from benchmarks.generator import GeneratorConfig, generate_graph, near_duplicate_pairs
+
+app = typer.Typer()
+
+
+def get_benchmark_db(backend: str, database: str):
+    """Returns a database handle for the requested backend."""
+    if backend == "memory":
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise typer.BadParameter(
+                'The "memory" backend requires `pip install mongomock-motor`'
+            )
+        return AsyncMongoMockClient()[database]
+
+    import motor.motor_asyncio
+
+    client = motor.motor_asyncio.AsyncIOMotorClient(settings.MONGO_URI)
+    return client[database]
+
+
+async def measure(
+    name: str,
+    fn: Callable[[int], Awaitable[Any]],
+    repeat: int,
+) -> Dict[str, Any]:
+    """Times `fn(i)` for i in range(repeat). A `None` result counts as a failure as
+    services log and swallow their own exceptions."""
+    durations = []
+    error = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        try:
+            result = await fn(i)
+        except Exception as e:
+            result, error = None, repr(e)
+        duration = time.perf_counter() - start
+        if result is None:
+            error = error or "operation returned no result"
+            break
+        durations.append(duration)
+
+    if error is not None:
+        logger.warning("Benchmark {} failed: {}", name, error)
+        return {"name": name, "status": "error", "error": error, "runs": len(durations)}
+
+    durations.sort()
+    return {
+        "name": name,
+        "status": "ok",
+        "runs": len(durations),
+        "mean_s": statistics.fmean(durations),
+        "median_s": statistics.median(durations),
+        "p95_s": durations[min(len(durations) - 1, int(0.95 * len(durations)))],
+        "min_s": durations[0],
+        "max_s": durations[-1],
+    }
+
+
+def standard_render(content: Any, response_model: Optional[type] = None) -> bytes:
+    """Serializes a service result as FastAPI does for routes returning models.
+
+    With a `response_model` the result is dumped and validated into it again first.
+    """
+    if response_model is not None and isinstance(content, BaseModel):
+        content = response_model.parse_obj(content.dict(by_alias=True))
+    return JSONResponse(content=jsonable_encoder(content)).body
+
+
+async def measure_serialization(
+    name: str,
+    build: Callable[[bool], Awaitable[Any]],
+    repeat: int,
+    response_model: Optional[type] = None,
+) -> List[Dict[str, Any]]:
+    """Times a read built as models and as plain dicts, and the serialization of each.
+
+    Adds the fraction of the total (build + serialize) latency spent serializing.
+    """
+    content = {}
+
+    async def timed_build(plain):
+        content[plain] = await build(plain)
+        return content[plain]
+
+    async def serialize(plain):
+        if plain:
+            return dumps(content[plain])
+        return standard_render(content[plain], response_model)
+
+    results = []
+    for plain, label in [(False, "standard"), (True, "fast")]:
+        results.append(
+            await measure(f"{name}.{label}", lambda i: timed_build(plain), repeat)
+        )
+        if plain in content:
+            results.append(
+                await measure(
+                    f"serialize.{name}.{label}", lambda i: serialize(plain), repeat
+                )
+            )
+
+    timings = {r["name"]: r.get("mean_s") for r in results if r["status"] == "ok"}
+    share = {}
+    for label in ["standard", "fast"]:
+        build_s = timings.get(f"{name}.{label}")
+        serialize_s = timings.get(f"serialize.{name}.{label}")
+        if build_s is not None and serialize_s is not None:
+            share[label] = serialize_s / (build_s + serialize_s)
+    results.append({"name": f"serialization_share.{name}", "status": "ok", **share})
+    return results
+
+
+async def run_benchmarks(
+    config: GeneratorConfig,
+    backend: str,
+    database: str,
+    repeat: int,
+    plugin_names: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Creates the synthetic graph and times each service operation against it.
+
+    All available plugins are benchmarked unless `plugin_names` restricts them.
+    """
+    db = get_benchmark_db(backend=backend, database=database)
+    rng = random.Random(config.seed)
+    results: List[Dict[str, Any]] = []
+
+    graph = generate_graph(config)
+    logger.info(
+        "Generated graph with {} triples ({} nodes requested)",
+        len(graph.triples),
+        config.nodes,
+    )
+
+    try:
+        graph_ids = []
+
+        async def create(i):
+            created = await create_graph_services.create_graph(graph=graph, db=db)
+            if created is not None:
+                graph_ids.append(ObjectId(created["id"]))
+            return created
+
+        results.append(await measure("create_graph", create, repeat=1))
+        if not graph_ids:
+            return {"results": results}
+        graph_id = graph_ids[0]
+
+        node_ids = [
+            n["_id"]
+            for n in await db["nodes"]
+            .find({"graph_id": graph_id}, {"_id": 1})
+            .to_list(None)
+        ]
+        hub = (
+            await db["triples"]
+            .aggregate(
+                [
+                    {"$match": {"graph_id": graph_id}},
+                    {"$group": {"_id": "$head", "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1}},
+                    {"$limit": 1},
+                ]
+            )
+            .to_list(None)
+        )
+        hub_id = str(hub[0]["_id"]) if hub else str(node_ids[0])
+
+        results.append(
+            await measure(
+                "read_graph",
+                lambda i: graph_services.read_graph(graph_id=graph_id, db=db),
+                repeat,
+            )
+        )
+        results.append(
+            await measure(
+                "get_subgraph.random",
+                lambda i: graph_services.get_subgraph(
+                    graph_id=graph_id, node_id=None, skip=0, limit=10, db=db
+                ),
+                repeat,
+            )
+        )
+        results.append(
+            await measure(
+                "get_subgraph.hub",
+                lambda i: graph_services.get_subgraph(
+                    graph_id=graph_id, node_id=hub_id, skip=0, limit=10, db=db
+                ),
+                repeat,
+            )
+        )
+        results.extend(
+            await measure_serialization(
+                "read_graph",
+                lambda plain: graph_services.read_graph(
+                    graph_id=graph_id, db=db, plain=plain
+                ),
+                repeat,
+                response_model=graph_model.Graph,
+            )
+        )
+        results.extend(
+            await measure_serialization(
+                "get_subgraph.hub_page",
+                lambda plain: graph_services.get_subgraph(
+                    graph_id=graph_id,
+                    node_id=hub_id,
+                    skip=0,
+                    limit=settings.SUBGRAPH_MAX_EDGES,
+                    plain=plain,
+                    db=db,
+                ),
+                repeat,
+            )
+        )
+        results.append(
+            await measure(
+                "toggle_review",
+                lambda i: item_services.toggle_review(
+                    item_id=rng.choice(node_ids),
+                    is_node=True,
+                    data=ReviewBody(),
+                    db=db,
+                ),
+                repeat,
+            )
+        )
+        results.append(
+            await measure(
+                "graph_analytics",
+                lambda i: load_analytics(graph_id=graph_id, db=db),
+                repeat,
+            )
+        )
+        results.append(
+            await measure(
+                "download",
+                lambda i: graph_services.download(graph_id=graph_id, db=db),
+                repeat,
+            )
+        )
+
+        plugins = plugin_services.get_available_plugins()
+        data = {}
+
+        async def graph_data(i):
+            data["value"] = await plugin_services.get_graph_data(
+                db=db, graph_id=graph_id
+            )
+            return data["value"]
+
+        results.append(await measure("plugins.get_graph_data", graph_data, repeat))
+        for kind, executor in [
+            ("edm", plugin_services.execute_edm),
+            ("cm", plugin_services.execute_cm),
+        ]:
+            for plugin_name, plugin in plugins[kind].items():
+                if "value" not in data or (
+                    plugin_names is not None and plugin_name not in plugin_names
+                ):
+                    continue
+                model_input, nodeName2Id, edgeName2Id = data["value"]
+
+                async def execute(i, executor=executor, plugin=plugin):
+                    await executor(
+                        db,
+                        plugin,
+                        model_input,
+                        nodeName2Id,
+                        edgeName2Id,
+                        graph_id=graph_id,
+                    )
+                    return True
+
+                results.append(
+                    await measure(f"plugin.{kind}.{plugin_name}", execute, repeat=1)
+                )
+
+        # Merges are destructive, so each run merges a different planted duplicate
+        nodeId2Details, _ = await graph_services.get_item_classes(
+            graph_id=graph_id, db=db
+        )
+        nodeName2Id = {c["name"]: _id for _id, c in nodeId2Details.items()}
+        merge_targets = []
+        for (name, type_), (target_name, _) in near_duplicate_pairs(config):
+            type_id = nodeName2Id.get(type_)
+            source = await db["nodes"].find_one(
+                {"graph_id": graph_id, "name": name, "type": type_id}
+            )
+            target = await db["nodes"].find_one(
+                {"graph_id": graph_id, "name": target_name, "type": type_id}
+            )
+            if source and target:
+                merge_targets.append((source["_id"], target_name, type_id))
+            if len(merge_targets) >= repeat:
+                break
+
+        if merge_targets:
+            results.append(
+                await measure(
+                    "merge_nodes",
+                    lambda i: item_services.merge_nodes(
+                        node_id=merge_targets[i][0],
+                        new_source_name=merge_targets[i][1],
+                        new_source_type=str(merge_targets[i][2]),
+                        db=db,
+                    ),
+                    len(merge_targets),
+                )
+            )
+
+        results.append(
+            await measure(
+                "delete_graph",
+                lambda i: graph_services.delete_graph(graph_id=graph_id, db=db),
+                repeat=1,
+            )
+        )
+
+        # delete_graph only marks the graph; its documents are removed in the background
+        async def delete_documents(i):
+            await deletion_services.delete_graph_documents(graph_id=graph_id, db=db)
+            return True
+
+        results.append(
+            await measure("delete_graph_documents", delete_documents, repeat=1)
+        )
+    finally:
+        if backend == "mongo":
+            await db.client.drop_database(database)
+
+    return {"results": results}
+
+
+@app.command()
+def run(
+    nodes: int = 1000,
+    triples: int = 3000,
+    node_types: int = 10,
+    edge_types: int = 20,
+    degree_distribution: str = "powerlaw",
+    property_density: float = 0.3,
+    near_duplicate_fraction: float = 0.05,
+    seed: int = 42,
+    repeat: int = 5,
+    backend: str = typer.Option("mongo", help='"mongo" or "memory"'),
+    database: str = "cleangraph_benchmark",
+    plugin: Optional[List[str]] = typer.Option(
+        None, help="Only benchmark these plugins (repeatable). Defaults to all."
+    ),
+    output: Optional[str] = typer.Option(None, help="Write JSON results to this file"),
+):
+    """Generates a synthetic graph, benchmarks the service layer and emits JSON."""
+    set_logger()
+    config = GeneratorConfig(
+        nodes=nodes,
+        triples=triples,
+        node_types=node_types,
+        edge_types=edge_types,
+        degree_distribution=degree_distribution,
+        property_density=property_density,
+        near_duplicate_fraction=near_duplicate_fraction,
+        seed=seed,
+    )
+
+    report = asyncio.run(
+        run_benchmarks(
+            config=config,
+            backend=backend,
+            database=database,
+            repeat=repeat,
+            plugin_names=plugin or None,
+        )
+    )
+    report["meta"] = {
+        "config": config.dict(),
+        "plugins": plugin or "all",
+        "backend": backend,
+        "repeat": repeat,
+        "python": platform.python_version(),
+        "created_at": datetime.utcnow().isoformat(),
+    }
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+        typer.echo(f"Results written to {output}")
+    else:
+        typer.echo(text)
+
+
+if __name__ == "__main__":
+    app()
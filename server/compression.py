@@ -0,0 +1,185 @@
+"""
+compression.py
+
+Negotiated compression of response bodies.
+
+Responses are compressed with Brotli (if the optional `brotli` package is
+installed) or gzip, whichever the client's `Accept-Encoding` prefers. Bodies
+smaller than `COMPRESSION_MIN_BYTES` and responses that already carry a
+`Content-Encoding` are sent as they are. Streamed responses are compressed chunk
+by chunk without being buffered, except server-sent events, which are never
+compressed so each event reaches the client immediately. Strong ETags of
+compressed responses are sent as weak ETags as the bytes differ per encoding.
+"""
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from settings import settings
+
+try:
+    import brotli
+except ImportError:  # Optional: `pip install brotli`
+    brotli = None
+
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "text/",
+)
+UNCOMPRESSIBLE_TYPES = ("text/event-stream",)
+
+
+def supported_encodings():
+    """Supported encodings in order of preference."""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Picks the preferred supported encoding acceptable to the client (if any)."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+
+    best, best_q = None, 0.0
+    for coding in supported_encodings():
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    content_type = content_type.lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith(
+        UNCOMPRESSIBLE_TYPES
+    )
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing response bodies with the negotiated encoding."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(self, send, encoding)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, send: Send, encoding: str):
+        self.middleware = middleware
+        self._send = send
+        self.encoding = encoding
+        self.start: Optional[Message] = None
+        self.compressor = None
+        self.passthrough = False
+
+    def _compressor(self):
+        if self.encoding == "br":
+            return _Brotli(self.middleware.brotli_quality)
+        return _Gzip(self.middleware.gzip_level)
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # Held back until the first body chunk shows whether to compress
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is not None:
+            data = self.compressor.compress(body)
+            if not more_body:
+                data += self.compressor.flush()
+            await self._send(
+                {"type": "http.response.body", "body": data, "more_body": more_body}
+            )
+            return
+
+        headers = MutableHeaders(raw=self.start["headers"])
+        if (
+            "content-encoding" in headers
+            or not is_compressible(headers.get("content-type", ""))
+            or (not more_body and len(body) < self.middleware.minimum_size)
+        ):
+            self.passthrough = True
+            await self._send(self.start)
+            await self._send(message)
+            return
+
+        self.compressor = self._compressor()
+        data = self.compressor.compress(body)
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag is not None and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+        if more_body:
+            del headers["Content-Length"]
+        else:
+            data += self.compressor.flush()
+            headers["Content-Length"] = str(len(data))
+        await self._send(self.start)
+        await self._send(
+            {"type": "http.response.body", "body": data, "more_body": more_body}
+        )
@@ -11,6 +11,7 @@ import motor.motor_asyncio
 from motor.core import AgnosticDatabase
 
 from settings import settings
+from services import deletion, indexes, issue_store, transactions
 
 app = typer.Typer()
 
@@ -48,6 +49,104 @@ async def drop_all_collections_async() -> NoReturn:
         typer.echo(f"An error occurred: {e}")
 
 
+@app.command()
+def create_indexes() -> NoReturn:
+    """Creates the indexes used by the server."""
+    asyncio.run(create_indexes_async())
+
+
+async def create_indexes_async() -> NoReturn:
+    """Asynchronous task to create the indexes of every collection."""
+    db = get_db()
+    try:
+        await indexes.ensure_indexes(db)
+        typer.echo("Indexes created successfully!")
+    except Exception as e:
+        typer.echo(f"An error occurred: {e}")
+
+
+@app.command()
+def recover_journals(
+    older_than: float = typer.Option(
+        300, help="Only recover journals older than this many seconds"
+    )
+) -> NoReturn:
+    """Rolls back/forward merges and deletions interrupted by a crashed server."""
+    asyncio.run(recover_journals_async(older_than))
+
+
+async def recover_journals_async(older_than: float) -> NoReturn:
+    """Asynchronous task to recover interrupted journaled mutations.
+
+    Only needed on standalone servers; replica sets use transactions instead.
+    """
+    db = get_db()
+    try:
+        recovered = await transactions.recover_journals(
+            db, older_than_seconds=older_than
+        )
+        typer.echo(f"Recovered {recovered} interrupted operation(s)")
+    except Exception as e:
+        typer.echo(f"An error occurred: {e}")
+
+
+@app.command()
+def collect_garbage(
+    older_than: float = typer.Option(
+        300, help="Only resume graph deletions idle for this many seconds"
+    )
+) -> NoReturn:
+    """Finishes interrupted graph deletions and removes orphaned nodes, edges and triples."""
+    asyncio.run(collect_garbage_async(older_than))
+
+
+async def collect_garbage_async(older_than: float) -> NoReturn:
+    """Asynchronous task to garbage-collect documents of deleted graphs."""
+    db = get_db()
+    try:
+        collected = await deletion.collect_garbage(db, older_than_seconds=older_than)
+        typer.echo(
+            f"Resumed {collected.pop('resumed_deletions')} graph deletion(s); "
+            + ", ".join(f"removed {n} orphaned {c}" for c, n in collected.items())
+        )
+    except Exception as e:
+        typer.echo(f"An error occurred: {e}")
+
+
+@app.command()
+def migrate_issues(
+    to: str = typer.Option(
+        ..., help='Storage to move issues to: "collection" or "embedded"'
+    ),
+    batch_size: int = typer.Option(1000, help="Number of items migrated at once"),
+) -> NoReturn:
+    """Moves errors and suggestions between item arrays and the issues collection.
+
+    Set `ISSUE_STORAGE` to the same value once the migration has finished.
+    """
+    if to not in ("collection", "embedded"):
+        raise typer.BadParameter(
+            'Must be "collection" or "embedded"', param_hint="--to"
+        )
+    asyncio.run(migrate_issues_async(to == "collection", batch_size))
+
+
+async def migrate_issues_async(to_collection: bool, batch_size: int) -> NoReturn:
+    """Asynchronous task to migrate the storage of errors and suggestions."""
+    db = get_db()
+    try:
+        if to_collection:
+            await indexes.ensure_indexes(db)
+        migrated = await issue_store.migrate_issues(
+            db, to_collection=to_collection, batch_size=batch_size
+        )
+        typer.echo(
+            ", ".join(f"Migrated issues of {n} {c}" for c, n in migrated.items())
+        )
+    except Exception as e:
+        typer.echo(f"An error occurred: {e}")
+
+
 if __name__ == "__main__":
     """Entry point of the script. When run directly, this script will initiate the Typer CLI."""
     app()
@@ -2,6 +2,7 @@ from fastapi import HTTPException, status
 import motor.motor_asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 from settings import settings
+from metrics import command_listener
 
 
 async def get_db() -> AsyncIOMotorClient:
@@ -15,7 +16,10 @@ async def get_db() -> AsyncIOMotorClient:
     """
 
     # Create a database client
-    client = motor.motor_asyncio.AsyncIOMotorClient(settings.MONGO_URI)
+    client = motor.motor_asyncio.AsyncIOMotorClient(
+        settings.MONGO_URI,
+        event_listeners=[command_listener] if settings.METRICS_ENABLED else [],
+    )
 
     # Get the database from the client
     db = client[settings.MONGO_DB_NAME]
@@ -32,3 +36,29 @@ async def get_db() -> AsyncIOMotorClient:
     finally:
         # Close the database client
         client.close()
+
+
+_shared_client = None
+
+
+def get_shared_db():
+    """Returns a database on a client shared by the whole process.
+
+    For long-lived requests such as event streams, which would otherwise keep a
+    client (and its connection pool) open per connection.
+    """
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = motor.motor_asyncio.AsyncIOMotorClient(
+            settings.MONGO_URI,
+            event_listeners=[command_listener] if settings.METRICS_ENABLED else [],
+        )
+    return _shared_client[settings.MONGO_DB_NAME]
+
+
+def close_shared_db():
+    """Closes the client of `get_shared_db` (a later call opens a new one)."""
+    global _shared_client
+    if _shared_client is not None:
+        _shared_client.close()
+        _shared_client = None
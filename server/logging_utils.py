@@ -0,0 +1,133 @@
+"""
+logging_utils.py
+
+Logger configuration and helpers that keep logging cheap on hot paths.
+
+Hot paths (graph creation, subgraph sampling, plugin execution) should never format
+whole collections into log messages. Use `summarise` for size-capped descriptions of
+large objects, `Sampler` for per-item messages inside loops and loguru's brace
+formatting (`logger.debug("x={}", x)`) so messages are only formatted when a sink
+accepts the level.
+"""
+import random
+import sys
+from typing import Any, Optional
+
+from loguru import logger
+
+from settings import settings
+
+
+def set_logger() -> None:
+    """Configures the loguru sinks from settings.
+
+    Console output is always enabled. File sinks are optional and can be written as
+    JSON lines (`LOG_SERIALIZE`) so they can be ingested as structured logs.
+    """
+    logger.remove()
+    logger.add(
+        sys.stdout,
+        colorize=True,
+        format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level}</level> | <level>{message}</level>",
+        level=settings.LOG_LEVEL,
+        enqueue=True,
+    )
+
+    if not settings.LOG_TO_FILES:
+        return
+
+    file_sinks = [
+        ("logfiles/info.log", settings.LOG_LEVEL),
+        ("logfiles/error.log", "ERROR"),
+    ]
+    for path, level in file_sinks:
+        logger.add(
+            path,
+            rotation=settings.LOG_ROTATION,
+            retention=settings.LOG_RETENTION,
+            encoding="utf-8",
+            level=level,
+            serialize=settings.LOG_SERIALIZE,
+            enqueue=True,
+        )
+
+
+def summarise(obj: Any, max_items: Optional[int] = None) -> str:
+    """Returns a size-capped description of an object for logging.
+
+    Collections are described by their type and length with a small sample of their
+    items; everything else is truncated to `LOG_MAX_CHARS` characters.
+
+    Example:
+        >>> summarise(list(range(1000)), max_items=3)
+        'list(len=1000, sample=[0, 1, 2])'
+    """
+    max_items = settings.LOG_MAX_SUMMARY_ITEMS if max_items is None else max_items
+
+    if isinstance(obj, (list, tuple, set, frozenset, dict)):
+        items = obj.items() if isinstance(obj, dict) else obj
+        sample = []
+        for i, item in enumerate(items):
+            if i >= max_items:
+                break
+            sample.append(item)
+        text = f"{type(obj).__name__}(len={len(obj)}, sample={_truncate(repr(sample))})"
+        return text
+
+    return _truncate(repr(obj))
+
+
+def _truncate(text: str) -> str:
+    if len(text) > settings.LOG_MAX_CHARS:
+        return f"{text[:settings.LOG_MAX_CHARS]}...(+{len(text) - settings.LOG_MAX_CHARS} chars)"
+    return text
+
+
+class Sampler:
+    """Rate and count limited logging for per-item messages.
+
+    A sampler is created per operation (e.g. per request) and emits at most
+    `max_messages` messages, each with probability `rate`. Messages are formatted
+    lazily by loguru, so skipped messages cost a counter increment.
+
+    Example:
+        >>> sampler = Sampler()
+        >>> for triple in triples:
+        ...     sampler.debug("triple key: {}", triple)
+        >>> sampler.flush("triples")
+    """
+
+    def __init__(
+        self, rate: Optional[float] = None, max_messages: Optional[int] = None
+    ):
+        self.rate = settings.LOG_SAMPLE_RATE if rate is None else rate
+        self.max_messages = (
+            settings.LOG_SAMPLE_MAX_MESSAGES if max_messages is None else max_messages
+        )
+        self.emitted = 0
+        self.skipped = 0
+
+    def log(self, level: str, message: str, *args, **kwargs) -> None:
+        self._log(level, 2, message, *args, **kwargs)
+
+    def debug(self, message: str, *args, **kwargs) -> None:
+        self._log("DEBUG", 2, message, *args, **kwargs)
+
+    def info(self, message: str, *args, **kwargs) -> None:
+        self._log("INFO", 2, message, *args, **kwargs)
+
+    def _log(self, level: str, depth: int, message: str, *args, **kwargs) -> None:
+        if self.emitted >= self.max_messages or (
+            self.rate < 1 and random.random() >= self.rate
+        ):
+            self.skipped += 1
+            return
+        self.emitted += 1
+        logger.opt(depth=depth).log(level, message, *args, **kwargs)
+
+    def flush(self, name: str = "messages") -> None:
+        """Logs how many messages were dropped by the sampler (if any)."""
+        if self.skipped:
+            logger.debug(
+                "Sampled {}: {} logged, {} skipped", name, self.emitted, self.skipped
+            )
@@ -2,49 +2,94 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from loguru import logger
 from starlette.middleware.base import BaseHTTPMiddleware
-import sys
+import asyncio
+import time
 
-from routers import plugin, graph, errors, suggestions, crawler 
+import motor.motor_asyncio
+
+from compression import CompressionMiddleware
+from logging_utils import set_logger
+from settings import settings
+import metrics
+
+from routers import (
+    plugin,
+    graph,
+    errors,
+    suggestions,
+    crawler,
+    metrics as metrics_router,
+)
+from dependencies import close_shared_db, get_shared_db
+from services.events import change_broker
+from services.indexes import ensure_indexes
+from services.versions import CHANGES_COLLECTION
 
 
 class LoguruMiddleware(BaseHTTPMiddleware):
+    """Emits a single structured summary line per request."""
+
     async def dispatch(self, request: Request, call_next):
-        logger.info(f"Request: {request.method} {request.url.path}")
+        if not settings.LOG_REQUESTS:
+            return await call_next(request)
+
+        start = time.perf_counter()
         response = await call_next(request)
-        logger.info(f"Response: {response.status_code}")
+        duration_ms = round((time.perf_counter() - start) * 1000, 2)
+
+        logger.bind(
+            method=request.method,
+            path=request.url.path,
+            status=response.status_code,
+            duration_ms=duration_ms,
+        ).info(
+            "{} {} {} {}ms",
+            request.method,
+            request.url.path,
+            response.status_code,
+            duration_ms,
+        )
         return response
 
 
-def set_logger():
-    logger.remove()
-    logger.add(
-        sys.stdout,
-        colorize=True,
-        format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level}</level> | <level>{message}</level>",
-        level="INFO",
-        enqueue=True,
-    )
-    logger.add(
-        "logfiles/info.log",
-        rotation="500 MB",
-        encoding="utf-8",
-        level="INFO",
-        enqueue=True,
-    )
-    logger.add(
-        "logfiles/debug.log",
-        rotation="500 MB",
-        encoding="utf-8",
-        level="DEBUG",
-        enqueue=True,
-    )
-    logger.add(
-        "logfiles/error.log",
-        rotation="500 MB",
-        encoding="utf-8",
-        level="ERROR",
-        enqueue=True,
-    )
+class MetricsMiddleware(BaseHTTPMiddleware):
+    """Records per-route latency and payload sizes and optionally adds Server-Timing."""
+
+    async def dispatch(self, request: Request, call_next):
+        if not settings.METRICS_ENABLED:
+            return await call_next(request)
+
+        timings = metrics.start_server_timing()
+        start = time.perf_counter()
+        response = await call_next(request)
+        duration = time.perf_counter() - start
+
+        # Use the route template (e.g. /graph/{graph_id}) to keep label cardinality bounded
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", "unmatched")
+
+        metrics.REQUEST_DURATION.observe(
+            duration,
+            method=request.method,
+            route=route_path,
+            status=response.status_code,
+        )
+        request_size = request.headers.get("content-length")
+        if request_size is not None:
+            metrics.REQUEST_SIZE.observe(
+                int(request_size), method=request.method, route=route_path
+            )
+        response_size = response.headers.get("content-length")
+        if response_size is not None:
+            metrics.RESPONSE_SIZE.observe(
+                int(response_size), method=request.method, route=route_path
+            )
+
+        if settings.METRICS_SERVER_TIMING:
+            response.headers["Server-Timing"] = metrics.format_server_timing(
+                [*timings, ("total", duration)]
+            )
+        return response
 
 
 set_logger()
@@ -54,7 +99,15 @@ origins = ["http://localhost:3000", "localhost:3000"]
 
 app = FastAPI(title="CleanGraph API", version="1.0.0", dependencies=[])
 
+# Innermost so the logged/measured sizes are those sent
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MIN_BYTES,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+)
 app.add_middleware(LoguruMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -69,6 +122,43 @@ app.include_router(errors.router)
 app.include_router(suggestions.router)
 app.include_router(plugin.router)
 app.include_router(crawler.router)
+app.include_router(metrics_router.router)
+
+
+async def create_indexes():
+    client = None
+    try:
+        client = motor.motor_asyncio.AsyncIOMotorClient(settings.MONGO_URI)
+        await ensure_indexes(client[settings.MONGO_DB_NAME])
+    except Exception as e:
+        logger.error(f"Failed to create indexes: {e}")
+    finally:
+        if client is not None:
+            client.close()
+
+
+@app.on_event("startup")
+async def startup():
+    if settings.CREATE_INDEXES_ON_STARTUP:
+        # Runs in the background so start-up does not wait on the database
+        asyncio.create_task(create_indexes())
+    if settings.CHANGE_EVENTS_SOURCE == "change_stream":
+        # Publishes the changes of every worker to this worker's event subscribers
+        app.state.change_stream = asyncio.create_task(
+            change_broker.watch(get_shared_db()[CHANGES_COLLECTION])
+        )
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    change_stream = getattr(app.state, "change_stream", None)
+    if change_stream is not None:
+        change_stream.cancel()
+        try:
+            await change_stream
+        except asyncio.CancelledError:
+            pass
+    close_shared_db()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,292 @@
+"""
+metrics.py
+
+In-process instrumentation exposed in the Prometheus text format via `/metrics`.
+
+Metrics are kept in plain Python structures guarded by a lock (the MongoDB command
+listener is called from motor's worker threads). Durations measured with `track`
+inside a request are also added to that request's `Server-Timing` header when
+`METRICS_SERVER_TIMING` is enabled.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from settings import settings
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+COUNT_BUCKETS = (0, 1, 10, 100, 1e3, 1e4, 1e5, 1e6)
+
+_lock = threading.Lock()
+_registry: List["Metric"] = []
+
+# Durations recorded during the current request as [(name, seconds)]
+_server_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar(
+    "server_timings", default=None
+)
+
+
+class Metric:
+    type_name = ""
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [
+            f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with _lock:
+            values = list(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{self._format_labels(key)} {value}")
+        return lines
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        # {label key: [bucket counts..., +Inf count, sum]}
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with _lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with _lock:
+            values = [(key, list(series)) for key, series in self._values.items()]
+        for key, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{bound:g}"'
+                lines.append(
+                    f"{self.name}_bucket{self._format_labels(key, le)} {cumulative}"
+                )
+            cumulative += series[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(
+                f"{self.name}_bucket{self._format_labels(key, le)} {cumulative}"
+            )
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {series[-1]}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_DURATION = Histogram(
+    "cleangraph_request_duration_seconds",
+    "HTTP request latency by route",
+    labels=("method", "route", "status"),
+)
+RESPONSE_SIZE = Histogram(
+    "cleangraph_response_size_bytes",
+    "HTTP response payload size by route",
+    labels=("method", "route"),
+    buckets=SIZE_BUCKETS,
+)
+REQUEST_SIZE = Histogram(
+    "cleangraph_request_size_bytes",
+    "HTTP request payload size by route",
+    labels=("method", "route"),
+    buckets=SIZE_BUCKETS,
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "cleangraph_mongo_command_duration_seconds",
+    "MongoDB command latency by command and collection",
+    labels=("command", "collection"),
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "cleangraph_mongo_command_failures_total",
+    "Failed MongoDB commands by command and collection",
+    labels=("command", "collection"),
+)
+MONGO_DOCUMENTS_RETURNED = Histogram(
+    "cleangraph_mongo_documents_returned",
+    "Documents returned per MongoDB cursor batch (find/aggregate/getMore)",
+    labels=("command", "collection"),
+    buckets=COUNT_BUCKETS,
+)
+PLUGIN_DURATION = Histogram(
+    "cleangraph_plugin_duration_seconds",
+    "Plugin execution time by plugin",
+    labels=("kind", "plugin"),
+    buckets=DEFAULT_BUCKETS + (60, 120, 300),
+)
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "cleangraph_response_cache_total",
+    "Cached read responses by route and result (hit, miss, not_modified)",
+    labels=("route", "result"),
+)
+OPERATION_DURATION = Histogram(
+    "cleangraph_operation_duration_seconds",
+    "Duration of instrumented service operations",
+    labels=("operation",),
+)
+
+
+@contextmanager
+def track(name: str, histogram: Histogram = OPERATION_DURATION, **labels):
+    """Times a block, records it on `histogram` and adds it to the request's Server-Timing.
+
+    Example:
+        >>> with track("neighbours", operation="read_graph.neighbours"):
+        ...     neighbours = await db["triples"].aggregate(pipeline).to_list(None)
+    """
+    if not settings.METRICS_ENABLED:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        histogram.observe(duration, **labels)
+        add_server_timing(name, duration)
+
+
+def add_server_timing(name: str, duration: float) -> None:
+    """Adds a duration (seconds) to the current request's Server-Timing entries."""
+    timings = _server_timings.get()
+    if timings is not None:
+        timings.append((name, duration))
+
+
+def start_server_timing() -> List[Tuple[str, float]]:
+    """Starts collecting Server-Timing entries for the current request context."""
+    timings = []
+    _server_timings.set(timings)
+    return timings
+
+
+def format_server_timing(timings: List[Tuple[str, float]]) -> str:
+    """Formats entries as a Server-Timing header value (durations in milliseconds)."""
+    return ", ".join(
+        f"{_timing_token(name)};dur={duration * 1000:.2f}" for name, duration in timings
+    )
+
+
+def _timing_token(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+
+
+def render_prometheus() -> str:
+    """Renders all registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Records MongoDB command durations and returned batch sizes.
+
+    Motor executes commands on worker threads, so these observations go to the global
+    histograms only and are not attributed to a request's Server-Timing header.
+    """
+
+    # Commands whose first argument is the target collection
+    _collection_commands = {
+        "find",
+        "aggregate",
+        "count",
+        "distinct",
+        "insert",
+        "update",
+        "delete",
+        "findAndModify",
+        "createIndexes",
+    }
+
+    def __init__(self):
+        self._collections: Dict[int, str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        command = event.command
+        if event.command_name in self._collection_commands:
+            collection = command.get(event.command_name)
+        else:
+            collection = command.get("collection")
+        self._collections[event.request_id] = (
+            collection if isinstance(collection, str) else ""
+        )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        collection = self._collections.pop(event.request_id, "")
+        MONGO_COMMAND_DURATION.observe(
+            event.duration_micros / 1e6,
+            command=event.command_name,
+            collection=collection,
+        )
+        cursor = event.reply.get("cursor") if event.reply else None
+        if cursor:
+            batch = cursor.get("firstBatch", cursor.get("nextBatch", []))
+            MONGO_DOCUMENTS_RETURNED.observe(
+                len(batch), command=event.command_name, collection=collection
+            )
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        collection = self._collections.pop(event.request_id, "")
+        MONGO_COMMAND_FAILURES.inc(command=event.command_name, collection=collection)
+
+
+command_listener = MongoCommandListener()
@@ -123,6 +123,53 @@ class OutputSuggestion(Suggestion):
         json_encoders = {ObjectId: str}
 
 
+class OutputErrorPage(BaseModel):
+    items: List[OutputError]
+    next_cursor: Optional[str] = Field(
+        description="Token for the next page of errors (if any)"
+    )
+
+    class Config:
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+
+
+class OutputSuggestionPage(BaseModel):
+    items: List[OutputSuggestion]
+    next_cursor: Optional[str] = Field(
+        description="Token for the next page of suggestions (if any)"
+    )
+
+    class Config:
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+
+
+class SearchResult(BaseModel):
+    id: PyObjectId = Field(alias="_id")
+    name: str
+    type: Optional[PyObjectId]
+    type_name: Optional[str]
+    score: float
+
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+
+
+class SearchResultPage(BaseModel):
+    items: List[SearchResult]
+    total: int = Field(description="Number of nodes matching the query")
+    next_offset: Optional[int] = Field(
+        description="Offset of the next page of results (if any)"
+    )
+
+    class Config:
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+
+
 class Property(BaseModel):
     id: PyObjectId = Field(
         default_factory=PyObjectId,
@@ -326,6 +373,7 @@ class Graph(CreateGraph):
     start_edge_count: int
     reviewed_nodes: int
     reviewed_edges: int
+    version: int = Field(default=0, description="Incremented on every change")
 
     class Config:
         allow_population_by_field_name = True
@@ -377,12 +425,29 @@ class GraphData(BaseModel):
     neighbours: Optional[dict]
 
 
+class SubgraphTruncation(BaseModel):
+    nodes: bool = Field(default=False, description="Stopped at the node limit")
+    edges: bool = Field(default=False, description="Stopped at the edge limit")
+    fanout: bool = Field(
+        default=False,
+        description="At least one node had more triples than the fan-out cap",
+    )
+    hops_completed: int = Field(default=0, ge=0, description="Hops fully expanded")
+
+
 class GraphDataWithFocusNode(GraphData):
     central_node_id: str = Field(description="The UUID of the subgraphs central node")
     max_triples: int
     reviewed: Optional[float]
     skip: int
     limit: int
+    hops: int = 1
+    truncation: Optional[SubgraphTruncation] = Field(
+        description="Limits hit while expanding a multi-hop subgraph"
+    )
+    next_cursor: Optional[str] = Field(
+        description="Token for the next page of the focus node's triples (if any)"
+    )
 
     class Config:
         allow_population_by_field_name = True
@@ -78,3 +78,73 @@ class AddItemsBody(BaseModel):
     edge: str = Field(description="The type UUID of the edge")
     tail_name: str = Field(description="The name of the tail node")
     tail_type: str = Field(description="The type UUID of the tail node")
+
+
+class BulkItemFilter(BaseModel):
+    type: Optional[str] = Field(description="The type UUID of the items")
+    name_pattern: Optional[str] = Field(
+        description="Case-insensitive text matched anywhere in item names"
+    )
+    has_errors: Optional[bool] = Field(description="Items with unacknowledged errors")
+    has_suggestions: Optional[bool] = Field(
+        description="Items with unacknowledged suggestions"
+    )
+    is_reviewed: Optional[bool]
+    is_active: Optional[bool]
+
+
+class BulkSelection(BaseModel):
+    is_node: bool  # node or edge
+    item_ids: Optional[List[str]] = Field(description="UUIDs of the items")
+    filter: Optional[BulkItemFilter] = Field(
+        description="Selects all matching items of the graph instead of item_ids"
+    )
+
+    @root_validator(pre=True)
+    def check_selection(cls, values):
+        if (values.get("item_ids") is None) == (values.get("filter") is None):
+            raise ValueError("Exactly one of item_ids or filter must be provided")
+        return values
+
+
+class BulkReviewBody(BulkSelection):
+    is_reviewed: bool = True
+
+
+class BulkActivationBody(BulkSelection):
+    is_active: bool
+
+
+class BulkAcknowledgeItem(BaseModel):
+    item_id: str
+    error_or_suggestion_item_id: str  # UUID of error/suggestion id
+
+
+class BulkAcknowledgeBody(BaseModel):
+    is_node: bool  # node or edge
+    is_error: bool  # true error false suggestion
+    items: Optional[List[BulkAcknowledgeItem]] = Field(
+        description="Errors/suggestions to acknowledge"
+    )
+    filter: Optional[BulkItemFilter] = Field(
+        description="Acknowledges every error/suggestion on the matching items instead"
+    )
+
+    @root_validator(pre=True)
+    def check_selection(cls, values):
+        if (values.get("items") is None) == (values.get("filter") is None):
+            raise ValueError("Exactly one of items or filter must be provided")
+        return values
+
+
+class BulkMergeCluster(BaseModel):
+    node_ids: List[str] = Field(
+        min_items=2,
+        description="UUIDs of the duplicate nodes; the first is the merge target",
+    )
+    name: Optional[str] = Field(description="Name of the merged node (target's name)")
+    type: Optional[str] = Field(description="Type UUID of the merged node")
+
+
+class BulkMergeBody(BaseModel):
+    clusters: List[BulkMergeCluster]
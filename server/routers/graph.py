@@ -1,8 +1,19 @@
 from typing import List, Dict, Optional
-from fastapi import APIRouter, Depends, Query, Body, HTTPException
-from dependencies import get_db
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    Query,
+    Body,
+    HTTPException,
+    Request,
+)
+from fastapi.responses import StreamingResponse
+from dependencies import get_db, get_shared_db
+from settings import settings
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
+from loguru import logger
 
 import random
 
@@ -16,10 +27,28 @@ from models.misc import (
     ItemUpdate,
     ReviewBody,
     AddItemsBody,
+    BulkReviewBody,
+    BulkActivationBody,
+    BulkMergeBody,
+    BulkAcknowledgeBody,
 )
 import services.create_graph as create_graph_services
 import services.graph as graph_services
 import services.item as item_services
+import services.bulk as bulk_services
+import services.deletion as deletion_services
+import services.versions as versions_services
+from services.adjacency import adjacency_cache
+from services.analytics import analytics_cache
+from services.class_stats import get_class_stats
+from services.review_queue import review_queue
+from services.autocomplete import name_index
+from services.search import search_index
+from services.events import change_broker
+from services.response_cache import cached_response
+from services.serialization import compact_ids, iter_json, json_response
+from services.versions import bump_graph_version
+from services.degrees import adjust_active_degrees, triple_endpoints
 
 
 router = APIRouter(prefix="/graph", tags=["Graph"])
@@ -58,10 +87,190 @@ async def acknowledge(
     )
 
 
+@router.patch("/bulk/review/{graph_id}")
+async def bulk_review(
+    graph_id: str,
+    data: BulkReviewBody = Body(...),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Sets the review state of many items (by ids or filter) at once"""
+    return await bulk_services.bulk_review(
+        graph_id=ObjectId(graph_id), data=data, db=db
+    )
+
+
+@router.patch("/bulk/activation/{graph_id}")
+async def bulk_activation(
+    graph_id: str,
+    data: BulkActivationBody = Body(...),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Sets the activation state of many items (by ids or filter) and their neighbours"""
+    return await bulk_services.bulk_activation(
+        graph_id=ObjectId(graph_id), data=data, db=db
+    )
+
+
+@router.patch("/bulk/acknowledge/{graph_id}")
+async def bulk_acknowledge(
+    graph_id: str,
+    data: BulkAcknowledgeBody = Body(...),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Acknowledges many errors or suggestions at once"""
+    return await bulk_services.bulk_acknowledge(
+        graph_id=ObjectId(graph_id), data=data, db=db
+    )
+
+
+@router.patch("/bulk/merge/{graph_id}")
+async def bulk_merge(
+    graph_id: str,
+    data: BulkMergeBody = Body(...),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Merges many clusters of duplicate nodes at once"""
+    return await bulk_services.bulk_merge(graph_id=ObjectId(graph_id), data=data, db=db)
+
+
 @router.get("/{graph_id}", response_model=graph_model.Graph)
-async def read_graph(graph_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
-    """Fetches the details of a single graph"""
-    return await graph_services.read_graph(graph_id=ObjectId(graph_id), db=db)
+async def read_graph(
+    graph_id: str,
+    request: Request,
+    compact: bool = False,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Fetches the details of a single graph (revalidate with If-None-Match)
+
+    With `compact` the ids are sent as indexes into an `ids` lookup table and the
+    graph as `data` (see `services.serialization.compact_ids`).
+    """
+    graph_id = ObjectId(graph_id)
+
+    async def build():
+        graph = await graph_services.read_graph(
+            graph_id=graph_id, db=db, plain=settings.FAST_JSON_RESPONSES
+        )
+        return compact_ids(graph) if compact and graph is not None else graph
+
+    return await cached_response(
+        request, graph_id=graph_id, db=db, build=build, validate=not compact
+    )
+
+
+@router.get("/changes/{graph_id}")
+async def read_graph_changes(
+    graph_id: str,
+    since: int = Query(..., ge=0, description="The version the client has"),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Fetches the nodes, edges and triples changed since a version of the graph.
+
+    The version of a graph is returned by `/graph/{graph_id}`. If the response has
+    `reset` set, the changes are not available and the graph must be reloaded.
+    """
+    changes = await versions_services.get_changes(
+        graph_id=ObjectId(graph_id), since=since, db=db
+    )
+    if changes is None:
+        raise HTTPException(status_code=404, detail="Graph not found")
+    return json_response(changes, validate=False)
+
+
+@router.get("/events/{graph_id}")
+async def stream_graph_events(
+    graph_id: str,
+    request: Request,
+    since: Optional[int] = Query(None, ge=0),
+    db: AsyncIOMotorDatabase = Depends(get_shared_db),
+):
+    """Streams the graph's change events as server-sent events (see `services.events`).
+
+    Events after version `since` (or the `Last-Event-ID` of a reconnecting client) are
+    replayed from the change log first, up to `CHANGE_EVENTS_MAX_REPLAY` of them;
+    clients further behind are sent a `reset` event instead.
+    """
+    graph_id = ObjectId(graph_id)
+    last_event_id = request.headers.get("last-event-id")
+    if since is None and last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    if await versions_services.get_graph_version(graph_id=graph_id, db=db) is None:
+        raise HTTPException(status_code=404, detail="Graph not found")
+    subscriber = change_broker.subscribe(graph_id)
+    if subscriber is None:
+        raise HTTPException(status_code=503, detail="Too many event subscribers")
+    try:
+        replay = []
+        if since is not None:
+            replay = await versions_services.get_change_entries(
+                graph_id=graph_id,
+                since=since,
+                db=db,
+                limit=settings.CHANGE_EVENTS_MAX_REPLAY + 1,
+            )
+            if len(replay) > settings.CHANGE_EVENTS_MAX_REPLAY:
+                replay = None
+    except Exception:
+        change_broker.unsubscribe(subscriber)
+        raise
+
+    return StreamingResponse(
+        change_broker.stream(subscriber, replay),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/analytics/{graph_id}")
+async def read_graph_analytics(
+    graph_id: str,
+    request: Request,
+    active_only: bool = False,
+    top_k: int = Query(10, ge=0, le=settings.ANALYTICS_MAX_TOP_K),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Fetches degree statistics, hubs, isolated nodes, connected components,
+    PageRank and class counts of a graph (see `services.analytics`)
+
+    With `active_only` deactivated nodes and edges are left out. Computed once per
+    graph version; revalidate with If-None-Match.
+    """
+    graph_id = ObjectId(graph_id)
+
+    async def build():
+        analytics = await analytics_cache.get(
+            graph_id=graph_id, db=db, active_only=active_only, top_k=top_k
+        )
+        if analytics is None:
+            raise HTTPException(status_code=404, detail="Graph not found")
+        return analytics
+
+    return await cached_response(
+        request, graph_id=graph_id, db=db, build=build, validate=False
+    )
+
+
+@router.get("/stats/{graph_id}")
+async def read_graph_stats(
+    graph_id: str, request: Request, db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Fetches the number of nodes and edges of each class and how many of them are
+    active, reviewed or have open errors (see `services.class_stats`)
+
+    The counters are maintained as the graph changes, so this reads a single document.
+    """
+    graph_id = ObjectId(graph_id)
+
+    async def build():
+        stats = await get_class_stats(graph_id=graph_id, db=db)
+        if stats is None:
+            raise HTTPException(status_code=404, detail="Graph not found")
+        return stats
+
+    return await cached_response(
+        request, graph_id=graph_id, db=db, build=build, validate=False
+    )
 
 
 @router.get(
@@ -69,22 +278,100 @@ async def read_graph(graph_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
 )  # , response_model=graph_model.GraphDataWithFocusNode)
 async def sample_graph_data(
     graph_id: str,
+    request: Request,
     node_id: Optional[str] = None,
     skip: int = 0,
     limit: int = 10,
+    hops: int = Query(1, ge=1),
+    max_nodes: Optional[int] = Query(None, ge=1),
+    max_edges: Optional[int] = Query(None, ge=1),
+    max_fanout: Optional[int] = Query(None, ge=1),
+    node_types: Optional[List[str]] = Query(None),
+    cursor: Optional[str] = None,
     db: AsyncIOMotorDatabase = Depends(get_db),
 ):
-    """Samples subgraph (randomly if node_id not provided)."""
-    return await graph_services.get_subgraph(
-        graph_id=ObjectId(graph_id), node_id=node_id, skip=skip, limit=limit, db=db
+    """Samples subgraph (randomly if node_id not provided).
+
+    Pass the `next_cursor` of a response as `cursor` to fetch the node's next page of
+    triples. With hops > 1 the bounded multi-hop neighbourhood of the node is returned,
+    optionally restricted to neighbours of the given node type ids. Subgraphs of a given
+    node_id can be revalidated with If-None-Match.
+    """
+    if cursor is not None:
+        try:
+            graph_services.decode_subgraph_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    graph_id = ObjectId(graph_id)
+
+    async def build():
+        return await graph_services.get_subgraph(
+            graph_id=graph_id,
+            node_id=node_id,
+            skip=skip,
+            limit=limit,
+            hops=hops,
+            max_nodes=max_nodes,
+            max_edges=max_edges,
+            max_fanout=max_fanout,
+            node_types=node_types,
+            cursor=cursor,
+            plain=settings.FAST_JSON_RESPONSES,
+            db=db,
+        )
+
+    if node_id is None:
+        # Random samples differ on every request
+        return json_response(await build())
+    return await cached_response(request, graph_id=graph_id, db=db, build=build)
+
+
+@router.get("/next/{graph_id}")
+async def next_review_subgraph(
+    graph_id: str,
+    limit: int = 10,
+    exclude: Optional[List[str]] = Query(None),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Fetches the subgraph that should be reviewed next.
+
+    The focus node is the top of the graph's review priority queue (see `services.review_queue`), skipping the node ids in `exclude`. Falls back to a random subgraph once nothing needs review.
+    """
+    graph_id = ObjectId(graph_id)
+    top = await review_queue.next(
+        graph_id=graph_id, db=db, exclude=[ObjectId(_id) for _id in exclude or []]
     )
+    subgraph = await graph_services.get_subgraph(
+        graph_id=graph_id,
+        node_id=None if top is None else str(top[0]),
+        skip=0,
+        limit=limit,
+        plain=settings.FAST_JSON_RESPONSES,
+        db=db,
+    )
+    return json_response(subgraph)
 
 
 @router.get("/download/{graph_id}", response_model=graph_model.GraphDownload)
 async def download_graph(
-    graph_id: str, db: AsyncIOMotorDatabase = Depends(get_db)
+    graph_id: str, compact: bool = False, db: AsyncIOMotorDatabase = Depends(get_db)
 ) -> graph_model.GraphDownload:
-    return await graph_services.download(graph_id=ObjectId(graph_id), db=db)
+    """Downloads a graph as JSON, streamed in chunks of triples read from a cursor.
+
+    With `compact` the download is built in memory and the ids are sent as indexes
+    into an `ids` lookup table (see `services.serialization.compact_ids`).
+    """
+    if compact:
+        download = await graph_services.download(graph_id=ObjectId(graph_id), db=db)
+        return json_response(compact_ids(download), validate=False)
+    meta, data = await graph_services.stream_download(
+        graph_id=ObjectId(graph_id), db=db
+    )
+    return StreamingResponse(
+        iter_json({"meta": meta, "data": data}),
+        media_type="application/json",
+    )
 
 
 @router.delete("/property")
@@ -103,12 +390,33 @@ async def delete_property(
     )
 
 
+@router.get("/deletion/{graph_id}")
+async def read_graph_deletion(
+    graph_id: str, db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Fetches the progress of a graph deletion (404 once the graph is deleted)"""
+    deletion = await deletion_services.get_deletion_progress(
+        graph_id=ObjectId(graph_id), db=db
+    )
+    if deletion is None:
+        raise HTTPException(status_code=404, detail="Graph not found")
+    return deletion
+
+
 @router.delete("/{graph_id}")
 async def delete_graph(
-    graph_id: str, db: AsyncIOMotorDatabase = Depends(get_db)
-) -> str:
-    """Deletes a single graph"""
-    return await graph_services.delete_graph(graph_id=ObjectId(graph_id), db=db)
+    graph_id: str,
+    background_tasks: BackgroundTasks,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Deletes a single graph; its nodes, edges and triples are removed in the background"""
+    graph_id = ObjectId(graph_id)
+    deletion, start = await graph_services.delete_graph(graph_id=graph_id, db=db)
+    if start:
+        background_tasks.add_task(
+            deletion_services.delete_graph_documents, graph_id=graph_id, db=db
+        )
+    return deletion
 
 
 @router.patch("/{item_id}")
@@ -202,25 +510,24 @@ async def update_item_class(
 
 
 @router.get("/items/{graph_id}")
-async def get_graph_items(graph_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
-    """Gets unique graph items"""
+async def get_graph_items(
+    graph_id: str, compact: bool = False, db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Gets the node and edge classes of a graph (see `/autocomplete` for node names)
 
-    graph_id = ObjectId(graph_id)
+    With `compact` the ids are sent as indexes into an `ids` lookup table.
+    """
 
-    print("graph_id", graph_id)
+    graph_id = ObjectId(graph_id)
 
     graph_classes = await db["graphs"].find_one(
-        {"_id": graph_id}, {"node_classes": 1, "edge_classes": 1}
-    )
-
-    nodes_names = (
-        await db["nodes"].find({"graph_id": graph_id}, {"name": 1}).to_list(None)
+        {"_id": graph_id, **deletion_services.NOT_DELETED},
+        {"node_classes": 1, "edge_classes": 1},
     )
+    if graph_classes is None:
+        raise HTTPException(status_code=404, detail="Graph not found")
 
-    unique_node_names = set([n["name"] for n in nodes_names])
-
-    return {
-        "node_names": unique_node_names,
+    items = {
         "node_types": [
             {**nc, "_id": str(nc["_id"])} for nc in graph_classes["node_classes"]
         ],
@@ -228,6 +535,58 @@ async def get_graph_items(graph_id: str, db: AsyncIOMotorDatabase = Depends(get_
             {**ec, "_id": str(ec["_id"])} for ec in graph_classes["edge_classes"]
         ],
     }
+    return compact_ids(items) if compact else items
+
+
+@router.get("/autocomplete/{graph_id}")
+async def autocomplete_node_names(
+    graph_id: str,
+    q: str = Query("", description="Prefix of the node name (case-insensitive)"),
+    node_type: Optional[str] = Query(None, description="Only nodes of this class"),
+    limit: int = Query(10, ge=1, le=settings.AUTOCOMPLETE_MAX_RESULTS),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Gets the node names (and classes) of a graph starting with a prefix"""
+    matches = await name_index.complete(
+        graph_id=ObjectId(graph_id),
+        db=db,
+        prefix=q,
+        limit=limit,
+        node_type=ObjectId(node_type) if node_type else None,
+    )
+    return [{"name": name, "type": str(match_type)} for name, match_type in matches]
+
+
+@router.get("/search/{graph_id}", response_model=graph_model.SearchResultPage)
+async def search_nodes(
+    graph_id: str,
+    q: str = Query(..., description="Words to find in node names/property values"),
+    node_type: Optional[str] = Query(None, description="Only nodes of this class"),
+    limit: int = Query(20, ge=1, le=settings.SEARCH_MAX_RESULTS),
+    offset: int = Query(0, ge=0),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Searches the nodes of a graph by name and property values (typo tolerant)"""
+    graph_id = ObjectId(graph_id)
+    results, total = await search_index.search(
+        graph_id=graph_id,
+        db=db,
+        query=q,
+        limit=limit,
+        offset=offset,
+        node_type=ObjectId(node_type) if node_type else None,
+    )
+    nodeId2Details, _ = await graph_services.get_item_classes(graph_id=graph_id, db=db)
+    return graph_model.SearchResultPage(
+        items=[
+            graph_model.SearchResult(
+                **r, type_name=nodeId2Details.get(r["type"], {}).get("name")
+            )
+            for r in results
+        ],
+        total=total,
+        next_offset=offset + limit if offset + limit < total else None,
+    )
 
 
 @router.post("/item/{graph_id}")
@@ -260,7 +619,7 @@ async def add_graph_items(
         #     tail_type=str(random.choice(graph["node_classes"]).get("_id")),
         # )
 
-        print("data", data)
+        logger.debug("Adding graph items: {}", data)
 
         # Check if head / tail nodes exist in the db
         head_node = await db["nodes"].find_one(
@@ -271,8 +630,6 @@ async def add_graph_items(
             }
         )
 
-        print("head exists" if head_node else "head does not exist")
-
         tail_node = await db["nodes"].find_one(
             {
                 "graph_id": graph_id,
@@ -280,11 +637,9 @@ async def add_graph_items(
                 "type": ObjectId(data.tail_type),
             }
         )
-        print("tail exists" if tail_node else "tail does not exist")
 
         if head_node and tail_node:
             # head and tail exist - need to check whether the edge exists between them. If so, do nothing, else create triple.
-            print("Checking whether edge exists")
 
             # Get all triples with head/tail combination then check edge existence... checks both directions...
             triples = (
@@ -314,7 +669,7 @@ async def add_graph_items(
                 .to_list(None)
             )
 
-            print(f"Found {len(triples)} triples that match head/tail nodes")
+            logger.debug("Found {} triples that match head/tail nodes", len(triples))
 
             if len(triples) != 0:
                 return {"triple_exists": True}
@@ -322,12 +677,8 @@ async def add_graph_items(
             head_node_id = head_node["_id"]
             tail_node_id = tail_node["_id"]
 
-            print("headId", head_node_id, "tailId", tail_node_id)
-
         else:
             # Otherwise, just create a new triple in the graph
-            print("Creating new item")
-
             # TODO: get data model for create nodes to insert properly...
             if head_node is None:
                 # Create head node
@@ -337,11 +688,12 @@ async def add_graph_items(
                     value=1,
                     graph_id=graph_id,
                 )
-                print(f"Creating head node: {new_head_node}")
 
-                head_node = await db["nodes"].insert_one(new_head_node.dict())
+                head_node = await db["nodes"].insert_one(
+                    {**new_head_node.dict(), "active_degree": 0}
+                )
                 head_node_id = head_node.inserted_id
-                print(f"Created head node: {head_node_id}")
+                logger.debug("Created head node: {}", head_node_id)
             else:
                 # Head exists, get the id
                 head_node_id = head_node["_id"]
@@ -354,11 +706,12 @@ async def add_graph_items(
                     value=1,
                     graph_id=graph_id,
                 )
-                print(f"Creating tail node: {new_tail_node}")
 
-                tail_node = await db["nodes"].insert_one(new_tail_node.dict())
+                tail_node = await db["nodes"].insert_one(
+                    {**new_tail_node.dict(), "active_degree": 0}
+                )
                 tail_node_id = tail_node.inserted_id
-                print(f"Created tail node: {tail_node_id}")
+                logger.debug("Created tail node: {}", tail_node_id)
             else:
                 # Tail exists, get the id
                 tail_node_id = tail_node["_id"]
@@ -367,24 +720,38 @@ async def add_graph_items(
         new_edge = graph_model.CreateItem(
             type=ObjectId(data.edge), value=1, graph_id=graph_id
         )
-        print(f"Creating edge: {new_edge}")
         edge = await db["edges"].insert_one(new_edge.dict())
         edge_id = edge.inserted_id
-        print(f"Created edge: {edge_id}")
-
-        print("Creating triple")
         # Create triple...
         new_triple = graph_model.CreateTriple(
             head=head_node_id, edge=edge_id, tail=tail_node_id, graph_id=graph_id
         )
-        print(f"Creating triple: {new_triple}")
         triple = await db["triples"].insert_one(new_triple.dict())
         triple_id = triple.inserted_id
-        print(f"Created triple: {triple_id}")
-
-        output = {"head": head_node, "edge": edge, "tail": tail_node}
-
-        print("output", output)
+        adjacency_cache.add_triples(graph_id, [{**new_triple.dict(), "_id": triple_id}])
+        await adjust_active_degrees(db, triple_endpoints([new_triple.dict()]))
+        await review_queue.refresh(
+            graph_id=graph_id,
+            db=db,
+            node_ids=[head_node_id, tail_node_id],
+            edge_ids=[edge_id],
+        )
+        await name_index.refresh(
+            graph_id=graph_id, db=db, node_ids=[head_node_id, tail_node_id]
+        )
+        await search_index.refresh(
+            graph_id=graph_id, db=db, node_ids=[head_node_id, tail_node_id]
+        )
+        await bump_graph_version(
+            graph_id=graph_id,
+            db=db,
+            changes={
+                "nodes": [head_node_id, tail_node_id],
+                "edges": [edge_id],
+                "triples": [triple_id],
+            },
+        )
+        logger.debug("Created triple: {}", triple_id)
 
         return {
             "triple_exists": False,
@@ -393,4 +760,4 @@ async def add_graph_items(
         }
 
     except Exception as e:
-        print(f"Exception: {e}")
+        logger.error("Unable to add graph items: {}", e)
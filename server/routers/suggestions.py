@@ -5,6 +5,7 @@ from dependencies import get_db
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from pymongo.errors import PyMongoError
 from bson import ObjectId
+from loguru import logger
 import traceback
 import random
 from enum import Enum
@@ -13,54 +14,51 @@ import collections
 import string
 
 from models import graph as graph_model
-from services.graph import get_item_classes
+import services.issues as issue_services
 
 router = APIRouter(prefix="/suggestions", tags=["Suggestions"])
 
 
-@router.get("/{graph_id}")
-async def get_suggestions(graph_id: str, db: AssertionError = Depends(get_db)):
-    """Fetches all suggestions on the current graph
-
-    TODO
-    ----
-    - Add limit and page.
-    """
+@router.get("/{graph_id}", response_model=graph_model.OutputSuggestionPage)
+async def get_suggestions(
+    graph_id: str,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    suggestion_type: Optional[str] = Query(None),
+    acknowledged: Optional[bool] = Query(None),
+    is_node: Optional[bool] = Query(
+        None, description="Only suggestions on nodes (true) or edges (false)"
+    ),
+    item_type: Optional[str] = Query(None, description="The type UUID of the items"),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Fetches a page of the suggestions on the current graph (nodes and edges)"""
+    if cursor is not None and not ObjectId.is_valid(cursor):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
     try:
-        graph_id = ObjectId(graph_id)
-
-        nodeId2Details, edgeId2Details = await get_item_classes(
-            graph_id=graph_id, db=db
+        suggestions, next_id = await issue_services.list_issues(
+            graph_id=ObjectId(graph_id),
+            is_error=False,
+            db=db,
+            limit=limit,
+            after=None if cursor is None else ObjectId(cursor),
+            issue_type=suggestion_type,
+            acknowledged=acknowledged,
+            is_node=is_node,
+            item_type=None if item_type is None else ObjectId(item_type),
         )
-
-        nodes_with_suggestions = (
-            await db["nodes"]
-            .find(
-                {
-                    "graph_id": graph_id,
-                    "suggestions": {"$exists": True, "$not": {"$size": 0}},
-                },
-                {"suggestions": 1, "name": 1, "type": 1, "_id": 1},
-            )
-            .to_list(None)
+        return graph_model.OutputSuggestionPage(
+            items=[
+                graph_model.OutputSuggestion(**suggestion) for suggestion in suggestions
+            ],
+            next_cursor=None if next_id is None else str(next_id),
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to fetch suggestions: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to fetch suggestions",
         )
-
-        node_suggestions = []
-        for node in nodes_with_suggestions:
-            _errors = [
-                graph_model.OutputSuggestion(
-                    # item_id=node["_id"],
-                    is_node=True,
-                    item_name=node["name"],
-                    item_type=nodeId2Details[node["type"]]["name"],
-                    **s,
-                )
-                for s in node["suggestions"]
-            ]
-
-            node_suggestions.extend(_errors)
-
-        return node_suggestions
-    except:
-        traceback.print_exc()
@@ -0,0 +1,74 @@
+import unittest
+from bson import ObjectId
+
+import sys
+
+sys.path.append("..")  # Adds the parent directory to the list of paths
+
+
+from services.adjacency import GraphAdjacency
+
+
+def make_triple(head, tail):
+    return {"_id": ObjectId(), "head": head, "edge": ObjectId(), "tail": tail}
+
+
+class TestGraphAdjacency(unittest.TestCase):
+    def setUp(self):
+        self.a, self.b, self.c, self.d = (ObjectId() for _ in range(4))
+        self.triples = [
+            make_triple(self.a, self.b),
+            make_triple(self.a, self.c),
+            make_triple(self.c, self.a),
+            make_triple(self.b, self.b),  # self-referencing
+        ]
+        self.adjacency = GraphAdjacency(self.triples)
+
+    def test_neighbours_in_both_directions(self):
+        nodes, edges = self.adjacency.neighbours(self.a)
+
+        self.assertEqual(nodes, {self.b, self.c})
+        self.assertEqual(edges, {t["edge"] for t in self.triples[:3]})
+
+    def test_degree_counts_self_reference_once(self):
+        self.assertEqual(self.adjacency.degree(self.a), 3)
+        self.assertEqual(self.adjacency.degree(self.b), 2)
+        self.assertEqual(self.adjacency.degree(self.d), 0)
+
+    def test_add_and_remove_triples(self):
+        new_triple = make_triple(self.d, self.a)
+        self.adjacency.add_triples([new_triple])
+
+        self.assertEqual(self.adjacency.degree(self.a), 4)
+        self.assertEqual(self.adjacency.triple_for_edge(new_triple["edge"]), new_triple)
+
+        self.adjacency.remove_triples([self.triples[0]["_id"], new_triple["_id"]])
+
+        self.assertEqual(self.adjacency.degree(self.a), 2)
+        self.assertEqual(self.adjacency.degree(self.d), 0)
+        self.assertIsNone(self.adjacency.triple_for_edge(new_triple["edge"]))
+
+    def test_compaction_preserves_triples(self):
+        self.adjacency.remove_triples([self.triples[1]["_id"]])
+        self.adjacency.add_triples([make_triple(self.c, self.d)])
+        self.adjacency._compact()
+
+        self.assertEqual(self.adjacency.neighbours(self.c)[0], {self.a, self.d})
+        self.assertEqual(len(self.adjacency.triple_ids), 4)
+
+    def test_re_adding_triple_replaces_it(self):
+        reversed_triple = {
+            **self.triples[0],
+            "head": self.triples[0]["tail"],
+            "tail": self.triples[0]["head"],
+        }
+        self.adjacency.add_triples([reversed_triple])
+
+        self.assertEqual(self.adjacency.degree(self.a), 3)
+        self.assertEqual(
+            self.adjacency.triple_for_edge(reversed_triple["edge"]), reversed_triple
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+
+import networkx as nx
+from bson import ObjectId
+
+import sys
+
+sys.path.append("..")  # Adds the parent directory to the list of paths
+
+
+from services.analytics import compute_analytics
+
+
+PERSON, PLACE = ObjectId(), ObjectId()
+KNOWS, LIVES_IN = ObjectId(), ObjectId()
+NODE_CLASSES = [{"_id": PERSON, "name": "Person"}, {"_id": PLACE, "name": "Place"}]
+EDGE_CLASSES = [{"_id": KNOWS, "name": "knows"}, {"_id": LIVES_IN, "name": "lives in"}]
+
+
+def make_graph():
+    """Two components (a-b-c-paris, d-e) and an isolated node f."""
+    names = ["a", "b", "c", "d", "e", "f", "paris"]
+    nodes = {
+        name: {
+            "_id": ObjectId(),
+            "name": name,
+            "type": PLACE if name == "paris" else PERSON,
+            "is_active": True,
+            "is_reviewed": name in ("a", "paris"),
+        }
+        for name in names
+    }
+    links = [
+        ("a", KNOWS, "b"),
+        ("a", KNOWS, "c"),
+        ("b", KNOWS, "c"),
+        ("c", KNOWS, "a"),
+        ("a", LIVES_IN, "paris"),
+        ("b", LIVES_IN, "paris"),
+        ("c", LIVES_IN, "paris"),
+        ("d", KNOWS, "e"),
+    ]
+    edges, triples = [], []
+    for head, edge_type, tail in links:
+        edge = {"_id": ObjectId(), "type": edge_type, "is_active": True}
+        edges.append(edge)
+        triples.append(
+            {
+                "head": nodes[head]["_id"],
+                "edge": edge["_id"],
+                "tail": nodes[tail]["_id"],
+            }
+        )
+    return nodes, edges, triples, links
+
+
+class TestAnalytics(unittest.TestCase):
+    def setUp(self):
+        self.nodes, self.edges, self.triples, self.links = make_graph()
+        self.analytics = compute_analytics(
+            nodes=list(self.nodes.values()),
+            edges=self.edges,
+            triples=self.triples,
+            node_classes=NODE_CLASSES,
+            edge_classes=EDGE_CLASSES,
+            top_k=3,
+        )
+
+    def test_degrees(self):
+        degree = self.analytics["degree"]
+        self.assertEqual(degree["total"]["max"], 4)
+        self.assertEqual(degree["in"]["max"], 3)
+        self.assertEqual(
+            degree["total"]["histogram"][0], {"min": 0, "max": 0, "count": 1}
+        )
+        self.assertEqual(
+            sum(b["count"] for b in degree["total"]["histogram"]), len(self.nodes)
+        )
+        hubs = self.analytics["hubs"]
+        self.assertEqual({hub["name"] for hub in hubs[:2]}, {"a", "c"})
+        self.assertEqual(hubs[2]["degree"], 3)
+        self.assertEqual(self.analytics["isolated"]["count"], 1)
+        self.assertEqual(self.analytics["isolated"]["nodes"][0]["name"], "f")
+
+    def test_components(self):
+        components = self.analytics["components"]
+        self.assertEqual(components["count"], 3)
+        self.assertEqual(components["sizes"], [4, 2, 1])
+        self.assertEqual(components["singletons"], 1)
+
+    def test_pagerank_matches_networkx(self):
+        graph = nx.MultiDiGraph()
+        graph.add_nodes_from(self.nodes)
+        graph.add_edges_from((head, tail) for head, _, tail in self.links)
+        expected = nx.pagerank(graph)
+
+        pagerank = self.analytics["pagerank"]
+        self.assertTrue(pagerank["converged"])
+        self.assertEqual(pagerank["top"][0]["name"], "paris")
+        for node in pagerank["top"]:
+            self.assertAlmostEqual(node["score"], expected[node["name"]], places=4)
+
+    def test_class_counts(self):
+        node_classes = {c["name"]: c for c in self.analytics["node_classes"]}
+        self.assertEqual(node_classes["Person"]["count"], 6)
+        self.assertEqual(node_classes["Person"]["reviewed"], 1)
+        self.assertEqual(node_classes["Place"]["mean_degree"], 3.0)
+        edge_classes = {c["name"]: c["count"] for c in self.analytics["edge_classes"]}
+        self.assertEqual(edge_classes, {"knows": 5, "lives in": 3})
+
+    def test_unknown_items_and_empty_graph(self):
+        nodes = [n for name, n in self.nodes.items() if name != "paris"]
+        analytics = compute_analytics(
+            nodes=nodes,
+            edges=self.edges,
+            triples=self.triples,
+            node_classes=NODE_CLASSES,
+            edge_classes=EDGE_CLASSES,
+        )
+        self.assertEqual(analytics["triples"], 5)
+
+        empty = compute_analytics([], [], [], NODE_CLASSES, EDGE_CLASSES)
+        self.assertEqual(empty["components"]["count"], 0)
+        self.assertEqual(empty["hubs"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
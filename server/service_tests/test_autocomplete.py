@@ -0,0 +1,51 @@
+import unittest
+from bson import ObjectId
+
+import sys
+
+sys.path.append("..")  # Adds the parent directory to the list of paths
+
+
+from services.autocomplete import GraphNameIndex
+
+
+class TestGraphNameIndex(unittest.TestCase):
+    def setUp(self):
+        self.person, self.place = ObjectId(), ObjectId()
+        self.nodes = [
+            {"_id": ObjectId(), "name": "Paris", "type": self.place},
+            {"_id": ObjectId(), "name": "paris", "type": self.person},
+            {"_id": ObjectId(), "name": "Parisian", "type": self.person},
+            {"_id": ObjectId(), "name": "Paris", "type": self.place},  # duplicate
+            {"_id": ObjectId(), "name": "London", "type": self.place},
+        ]
+        self.index = GraphNameIndex(self.nodes)
+
+    def test_prefix_matches_ignore_case(self):
+        matches = self.index.complete("PAR", limit=10)
+
+        self.assertEqual([name for name, _ in matches], ["Paris", "paris", "Parisian"])
+        self.assertEqual(self.index.complete("x", limit=10), [])
+
+    def test_limit_and_type_filter(self):
+        self.assertEqual(len(self.index.complete("", limit=2)), 2)
+        self.assertEqual(
+            self.index.complete("par", limit=10, node_type=self.place),
+            [("Paris", self.place)],
+        )
+
+    def test_update_renames_and_removes(self):
+        renamed = {**self.nodes[4], "name": "Lyon"}
+        self.index.update(nodes=[renamed], removed_node_ids=[self.nodes[0]["_id"]])
+
+        self.assertEqual(self.index.complete("lon", limit=10), [])
+        self.assertEqual(self.index.complete("ly", limit=10), [("Lyon", self.place)])
+        # Another node is still named Paris
+        self.assertIn(("Paris", self.place), self.index.complete("paris", limit=10))
+
+        self.index.update(removed_node_ids=[self.nodes[3]["_id"]])
+        self.assertNotIn(("Paris", self.place), self.index.complete("paris", limit=10))
+
+
+if __name__ == "__main__":
+    unittest.main()
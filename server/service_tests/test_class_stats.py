@@ -0,0 +1,84 @@
+import unittest
+from bson import ObjectId
+
+import sys
+
+sys.path.append("..")  # Adds the parent directory to the list of paths
+
+
+from services.class_stats import (
+    KEY_FIELD,
+    ClassStats,
+    _by_class,
+    counts_changes,
+    stat_key,
+)
+
+PERSON, PLACE = ObjectId(), ObjectId()
+
+
+def make_item(type=PERSON, is_active=True, is_reviewed=False, errors=()):
+    return {
+        "_id": ObjectId(),
+        "type": type,
+        "is_active": is_active,
+        "is_reviewed": is_reviewed,
+        "errors": [{"acknowledged": acknowledged} for acknowledged in errors],
+    }
+
+
+class TestClassStats(unittest.TestCase):
+    def test_stat_key(self):
+        self.assertEqual(stat_key(make_item()), (PERSON, True, False, False))
+        self.assertEqual(
+            stat_key(make_item(is_active=False, is_reviewed=True, errors=[True])),
+            (PERSON, False, True, False),
+        )
+        self.assertTrue(stat_key(make_item(errors=[True, False]))[3])
+        # Denormalised counts of the issue collection layout
+        self.assertTrue(stat_key({"type": PLACE, "open_error_count": 2})[3])
+
+    def test_counts_marked_items(self):
+        nodes = [
+            make_item(),
+            make_item(is_reviewed=True),
+            make_item(type=PLACE, is_active=False, errors=[False]),
+        ]
+        stats = ClassStats()
+        stats.mark("nodes", nodes)
+        stats.mark("edges", [make_item(type=None)])
+
+        self.assertEqual(nodes[1][KEY_FIELD], [PERSON, True, True, False])
+        document = stats.document()
+        self.assertEqual(
+            document["nodes"][str(PERSON)],
+            {"count": 2, "active": 2, "reviewed": 1, "erroring": 0},
+        )
+        self.assertEqual(
+            document["nodes"][str(PLACE)],
+            {"count": 1, "active": 0, "reviewed": 0, "erroring": 1},
+        )
+        self.assertEqual(document["edges"]["untyped"]["count"], 1)
+        self.assertEqual(stats.increments()[f"class_stats.nodes.{PERSON}.reviewed"], 1)
+
+    def test_by_class(self):
+        counters = {
+            str(PERSON): {"count": 3, "active": 2, "reviewed": 1, "erroring": 0},
+            "untyped": {"count": 1, "active": 1, "reviewed": 0, "erroring": 0},
+        }
+        classes = [{"_id": PERSON, "name": "Person"}, {"_id": PLACE, "name": "Place"}]
+        result = _by_class(counters, classes)
+        self.assertEqual([r["name"] for r in result], ["Person", "Place", None])
+        self.assertEqual(result[0]["active"], 2)
+        self.assertEqual(result[1]["count"], 0)
+        self.assertEqual(result[2]["count"], 1)
+
+    def test_counts_changes(self):
+        self.assertTrue(counts_changes(None))
+        self.assertTrue(counts_changes({"edges": [ObjectId()]}))
+        self.assertFalse(counts_changes({"triples": [ObjectId()], "graph": True}))
+        self.assertFalse(counts_changes({"nodes": []}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import gzip
+import unittest
+from unittest import mock
+
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import sys
+
+sys.path.append("..")  # Adds the parent directory to the list of paths
+
+
+import compression
+from compression import CompressionMiddleware, negotiate_encoding
+
+BODY = b'{"_id": "6463a5c2f1d2c3b4a5e6f708"}' * 100
+
+
+def large(request):
+    return Response(BODY, media_type="application/json", headers={"ETag": '"1-a"'})
+
+
+def small(request):
+    return Response(b"{}", media_type="application/json")
+
+
+def stream(request):
+    return StreamingResponse(iter([BODY, BODY]), media_type="application/json")
+
+
+def events(request):
+    return StreamingResponse(iter([BODY]), media_type="text/event-stream")
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        app = Starlette(
+            routes=[
+                Route("/large", large),
+                Route("/small", small),
+                Route("/stream", stream),
+                Route("/events", events),
+            ]
+        )
+        app.add_middleware(CompressionMiddleware, minimum_size=100)
+        self.client = TestClient(app)
+
+    def get(self, path, accept="gzip"):
+        return self.client.get(path, headers={"Accept-Encoding": accept})
+
+    def test_negotiation(self):
+        with mock.patch.object(compression, "brotli", None):
+            self.assertEqual(negotiate_encoding("gzip, deflate, br"), "gzip")
+            self.assertEqual(negotiate_encoding("*"), "gzip")
+            self.assertIsNone(negotiate_encoding("gzip;q=0, identity"))
+            self.assertIsNone(negotiate_encoding(""))
+        with mock.patch.object(compression, "brotli", object()):
+            self.assertEqual(negotiate_encoding("gzip, br"), "br")
+            self.assertEqual(negotiate_encoding("gzip, br;q=0.5"), "gzip")
+
+    def test_compresses_large_bodies_only(self):
+        response = self.get("/large")
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(response.headers["etag"], 'W/"1-a"')
+        self.assertIn("Accept-Encoding", response.headers["vary"])
+        self.assertEqual(response.content, BODY)
+
+        self.assertNotIn("content-encoding", self.get("/small").headers)
+        self.assertNotIn("content-encoding", self.get("/large", "identity").headers)
+
+    def test_streamed_bodies(self):
+        with self.client.stream(
+            "GET", "/stream", headers={"Accept-Encoding": "gzip"}
+        ) as response:
+            self.assertEqual(response.headers["content-encoding"], "gzip")
+            self.assertNotIn("content-length", response.headers)
+            compressed = b"".join(response.iter_raw())
+        self.assertEqual(gzip.decompress(compressed), BODY + BODY)
+
+        self.assertNotIn("content-encoding", self.get("/events").headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import asyncio
+import unittest
+
+from bson import ObjectId
+
+import sys
+
+sys.path.append("..")  # Adds the parent directory to the list of paths
+
+
+from services.events import RESET, ChangeBroker, format_event
+
+
+def entry(graph_id, version, nodes=()):
+    return {
+        "graph_id": graph_id,
+        "version": version,
+        "reset": False,
+        "graph": False,
+        "nodes": list(nodes),
+        "edges": [],
+        "triples": [],
+    }
+
+
+async def take(stream, n):
+    return [await stream.__anext__() for _ in range(n)]
+
+
+class TestChangeBroker(unittest.TestCase):
+    def setUp(self):
+        self.graph_id = ObjectId()
+        self.broker = ChangeBroker(queue_size=2, max_subscribers=2)
+
+    def test_format_event(self):
+        node = ObjectId()
+        event = format_event(entry(self.graph_id, 3, [node]))
+        self.assertTrue(event.startswith(b"id: 3\nevent: change\ndata: {"))
+        self.assertIn(str(node).encode(), event)
+        self.assertTrue(event.endswith(b"\n\n"))
+
+    def test_fan_out(self):
+        async def run():
+            first = self.broker.subscribe(self.graph_id)
+            second = self.broker.subscribe(self.graph_id)
+            self.assertIsNone(self.broker.subscribe(self.graph_id))
+            other = self.broker.subscribe(ObjectId())
+
+            self.broker.publish(entry(self.graph_id, 1))
+            self.assertEqual(first.queue.qsize(), 1)
+            self.assertEqual(second.queue.qsize(), 1)
+            self.assertEqual(other.queue.qsize(), 0)
+
+            stream = self.broker.stream(first)
+            self.assertEqual(
+                await take(stream, 1), [format_event(entry(self.graph_id, 1))]
+            )
+            await stream.aclose()
+            self.assertEqual(self.broker.subscriber_count(self.graph_id), 1)
+
+        asyncio.run(run())
+
+    def test_replay_skips_duplicates(self):
+        async def run():
+            subscriber = self.broker.subscribe(self.graph_id)
+            self.broker.publish(entry(self.graph_id, 2))
+            self.broker.publish(entry(self.graph_id, 3))
+            replay = [entry(self.graph_id, 1), entry(self.graph_id, 2)]
+            stream = self.broker.stream(subscriber, replay)
+            events = await take(stream, 3)
+            self.assertEqual(
+                [e.split(b"\n")[0] for e in events], [b"id: 1", b"id: 2", b"id: 3"]
+            )
+            await stream.aclose()
+
+        asyncio.run(run())
+
+    def test_replay_too_long_is_reset(self):
+        async def run():
+            subscriber = self.broker.subscribe(self.graph_id)
+            self.broker.publish(entry(self.graph_id, 5))
+            stream = self.broker.stream(subscriber, None)
+            events = await take(stream, 2)
+            self.assertEqual(events[0], RESET)
+            self.assertTrue(events[1].startswith(b"id: 5\n"))
+            await stream.aclose()
+
+        asyncio.run(run())
+
+    def test_lagging_subscriber_is_reset(self):
+        async def run():
+            subscriber = self.broker.subscribe(self.graph_id)
+            for version in range(1, 4):
+                self.broker.publish(entry(self.graph_id, version))
+            self.assertTrue(subscriber.lagged)
+            self.assertEqual(self.broker.subscriber_count(self.graph_id), 0)
+
+            stream = self.broker.stream(subscriber)
+            events = await take(stream, 3)
+            self.assertEqual(events[-1], RESET)
+            with self.assertRaises(StopAsyncIteration):
+                await stream.__anext__()
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import asyncio
+import unittest
+from datetime import datetime
+from unittest import mock
+from bson import ObjectId
+
+import sys
+
+sys.path.append("..")  # Adds the parent directory to the list of paths
+
+
+from services.issue_store import (
+    ISSUES_COLLECTION,
+    attach_issues,
+    migrate_issues,
+)
+from services.issues import list_issues
+from settings import settings
+
+try:
+    from mongomock_motor import AsyncMongoMockClient
+except ImportError:
+    AsyncMongoMockClient = None
+
+
+def make_issue(kind, value, acknowledged=False):
+    now = datetime(2023, 1, 1)
+    return {
+        "id": ObjectId(),
+        f"{kind}_type": "type",
+        f"{kind}_value": value,
+        "action": None,
+        "acknowledged": acknowledged,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def make_item(graph_id, errors=(), suggestions=(), item_type=None):
+    _id = ObjectId()
+    return {
+        "_id": _id,
+        "graph_id": graph_id,
+        "type": item_type,
+        "name": str(_id),
+        "errors": [{**e, "item_id": _id} for e in errors],
+        "suggestions": [{**s, "item_id": _id} for s in suggestions],
+    }
+
+
+@unittest.skipIf(AsyncMongoMockClient is None, "requires mongomock-motor")
+class TestMigrateIssues(unittest.TestCase):
+    def setUp(self):
+        self.db = AsyncMongoMockClient()["test"]
+        graph_id = ObjectId()
+        self.nodes = [
+            make_item(
+                graph_id,
+                errors=[make_issue("error", "a"), make_issue("error", "b", True)],
+                suggestions=[make_issue("suggestion", "c")],
+            ),
+            make_item(graph_id),
+        ]
+        self.edges = [make_item(graph_id, suggestions=[make_issue("suggestion", "d")])]
+
+    def test_round_trip(self):
+        async def run():
+            await self.db["nodes"].insert_many([dict(n) for n in self.nodes])
+            await self.db["edges"].insert_many([dict(e) for e in self.edges])
+
+            migrated = await migrate_issues(self.db, to_collection=True, batch_size=1)
+            self.assertEqual(migrated, {"nodes": 1, "edges": 1})
+            self.assertEqual(await self.db[ISSUES_COLLECTION].count_documents({}), 4)
+            node = await self.db["nodes"].find_one({"_id": self.nodes[0]["_id"]})
+            self.assertEqual((node["errors"], node["suggestions"]), ([], []))
+            self.assertEqual((node["error_count"], node["open_error_count"]), (2, 1))
+            self.assertEqual(node["open_suggestion_count"], 1)
+
+            # Re-running finds nothing left to move
+            migrated = await migrate_issues(self.db, to_collection=True)
+            self.assertEqual(migrated, {"nodes": 0, "edges": 0})
+
+            # Items read in the collection layout carry the same issues
+            with mock.patch.object(settings, "ISSUE_STORAGE", "collection"):
+                await attach_issues(self.db, nodes=[node])
+            self.assertEqual(node["errors"], self.nodes[0]["errors"])
+            self.assertEqual(node["suggestions"], self.nodes[0]["suggestions"])
+
+            migrated = await migrate_issues(self.db, to_collection=False)
+            self.assertEqual(migrated, {"nodes": 1, "edges": 1})
+            self.assertEqual(await self.db[ISSUES_COLLECTION].count_documents({}), 0)
+            for collection, items in [("nodes", self.nodes), ("edges", self.edges)]:
+                for item in items:
+                    doc = await self.db[collection].find_one({"_id": item["_id"]})
+                    self.assertEqual(doc["errors"], item["errors"])
+                    self.assertEqual(doc["suggestions"], item["suggestions"])
+                    self.assertNotIn("error_count", doc)
+
+        asyncio.run(run())
+
+
+@unittest.skipIf(AsyncMongoMockClient is None, "requires mongomock-motor")
+@mock.patch.object(settings, "ISSUE_STORAGE", "collection")
+class TestListIssueDocuments(unittest.TestCase):
+    def setUp(self):
+        self.db = AsyncMongoMockClient()["test"]
+        self.graph_id = ObjectId()
+        self.classes = [{"_id": ObjectId(), "name": name} for name in ["A", "B"]]
+        self.nodes = [
+            make_item(
+                self.graph_id,
+                errors=[make_issue("error", str(i))],
+                item_type=self.classes[i % 2]["_id"],
+            )
+            for i in range(5)
+        ]
+
+    def test_item_type(self):
+        async def run():
+            await self.db["graphs"].insert_one(
+                {"_id": self.graph_id, "node_classes": self.classes, "edge_classes": []}
+            )
+            await self.db["nodes"].insert_many([dict(n) for n in self.nodes])
+            await migrate_issues(self.db, to_collection=True)
+
+            def page(after=None):
+                return list_issues(
+                    graph_id=self.graph_id,
+                    is_error=True,
+                    db=self.db,
+                    limit=2,
+                    after=after,
+                    item_type=self.classes[0]["_id"],
+                )
+
+            issues, after = await page()
+            self.assertEqual([i["error_value"] for i in issues], ["0", "2"])
+            self.assertEqual({i["item_type"] for i in issues}, {"A"})
+            issues, after = await page(after)
+            self.assertEqual([i["error_value"] for i in issues], ["4"])
+            self.assertIsNone(after)
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import asyncio
+import unittest
+from bson import ObjectId
+
+import sys
+
+sys.path.append("..")  # Adds the parent directory to the list of paths
+
+
+from services.node_index import NodeIndexCache
+
+try:
+    from mongomock_motor import AsyncMongoMockClient
+except ImportError:
+    AsyncMongoMockClient = None
+
+
+class NameSet:
+    """Minimal index: the names of a graph's nodes."""
+
+    builds = 0
+
+    def __init__(self, nodes):
+        NameSet.builds += 1
+        self.names = {n["_id"]: n["name"] for n in nodes}
+
+    def update(self, nodes=(), removed_node_ids=()):
+        for node_id in removed_node_ids:
+            self.names.pop(node_id, None)
+        self.names.update({n["_id"]: n["name"] for n in nodes})
+
+    def __len__(self):
+        return len(self.names)
+
+
+@unittest.skipIf(AsyncMongoMockClient is None, "requires mongomock-motor")
+class TestNodeIndexCache(unittest.TestCase):
+    def setUp(self):
+        self.db = AsyncMongoMockClient()["test"]
+        self.graphs = [ObjectId(), ObjectId()]
+        self.cache = NodeIndexCache(
+            name="names",
+            build=NameSet,
+            projection={"name": 1},
+            max_graphs=1,
+            ttl_seconds=60,
+        )
+        NameSet.builds = 0
+
+    async def add_node(self, graph_id, name):
+        node = {"_id": ObjectId(), "graph_id": graph_id, "name": name}
+        await self.db["nodes"].insert_one(node)
+        return node["_id"]
+
+    def test_builds_once(self):
+        async def run():
+            await self.add_node(self.graphs[0], "a")
+            indexes = await asyncio.gather(
+                *[self.cache.get(self.graphs[0], self.db) for _ in range(3)]
+            )
+            self.assertEqual(NameSet.builds, 1)
+            self.assertEqual(list(indexes[0].names.values()), ["a"])
+
+            # Least recently used graphs are evicted
+            await self.cache.get(self.graphs[1], self.db)
+            await self.cache.get(self.graphs[0], self.db)
+            self.assertEqual(NameSet.builds, 3)
+
+            self.cache.ttl_seconds = 0
+            await self.cache.get(self.graphs[0], self.db)
+            self.assertEqual(NameSet.builds, 4)
+
+        asyncio.run(run())
+
+    def test_refresh(self):
+        async def run():
+            graph_id = self.graphs[0]
+            kept = await self.add_node(graph_id, "a")
+            removed = await self.add_node(graph_id, "b")
+            index = await self.cache.get(graph_id, self.db)
+
+            added = await self.add_node(graph_id, "c")
+            await self.db["nodes"].update_one({"_id": kept}, {"$set": {"name": "A"}})
+            await self.db["nodes"].delete_one({"_id": removed})
+            await self.cache.refresh(graph_id, self.db, [kept, removed, added])
+            self.assertEqual(index.names, {kept: "A", added: "c"})
+
+            # Graphs that are not cached are left to be built on first use
+            self.cache.invalidate(graph_id)
+            await self.cache.refresh(graph_id, self.db, [kept])
+            self.assertIsNone(self.cache._lookup(graph_id))
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import base64
+import unittest
+from bson import ObjectId
+
+import sys
+
+sys.path.append("..")  # Adds the parent directory to the list of paths
+
+
+from services.graph import (
+    decode_subgraph_cursor,
+    encode_subgraph_cursor,
+    page_focus_triples,
+)
+
+
+def make_triples(focus, n):
+    return [
+        {"_id": ObjectId(), "head": focus, "edge": ObjectId(), "tail": ObjectId()}
+        for _ in range(n)
+    ]
+
+
+def page_through(triples, focus, limit):
+    pages, cursor = [], None
+    while True:
+        after = None if cursor is None else decode_subgraph_cursor(cursor)[1]
+        page, has_more = page_focus_triples(triples, skip=0, limit=limit, after=after)
+        pages.append(page)
+        if not (has_more and page):
+            return pages
+        cursor = encode_subgraph_cursor(focus, page[-1])
+
+
+class TestSubgraphCursor(unittest.TestCase):
+    def setUp(self):
+        self.focus = ObjectId()
+        self.triples = make_triples(self.focus, 7)
+
+    def test_round_trip(self):
+        triple = self.triples[0]
+        node_id, after = decode_subgraph_cursor(
+            encode_subgraph_cursor(self.focus, triple)
+        )
+        self.assertEqual(node_id, self.focus)
+        self.assertEqual(
+            after, (triple["head"], triple["edge"], triple["tail"], triple["_id"])
+        )
+
+    def test_pages_cover_triples_once(self):
+        pages = page_through(self.triples, self.focus, limit=3)
+        self.assertEqual([len(p) for p in pages], [3, 3, 1])
+        ids = [t["_id"] for page in pages for t in page]
+        self.assertCountEqual(ids, [t["_id"] for t in self.triples])
+
+    def test_tampered_cursors_are_rejected(self):
+        cursor = encode_subgraph_cursor(self.focus, self.triples[0])
+        raw = base64.urlsafe_b64decode(cursor)
+        for tampered in [
+            "",
+            "not a cursor!",
+            "é",
+            cursor[:-4],
+            cursor + "AAAA",
+            base64.urlsafe_b64encode(raw[:48]).decode(),
+        ]:
+            with self.subTest(cursor=tampered):
+                with self.assertRaises(ValueError):
+                    decode_subgraph_cursor(tampered)
+
+    def test_stale_cursor(self):
+        first, has_more = page_focus_triples(self.triples, skip=0, limit=3)
+        self.assertTrue(has_more)
+        cursor = encode_subgraph_cursor(self.focus, first[-1])
+
+        # The last triple of the page is deleted before the next page is requested
+        remaining = [t for t in self.triples if t["_id"] != first[-1]["_id"]]
+        _, after = decode_subgraph_cursor(cursor)
+        page, _ = page_focus_triples(remaining, skip=0, limit=10, after=after)
+        self.assertEqual(len(page), 4)
+        self.assertFalse({t["_id"] for t in page} & {t["_id"] for t in first})
+
+        # Every triple after the cursor is gone
+        page, has_more = page_focus_triples(first, skip=0, limit=3, after=after)
+        self.assertEqual((page, has_more), ([], False))
+
+
+if __name__ == "__main__":
+    unittest.main()
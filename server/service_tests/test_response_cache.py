@@ -0,0 +1,47 @@
+import unittest
+from bson import ObjectId
+
+import sys
+
+sys.path.append("..")  # Adds the parent directory to the list of paths
+
+
+from services.response_cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(max_bytes=10)
+        self.graph_id = ObjectId()
+
+    def key(self, version, params=()):
+        return (self.graph_id, version, "/graph/{graph_id}", params)
+
+    def test_newer_version_drops_older_entries(self):
+        self.cache.put(self.key(1), b"old")
+        self.cache.put(self.key(2), b"new")
+
+        self.assertIsNone(self.cache.get(self.key(1)))
+        self.assertEqual(self.cache.get(self.key(2)), b"new")
+        # Responses built from an outdated version are not stored
+        self.cache.put(self.key(1, ("a",)), b"late")
+        self.assertIsNone(self.cache.get(self.key(1, ("a",))))
+
+    def test_evicts_least_recently_used_beyond_budget(self):
+        self.cache.put(self.key(1, ("a",)), b"aaaa")
+        self.cache.put(self.key(1, ("b",)), b"bbbb")
+        self.cache.get(self.key(1, ("a",)))
+        self.cache.put(self.key(1, ("c",)), b"cccc")
+
+        self.assertIsNone(self.cache.get(self.key(1, ("b",))))
+        self.assertEqual(self.cache.get(self.key(1, ("a",))), b"aaaa")
+
+    def test_invalidate(self):
+        self.cache.put(self.key(1), b"body")
+        self.cache.invalidate(self.graph_id)
+
+        self.assertIsNone(self.cache.get(self.key(1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
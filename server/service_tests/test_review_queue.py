@@ -0,0 +1,61 @@
+import unittest
+from bson import ObjectId
+
+import sys
+
+sys.path.append("..")  # Adds the parent directory to the list of paths
+
+
+from services.review_queue import GraphReviewQueue
+
+
+def make_item(is_reviewed=False, errors=0, acknowledged=0):
+    return {
+        "_id": ObjectId(),
+        "is_reviewed": is_reviewed,
+        "errors": [{"acknowledged": i < acknowledged} for i in range(errors)],
+        "suggestions": [],
+    }
+
+
+class TestGraphReviewQueue(unittest.TestCase):
+    def setUp(self):
+        self.a, self.b, self.c = (make_item(is_reviewed=True) for _ in range(3))
+        self.ab = make_item(errors=2)
+        self.bc = make_item(is_reviewed=True)
+        self.triples = [
+            {"head": self.a["_id"], "edge": self.ab["_id"], "tail": self.b["_id"]},
+            {"head": self.b["_id"], "edge": self.bc["_id"], "tail": self.c["_id"]},
+        ]
+        self.queue = GraphReviewQueue(
+            nodes=[self.a, self.b, self.c],
+            edges=[self.ab, self.bc],
+            triples=self.triples,
+        )
+
+    def test_reviewed_items_are_not_queued(self):
+        self.assertIsNone(self.queue.score(self.c["_id"]))
+        self.assertEqual(len(self.queue), 2)
+
+    def test_next_prefers_higher_degree(self):
+        node_id, _ = self.queue.next()
+        self.assertEqual(node_id, self.b["_id"])
+
+        node_id, _ = self.queue.next(exclude=[self.b["_id"]])
+        self.assertEqual(node_id, self.a["_id"])
+
+    def test_update_rescores_endpoints(self):
+        self.queue.update(edges=[{**self.ab, "is_reviewed": True, "errors": []}])
+        self.assertIsNone(self.queue.next())
+
+        self.queue.update(nodes=[{**self.c, "is_reviewed": False}])
+        node_id, _ = self.queue.next()
+        self.assertEqual(node_id, self.c["_id"])
+
+    def test_removed_edges_are_detached(self):
+        self.queue.update(removed_edge_ids=[self.ab["_id"]])
+        self.assertIsNone(self.queue.next())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from bson import ObjectId
+
+import sys
+
+sys.path.append("..")  # Adds the parent directory to the list of paths
+
+
+from services.search import GraphSearchIndex, edit_distance
+
+
+def make_node(name, node_type, *values):
+    return {
+        "_id": ObjectId(),
+        "name": name,
+        "type": node_type,
+        "properties": [{"name": f"p{i}", "value": v} for i, v in enumerate(values)],
+    }
+
+
+class TestGraphSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.river, self.country = ObjectId(), ObjectId()
+        self.nodes = [
+            make_node("Amazon River", self.river, "6,400 km", "South America"),
+            make_node("Brazil", self.country, "Brasilia"),
+            make_node("Nile River", self.river, "Africa"),
+            make_node("Amazonas", self.country),
+        ]
+        self.index = GraphSearchIndex(self.nodes)
+
+    def ids(self, query, **kwargs):
+        return [node_id for node_id, _ in self.index.search(query, **kwargs)]
+
+    def test_edit_distance_is_bounded(self):
+        self.assertEqual(edit_distance("river", "rivr", 2), 1)
+        self.assertEqual(edit_distance("river", "ocean", 1), 2)
+
+    def test_token_prefix_and_fuzzy_matches(self):
+        amazon, brazil, nile, amazonas = (n["_id"] for n in self.nodes)
+
+        self.assertEqual(self.ids("nile"), [nile])
+        self.assertEqual(self.ids("amaz"), [amazon, amazonas])
+        self.assertEqual(self.ids("brasilia"), [brazil])  # property value
+        self.assertIn(brazil, self.ids("brazli"))  # typo
+        # Nodes matching every query token come first
+        self.assertEqual(self.ids("amazon river")[0], amazon)
+
+    def test_type_filter(self):
+        self.assertEqual(
+            self.ids("amazon", node_type=self.country), [self.nodes[3]["_id"]]
+        )
+
+    def test_update_reindexes_and_removes(self):
+        renamed = {**self.nodes[2], "name": "Danube River"}
+        self.index.update(nodes=[renamed], removed_node_ids=[self.nodes[1]["_id"]])
+
+        self.assertEqual(self.ids("nile"), [])
+        self.assertEqual(self.ids("danube"), [renamed["_id"]])
+        self.assertEqual(self.ids("brasilia"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
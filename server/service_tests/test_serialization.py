@@ -0,0 +1,130 @@
+import asyncio
+import json
+import unittest
+from datetime import datetime
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+import sys
+
+sys.path.append("..")  # Adds the parent directory to the list of paths
+
+
+from services.graph import (
+    create_nodes_links,
+    create_plain_graph_data,
+    get_node_neighbours,
+)
+from services.serialization import compact_ids, dumps, iter_json
+
+
+def encode(content):
+    """Encodes content like FastAPI's default response path."""
+    return json.loads(
+        json.dumps(jsonable_encoder(content, custom_encoder={ObjectId: str}))
+    )
+
+
+def make_item(**fields):
+    now = datetime(2023, 5, 1, 12, 30, 15, 123000)
+    return {
+        "_id": ObjectId(),
+        "type": ObjectId(),
+        "graph_id": ObjectId(),
+        "value": 1,
+        "color": "#000000",
+        "is_active": True,
+        "is_reviewed": False,
+        "properties": [],
+        "errors": [],
+        "suggestions": [],
+        "created_at": now,
+        "updated_at": now,
+        **fields,
+    }
+
+
+class TestSerialization(unittest.TestCase):
+    def test_dumps_matches_standard_encoding(self):
+        content = {"_id": ObjectId(), "at": datetime(2023, 5, 1, 0, 0, 0, 5000)}
+
+        self.assertEqual(json.loads(dumps(content)), encode(content))
+
+    def test_plain_graph_data_matches_models(self):
+        a, b, c = (make_item(name=n) for n in "abc")
+        error = {
+            "id": ObjectId(),
+            "item_id": a["_id"],
+            "error_type": "typo",
+            "error_value": "a",
+            "action": None,
+            "acknowledged": False,
+            "created_at": a["created_at"],
+            "updated_at": a["updated_at"],
+        }
+        a["errors"] = [error]
+        triples = [
+            {"head": a, "edge": make_item(errors=[error]), "tail": b},
+            {"head": b, "edge": make_item(), "tail": c},
+        ]
+
+        nodes, links = create_nodes_links(triples)
+        neighbours = get_node_neighbours(nodes.values(), links.values())
+        plain_nodes, plain_links, plain_neighbours = create_plain_graph_data(triples)
+
+        self.assertEqual(encode(nodes), json.loads(dumps(plain_nodes)))
+        self.assertEqual(encode(links), json.loads(dumps(plain_links)))
+        # Neighbour lists are unordered
+        self.assertEqual(
+            {k: {f: set(v[f]) for f in v} for k, v in encode(neighbours).items()},
+            {
+                k: {f: set(map(str, v[f])) for f in v}
+                for k, v in plain_neighbours.items()
+            },
+        )
+
+    def test_compact_ids(self):
+        graph_id, node_type = ObjectId(), ObjectId()
+        content = {
+            "_id": graph_id,
+            "name": str(node_type),  # Not an id field
+            "subgraphs": [
+                {"_id": str(graph_id), "type": node_type, "value": "1"},
+                {"_id": str(node_type), "type": str(node_type), "value": "2"},
+            ],
+        }
+
+        compact = compact_ids(content)
+
+        self.assertEqual(compact["ids"], [str(graph_id), str(node_type)])
+        self.assertEqual(
+            compact["data"],
+            {
+                "_id": 0,
+                "name": str(node_type),
+                "subgraphs": [
+                    {"_id": 0, "type": 1, "value": "1"},
+                    {"_id": 1, "type": 1, "value": "2"},
+                ],
+            },
+        )
+
+    def test_iter_json(self):
+        async def items(n):
+            for i in range(n):
+                yield {"_id": ObjectId(), "i": i}
+
+        async def collect(fields):
+            return b"".join([part async for part in iter_json(fields, chunk_size=2)])
+
+        fields = {"meta": {"_id": ObjectId()}, "data": list(range(5)), "empty": []}
+        body = asyncio.run(collect(fields))
+        self.assertEqual(json.loads(body), encode(fields))
+
+        body = asyncio.run(collect({"data": items(5), "empty": items(0)}))
+        self.assertEqual([d["i"] for d in json.loads(body)["data"]], list(range(5)))
+        self.assertEqual(json.loads(body)["empty"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import asyncio
+import unittest
+from datetime import datetime
+from unittest import mock
+from bson import ObjectId
+
+import sys
+
+sys.path.append("..")  # Adds the parent directory to the list of paths
+
+
+from services.transactions import (
+    JOURNAL_COLLECTION,
+    Delete,
+    Mutation,
+    apply_mutation,
+    recover_journals,
+)
+from settings import settings
+
+try:
+    from mongomock_motor import AsyncMongoMockClient
+except ImportError:
+    AsyncMongoMockClient = None
+
+
+@unittest.skipIf(AsyncMongoMockClient is None, "requires mongomock-motor")
+@mock.patch.object(settings, "MUTATION_TRANSACTIONS", False)
+class TestJournaledMutations(unittest.TestCase):
+    def setUp(self):
+        self.db = AsyncMongoMockClient()["test"]
+        self.old = [{"_id": ObjectId()} for _ in range(2)]
+
+    def mutation(self, nodes, edges=()):
+        return Mutation(
+            operation="merge",
+            inserts={"nodes": nodes, "edges": list(edges)},
+            deletes=[Delete("nodes", "_id", [d["_id"] for d in self.old])],
+        )
+
+    async def ids(self, collection):
+        return {d["_id"] async for d in self.db[collection].find({}, {"_id": 1})}
+
+    def test_apply(self):
+        async def run():
+            await self.db["nodes"].insert_many(self.old)
+            new = {"_id": ObjectId()}
+            await apply_mutation(self.db, self.mutation([new]))
+            self.assertEqual(await self.ids("nodes"), {new["_id"]})
+            self.assertEqual(await self.db[JOURNAL_COLLECTION].count_documents({}), 0)
+
+        asyncio.run(run())
+
+    def test_failed_insert_is_rolled_back(self):
+        async def run():
+            await self.db["nodes"].insert_many(self.old)
+            new, duplicate = {"_id": ObjectId()}, {"_id": ObjectId()}
+            with self.assertRaises(Exception):
+                await apply_mutation(
+                    self.db, self.mutation([new], edges=[duplicate, duplicate])
+                )
+            self.assertEqual(await self.ids("nodes"), {d["_id"] for d in self.old})
+            self.assertEqual(await self.ids("edges"), set())
+            self.assertEqual(await self.db[JOURNAL_COLLECTION].count_documents({}), 0)
+
+        asyncio.run(run())
+
+    def test_recover_journals(self):
+        async def run():
+            await self.db["nodes"].insert_many(self.old)
+            inserted, kept = {"_id": ObjectId()}, {"_id": ObjectId()}
+            await self.db["nodes"].insert_many([inserted, kept])
+            journal = {
+                "operation": "merge",
+                "deletes": [
+                    {
+                        "collection": "nodes",
+                        "field": "_id",
+                        "values": [self.old[0]["_id"]],
+                    }
+                ],
+                "created_at": datetime.utcnow(),
+            }
+            await self.db[JOURNAL_COLLECTION].insert_many(
+                [
+                    # Crashed while inserting: rolled back
+                    {
+                        **journal,
+                        "phase": "insert",
+                        "inserted": {"nodes": [inserted["_id"]]},
+                    },
+                    # Crashed while deleting: rolled forward
+                    {
+                        **journal,
+                        "phase": "delete",
+                        "inserted": {"nodes": [kept["_id"]]},
+                    },
+                ]
+            )
+
+            self.assertEqual(await recover_journals(self.db), 2)
+            self.assertEqual(await self.ids("nodes"), {self.old[1]["_id"], kept["_id"]})
+            self.assertEqual(await recover_journals(self.db), 0)
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
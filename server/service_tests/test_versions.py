@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+from unittest import mock
+from bson import ObjectId
+
+import sys
+
+sys.path.append("..")  # Adds the parent directory to the list of paths
+
+
+from services.versions import CHANGES_COLLECTION, bump_graph_version, get_changes
+from settings import settings
+
+try:
+    from mongomock_motor import AsyncMongoMockClient
+except ImportError:
+    AsyncMongoMockClient = None
+
+
+@unittest.skipIf(AsyncMongoMockClient is None, "requires mongomock-motor")
+class TestGetChanges(unittest.TestCase):
+    def setUp(self):
+        self.db = AsyncMongoMockClient()["test"]
+        self.graph_id = ObjectId()
+        self.nodes = [
+            {"_id": ObjectId(), "graph_id": self.graph_id, "name": name}
+            for name in ["a", "b", "c"]
+        ]
+
+    async def populate(self):
+        await self.db["graphs"].insert_one({"_id": self.graph_id, "name": "graph"})
+        await self.db["nodes"].insert_many([dict(n) for n in self.nodes])
+
+    def test_changed_and_deleted(self):
+        async def run():
+            await self.populate()
+            a, b, c = [n["_id"] for n in self.nodes]
+            self.assertEqual(
+                await bump_graph_version(self.graph_id, self.db, {"nodes": [a]}), 1
+            )
+            await self.db["nodes"].delete_one({"_id": b})
+            await bump_graph_version(self.graph_id, self.db, {"nodes": [b]})
+            await bump_graph_version(self.graph_id, self.db, {"graph": True})
+
+            changes = await get_changes(self.graph_id, since=0, db=self.db)
+            self.assertFalse(changes["reset"])
+            self.assertEqual(changes["version"], 3)
+            self.assertEqual([n["_id"] for n in changes["nodes"]], [a])
+            self.assertEqual(changes["deleted"]["nodes"], [b])
+            self.assertEqual(changes["graph"]["name"], "graph")
+
+            changes = await get_changes(self.graph_id, since=1, db=self.db)
+            self.assertEqual(changes["nodes"], [])
+            self.assertEqual(changes["deleted"]["nodes"], [b])
+
+            changes = await get_changes(self.graph_id, since=3, db=self.db)
+            self.assertEqual((changes["reset"], changes["nodes"]), (False, []))
+            self.assertIsNone(changes["graph"])
+
+            self.assertIsNone(await get_changes(ObjectId(), since=0, db=self.db))
+
+        asyncio.run(run())
+
+    def test_reset(self):
+        async def run():
+            await self.populate()
+            ids = [n["_id"] for n in self.nodes]
+            await bump_graph_version(self.graph_id, self.db, {"nodes": ids[:1]})
+            await bump_graph_version(self.graph_id, self.db)  # Logged as a reset
+            await bump_graph_version(self.graph_id, self.db, {"nodes": ids})
+
+            def changes_since(since):
+                return get_changes(self.graph_id, since=since, db=self.db)
+
+            self.assertTrue((await changes_since(0))["reset"])
+            self.assertTrue((await changes_since(1))["reset"])
+            self.assertFalse((await changes_since(2))["reset"])
+            # Clients ahead of the graph (e.g. after it was recreated)
+            self.assertTrue((await changes_since(4))["reset"])
+
+            with mock.patch.object(settings, "CHANGE_LOG_MAX_IDS", 2):
+                self.assertTrue((await changes_since(2))["reset"])
+
+            # Expired entries
+            await self.db[CHANGES_COLLECTION].delete_one(
+                {"graph_id": self.graph_id, "version": 3}
+            )
+            changes = await changes_since(2)
+            self.assertTrue(changes["reset"])
+            self.assertEqual(changes["nodes"], [])
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,330 @@
+"""In-memory adjacency (CSR) engine for answering neighbourhood queries without re-querying triples.
+
+Each graph's triples are loaded once into compressed sparse row arrays over interned node
+ids, in both directions (head -> triples, tail -> triples). Mutation services keep cached
+graphs in sync through `adjacency_cache.add_triples` / `remove_triples` and the cache
+evicts least recently used graphs once `ADJACENCY_CACHE_MAX_BYTES` is exceeded.
+
+NOTE
+----
+The cache is per process. When running several workers, `ADJACENCY_CACHE_TTL_SECONDS`
+bounds how long a worker can serve a graph that was mutated by another worker.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from bson import ObjectId
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from settings import settings
+
+# Rough per-entry cost of interned ObjectIds in Python lists/dicts
+_BYTES_PER_ID = 120
+
+
+def _build_csr(keys: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Builds (indptr, indices) such that indices[indptr[k]:indptr[k + 1]] are the
+    positions in `keys` equal to k."""
+    order = np.argsort(keys, kind="stable").astype(np.int32)
+    counts = np.bincount(keys, minlength=size)
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return indptr, order
+
+
+class GraphAdjacency:
+    """Adjacency of a single graph.
+
+    Triples are identified internally by their position ("triple index"). Nodes are
+    interned to dense integers. Triples added after the CSR arrays were built are kept
+    in small overlay lists and removed triples are tombstoned; the arrays are rebuilt
+    once the overlay grows past `ADJACENCY_COMPACT_THRESHOLD` of the graph size.
+    """
+
+    def __init__(self, triples: Iterable[Dict]):
+        self.node_ids: List[ObjectId] = []
+        self.node_index: Dict[ObjectId, int] = {}
+        self.triple_ids: List[ObjectId] = []
+        self.triple_index: Dict[ObjectId, int] = {}
+        self.edge_ids: List[ObjectId] = []
+        self.edge_index: Dict[ObjectId, int] = {}
+        heads, tails = [], []
+
+        for t in triples:
+            self._append(t, heads, tails)
+
+        self._heads = np.array(heads, dtype=np.int32)
+        self._tails = np.array(tails, dtype=np.int32)
+        self._removed: Set[int] = set()
+        self._compact()
+
+    def _intern(self, node_id: ObjectId) -> int:
+        index = self.node_index.get(node_id)
+        if index is None:
+            index = self.node_index[node_id] = len(self.node_ids)
+            self.node_ids.append(node_id)
+        return index
+
+    def _append(self, triple: Dict, heads: List[int], tails: List[int]) -> int:
+        index = len(self.triple_ids)
+        self.triple_ids.append(triple["_id"])
+        self.triple_index[triple["_id"]] = index
+        self.edge_ids.append(triple["edge"])
+        self.edge_index[triple["edge"]] = index
+        heads.append(self._intern(triple["head"]))
+        tails.append(self._intern(triple["tail"]))
+        return index
+
+    def _compact(self) -> None:
+        """(Re)builds the CSR arrays from all live triples."""
+        if self._removed:
+            live = [i for i in range(len(self.triple_ids)) if i not in self._removed]
+            triple_ids = [self.triple_ids[i] for i in live]
+            edge_ids = [self.edge_ids[i] for i in live]
+            heads = self._heads[live] if live else np.array([], dtype=np.int32)
+            tails = self._tails[live] if live else np.array([], dtype=np.int32)
+            self.triple_ids, self.edge_ids = triple_ids, edge_ids
+            self.triple_index = {_id: i for i, _id in enumerate(triple_ids)}
+            self.edge_index = {_id: i for i, _id in enumerate(edge_ids)}
+            self._heads, self._tails = heads, tails
+            self._removed = set()
+
+        n_nodes = len(self.node_ids)
+        self._out_indptr, self._out = _build_csr(self._heads, n_nodes)
+        self._in_indptr, self._in = _build_csr(self._tails, n_nodes)
+        self._csr_triples = len(self.triple_ids)
+        self._csr_nodes = n_nodes
+        self._extra: Dict[int, List[int]] = {}  # node index -> overlay triple indices
+
+    @property
+    def overlay_size(self) -> int:
+        return len(self.triple_ids) - self._csr_triples + len(self._removed)
+
+    def _maybe_compact(self) -> None:
+        threshold = max(
+            1024, int(self._csr_triples * settings.ADJACENCY_COMPACT_THRESHOLD)
+        )
+        if self.overlay_size > threshold:
+            self._compact()
+
+    def add_triples(self, triples: Iterable[Dict]) -> None:
+        """Adds triples ({_id, head, edge, tail}) to the adjacency."""
+        triples = list(triples)
+        # Re-added triples (e.g. reversed edges) replace their previous entry
+        self._remove(t["_id"] for t in triples)
+        heads, tails = [], []
+        for t in triples:
+            index = self._append(t, heads, tails)
+            for node in {heads[-1], tails[-1]}:
+                self._extra.setdefault(node, []).append(index)
+        if heads:
+            self._heads = np.concatenate([self._heads, np.array(heads, dtype=np.int32)])
+            self._tails = np.concatenate([self._tails, np.array(tails, dtype=np.int32)])
+        self._maybe_compact()
+
+    def remove_triples(self, triple_ids: Iterable[ObjectId]) -> None:
+        """Removes triples by their _id (unknown ids are ignored)."""
+        self._remove(triple_ids)
+        self._maybe_compact()
+
+    def _remove(self, triple_ids: Iterable[ObjectId]) -> None:
+        for triple_id in triple_ids:
+            index = self.triple_index.pop(triple_id, None)
+            if index is not None:
+                self.edge_index.pop(self.edge_ids[index], None)
+                self._removed.add(index)
+
+    def remove_edges(self, edge_ids: Iterable[ObjectId]) -> None:
+        """Removes the triples carrying the given edges."""
+        self.remove_triples(
+            self.triple_ids[self.edge_index[e]]
+            for e in edge_ids
+            if e in self.edge_index
+        )
+
+    def _incident(self, node: int) -> List[int]:
+        indices = []
+        if node < self._csr_nodes:
+            indices.extend(
+                self._out[self._out_indptr[node] : self._out_indptr[node + 1]].tolist()
+            )
+            indices.extend(
+                self._in[self._in_indptr[node] : self._in_indptr[node + 1]].tolist()
+            )
+        indices.extend(self._extra.get(node, ()))
+        # Self-referencing triples appear in both directions
+        return [i for i in dict.fromkeys(indices) if i not in self._removed]
+
+    def incident_triples(self, node_id: ObjectId) -> List[int]:
+        """Returns the triple indices where `node_id` is the head or tail."""
+        node = self.node_index.get(node_id)
+        return [] if node is None else self._incident(node)
+
+    def degree(self, node_id: ObjectId) -> int:
+        """Number of triples the node takes part in."""
+        return len(self.incident_triples(node_id))
+
+    def triple(self, index: int) -> Dict:
+        return {
+            "_id": self.triple_ids[index],
+            "head": self.node_ids[self._heads[index]],
+            "edge": self.edge_ids[index],
+            "tail": self.node_ids[self._tails[index]],
+        }
+
+    def triples(self) -> Iterator[Dict]:
+        """Yields every live triple."""
+        for index in self.triple_index.values():
+            yield self.triple(index)
+
+    def triples_for_nodes(self, node_ids: Iterable[ObjectId]) -> List[Dict]:
+        """Returns the distinct triples incident to any of the given nodes."""
+        indices = {}
+        for node_id in node_ids:
+            indices.update(dict.fromkeys(self.incident_triples(node_id)))
+        return [self.triple(i) for i in indices]
+
+    def triple_for_edge(self, edge_id: ObjectId) -> Optional[Dict]:
+        index = self.edge_index.get(edge_id)
+        return None if index is None else self.triple(index)
+
+    def neighbours(self, node_id: ObjectId) -> Tuple[Set[ObjectId], Set[ObjectId]]:
+        """Returns the (neighbour node ids, incident edge ids) of a node."""
+        node = self.node_index.get(node_id)
+        if node is None:
+            return set(), set()
+        nodes, edges = set(), set()
+        for i in self._incident(node):
+            head, tail = self._heads[i], self._tails[i]
+            nodes.add(self.node_ids[tail if head == node else head])
+            edges.add(self.edge_ids[i])
+        return nodes, edges
+
+    def neighbourhoods(self) -> Iterator[Tuple[ObjectId, Set[ObjectId], Set[ObjectId]]]:
+        """Yields (node id, neighbour node ids, incident edge ids) for every connected node."""
+        for node, node_id in enumerate(self.node_ids):
+            nodes, edges = self.neighbours(node_id)
+            if edges:
+                yield node_id, nodes, edges
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory used by the adjacency."""
+        arrays = (
+            self._heads,
+            self._tails,
+            self._out_indptr,
+            self._out,
+            self._in_indptr,
+            self._in,
+        )
+        interned = len(self.node_ids) + 2 * len(self.triple_ids)
+        return sum(a.nbytes for a in arrays) + interned * _BYTES_PER_ID
+
+
+class AdjacencyCache:
+    """LRU cache of `GraphAdjacency` objects bounded by an approximate memory budget."""
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._graphs: "OrderedDict[ObjectId, Tuple[GraphAdjacency, float]]" = (
+            OrderedDict()
+        )
+        self._locks: Dict[ObjectId, asyncio.Lock] = {}
+        # Bumped on every mutation so loads racing a mutation are not cached
+        self._generations: Dict[ObjectId, int] = {}
+
+    async def get(self, graph_id: ObjectId, db: AsyncIOMotorDatabase) -> GraphAdjacency:
+        """Returns the adjacency of a graph, loading it from the triples collection if needed."""
+        graph_id = ObjectId(graph_id)
+        cached = self._lookup(graph_id)
+        if cached is not None:
+            return cached
+
+        lock = self._locks.setdefault(graph_id, asyncio.Lock())
+        async with lock:
+            cached = self._lookup(graph_id)
+            if cached is not None:
+                return cached
+
+            generation = self._generations.get(graph_id, 0)
+            triples = (
+                await db["triples"]
+                .find(
+                    {"graph_id": graph_id}, {"_id": 1, "head": 1, "edge": 1, "tail": 1}
+                )
+                .to_list(None)
+            )
+            adjacency = GraphAdjacency(triples)
+
+            if self._generations.get(graph_id, 0) == generation:
+                self._store(graph_id, adjacency)
+            logger.debug(
+                "Loaded adjacency for graph {} ({} triples, ~{} bytes)",
+                graph_id,
+                len(triples),
+                adjacency.nbytes,
+            )
+            return adjacency
+
+    def _lookup(self, graph_id: ObjectId) -> Optional[GraphAdjacency]:
+        entry = self._graphs.get(graph_id)
+        if entry is None:
+            return None
+        adjacency, loaded_at = entry
+        if time.monotonic() - loaded_at > self.ttl_seconds:
+            del self._graphs[graph_id]
+            return None
+        self._graphs.move_to_end(graph_id)
+        return adjacency
+
+    def _store(self, graph_id: ObjectId, adjacency: GraphAdjacency) -> None:
+        self._graphs[graph_id] = (adjacency, time.monotonic())
+        self._graphs.move_to_end(graph_id)
+        self._evict()
+
+    def _evict(self) -> None:
+        total = sum(a.nbytes for a, _ in self._graphs.values())
+        # Always keep the most recently used graph, even if it exceeds the budget alone
+        while total > self.max_bytes and len(self._graphs) > 1:
+            evicted_id, (evicted, _) = self._graphs.popitem(last=False)
+            total -= evicted.nbytes
+            logger.debug("Evicted adjacency for graph {}", evicted_id)
+
+    def _mutated(self, graph_id: ObjectId) -> Optional[GraphAdjacency]:
+        graph_id = ObjectId(graph_id)
+        self._generations[graph_id] = self._generations.get(graph_id, 0) + 1
+        entry = self._graphs.get(graph_id)
+        return None if entry is None else entry[0]
+
+    def add_triples(self, graph_id: ObjectId, triples: Iterable[Dict]) -> None:
+        """Adds newly inserted triples ({_id, head, edge, tail}) to a cached graph."""
+        adjacency = self._mutated(graph_id)
+        if adjacency is not None:
+            adjacency.add_triples(triples)
+            self._evict()
+
+    def remove_triples(
+        self, graph_id: ObjectId, triple_ids: Iterable[ObjectId]
+    ) -> None:
+        """Removes deleted triples from a cached graph."""
+        adjacency = self._mutated(graph_id)
+        if adjacency is not None:
+            adjacency.remove_triples(triple_ids)
+
+    def invalidate(self, graph_id: ObjectId) -> None:
+        """Drops a graph from the cache (e.g. when the graph is deleted)."""
+        self._mutated(graph_id)
+        self._graphs.pop(ObjectId(graph_id), None)
+
+
+adjacency_cache = AdjacencyCache(
+    max_bytes=settings.ADJACENCY_CACHE_MAX_BYTES,
+    ttl_seconds=settings.ADJACENCY_CACHE_TTL_SECONDS,
+)
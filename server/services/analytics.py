@@ -0,0 +1,371 @@
+"""Graph-level analytics: degrees, weakly connected components, PageRank and class counts.
+
+A graph's triples are loaded into a SciPy sparse adjacency matrix over the graph's
+nodes (multi-edges summed), from which every statistic is computed with vectorized
+NumPy/SciPy operations:
+
+- in, out and total degree distributions (summary, log2 histogram), the highest
+  degree nodes ("hubs") and the nodes without triples ("isolated")
+- weakly connected components (`scipy.sparse.csgraph.connected_components`)
+- PageRank by power iteration, with the rank of dangling nodes spread uniformly
+- node and edge counts per class, with their active and reviewed items (and the
+  mean degree of nodes)
+
+Results are cached per graph version (see `services.versions`): they are computed
+once and served until the graph changes.
+"""
+
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from settings import settings
+from services.versions import get_graph_version
+
+PAGERANK_DAMPING = 0.85
+PAGERANK_TOLERANCE = 1e-6
+PAGERANK_MAX_ITERATIONS = 100
+
+
+def _summary(values: np.ndarray) -> Dict:
+    if not len(values):
+        return {"min": 0, "max": 0, "mean": 0.0, "median": 0.0, "p90": 0.0}
+    return {
+        "min": int(values.min()),
+        "max": int(values.max()),
+        "mean": float(values.mean()),
+        "median": float(np.median(values)),
+        "p90": float(np.percentile(values, 90)),
+    }
+
+
+def _histogram(degrees: np.ndarray) -> List[Dict]:
+    """Counts degrees in the buckets 0, 1, 2-3, 4-7, ... (empty buckets omitted)."""
+    buckets = np.zeros(len(degrees), dtype=np.int64)
+    positive = degrees > 0
+    buckets[positive] = np.floor(np.log2(degrees[positive])).astype(np.int64) + 1
+    counts = np.bincount(buckets)
+    return [
+        {
+            "min": 0 if b == 0 else 2 ** (b - 1),
+            "max": 0 if b == 0 else 2**b - 1,
+            "count": int(count),
+        }
+        for b, count in enumerate(counts)
+        if count
+    ]
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indexes of the `k` highest scores in descending order."""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.array([], dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def pagerank(
+    adjacency: sparse.csr_matrix,
+    damping: float = PAGERANK_DAMPING,
+    tolerance: float = PAGERANK_TOLERANCE,
+    max_iterations: int = PAGERANK_MAX_ITERATIONS,
+) -> Tuple[np.ndarray, int, bool]:
+    """Returns the PageRank of each node, the iterations run and whether it converged.
+
+    Converges when the L1 change of the ranks is below `n * tolerance` (as networkx).
+    """
+    n = adjacency.shape[0]
+    if n == 0:
+        return np.zeros(0), 0, True
+    out_weight = np.asarray(adjacency.sum(axis=1)).ravel()
+    dangling = out_weight == 0
+    inverse = np.divide(1.0, out_weight, out=np.zeros(n), where=~dangling)
+    # transition[i, j]: probability of moving from i to j
+    transition_t = (sparse.diags(inverse) @ adjacency).T.tocsr()
+
+    ranks = np.full(n, 1.0 / n)
+    for iteration in range(1, max_iterations + 1):
+        previous = ranks
+        ranks = damping * (transition_t @ previous + previous[dangling].sum() / n)
+        ranks += (1.0 - damping) / n
+        if np.abs(ranks - previous).sum() < n * tolerance:
+            return ranks, iteration, True
+    return ranks, max_iterations, False
+
+
+def compute_analytics(
+    nodes: List[Dict],
+    edges: List[Dict],
+    triples: List[Dict],
+    node_classes: List[Dict],
+    edge_classes: List[Dict],
+    top_k: int = 10,
+) -> Dict:
+    """Computes the analytics of a graph from its items.
+
+    `nodes` are {_id, name, type, is_active, is_reviewed}, `edges` {_id, type,
+    is_active} and `triples` {head, edge, tail}; triples whose nodes or edge are not
+    among them are ignored. Classes are the graph's `node_classes`/`edge_classes`.
+    """
+    n = len(nodes)
+    node_index = {node["_id"]: i for i, node in enumerate(nodes)}
+    edge_index = {edge["_id"]: i for i, edge in enumerate(edges)}
+    heads = np.fromiter(
+        (node_index.get(t["head"], -1) for t in triples), np.int64, len(triples)
+    )
+    tails = np.fromiter(
+        (node_index.get(t["tail"], -1) for t in triples), np.int64, len(triples)
+    )
+    edge_positions = np.fromiter(
+        (edge_index.get(t["edge"], -1) for t in triples), np.int64, len(triples)
+    )
+    known = (heads >= 0) & (tails >= 0) & (edge_positions >= 0)
+    heads, tails, edge_positions = heads[known], tails[known], edge_positions[known]
+
+    adjacency = sparse.csr_matrix((np.ones(len(heads)), (heads, tails)), shape=(n, n))
+    out_degree = np.bincount(heads, minlength=n)
+    in_degree = np.bincount(tails, minlength=n)
+    degree = out_degree + in_degree
+
+    def describe(i: int, **values) -> Dict:
+        node = nodes[i]
+        return {
+            "_id": node["_id"],
+            "name": node.get("name"),
+            "type": node.get("type"),
+            **values,
+        }
+
+    isolated = np.flatnonzero(degree == 0)
+    hubs = [
+        describe(
+            i,
+            degree=int(degree[i]),
+            in_degree=int(in_degree[i]),
+            out_degree=int(out_degree[i]),
+        )
+        for i in _top(degree, top_k)
+        if degree[i] > 0
+    ]
+
+    n_components, labels = (
+        connected_components(adjacency, directed=True, connection="weak")
+        if n
+        else (0, np.zeros(0, dtype=np.int32))
+    )
+    component_sizes = np.sort(np.bincount(labels, minlength=n_components))[::-1]
+
+    ranks, iterations, converged = pagerank(adjacency)
+
+    node_types = _class_positions(nodes, node_classes)
+    edge_types = _class_positions(edges, edge_classes)
+
+    return {
+        "nodes": n,
+        "edges": len(edges),
+        "triples": int(len(heads)),
+        "density": float(len(heads) / (n * (n - 1))) if n > 1 else 0.0,
+        "degree": {
+            "total": {**_summary(degree), "histogram": _histogram(degree)},
+            "in": {**_summary(in_degree), "histogram": _histogram(in_degree)},
+            "out": {**_summary(out_degree), "histogram": _histogram(out_degree)},
+        },
+        "hubs": hubs,
+        "isolated": {
+            "count": int(len(isolated)),
+            "nodes": [describe(i) for i in isolated[:top_k]],
+        },
+        "components": {
+            "count": int(n_components),
+            "largest": int(component_sizes[0]) if n else 0,
+            "largest_fraction": float(component_sizes[0] / n) if n else 0.0,
+            "singletons": int((component_sizes == 1).sum()),
+            "sizes": component_sizes[:top_k].tolist(),
+        },
+        "pagerank": {
+            "iterations": iterations,
+            "converged": converged,
+            "top": [describe(i, score=float(ranks[i])) for i in _top(ranks, top_k)],
+        },
+        "node_classes": _class_counts(nodes, node_classes, node_types, degree=degree),
+        "edge_classes": _class_counts(edges, edge_classes, edge_types),
+    }
+
+
+def _class_positions(items: List[Dict], classes: List[Dict]) -> np.ndarray:
+    """Index of each item's class in `classes` (len(classes) for unknown classes)."""
+    positions = {c["_id"]: i for i, c in enumerate(classes)}
+    return np.fromiter(
+        (positions.get(item.get("type"), len(classes)) for item in items),
+        np.int64,
+        len(items),
+    )
+
+
+def _class_counts(
+    items: List[Dict],
+    classes: List[Dict],
+    types: np.ndarray,
+    degree: Optional[np.ndarray] = None,
+) -> List[Dict]:
+    """Counts the items (and active/reviewed items) of each class.
+
+    Items of classes missing from `classes` are counted under `_id` None.
+    """
+    size = len(classes) + 1
+
+    def flag(field: str) -> np.ndarray:
+        return np.fromiter(
+            (bool(item.get(field)) for item in items), np.float64, len(items)
+        )
+
+    counts = np.bincount(types, minlength=size)
+    active = np.bincount(types, weights=flag("is_active"), minlength=size)
+    reviewed = np.bincount(types, weights=flag("is_reviewed"), minlength=size)
+    degrees = (
+        None if degree is None else np.bincount(types, weights=degree, minlength=size)
+    )
+
+    result = []
+    for i in range(size):
+        if i == len(classes) and not counts[i]:
+            continue
+        entry = {
+            "_id": classes[i]["_id"] if i < len(classes) else None,
+            "name": classes[i].get("name") if i < len(classes) else None,
+            "count": int(counts[i]),
+            "active": int(active[i]),
+            "reviewed": int(reviewed[i]),
+        }
+        if degrees is not None:
+            entry["mean_degree"] = float(degrees[i] / counts[i]) if counts[i] else 0.0
+        result.append(entry)
+    return result
+
+
+async def load_analytics(
+    graph_id: ObjectId,
+    db: AsyncIOMotorDatabase,
+    active_only: bool = False,
+    top_k: int = 10,
+) -> Optional[Dict]:
+    """Reads a graph's items and computes its analytics (None if it does not exist).
+
+    With `active_only` deactivated nodes and edges (and their triples) are left out.
+    """
+    graph = await db["graphs"].find_one(
+        {"_id": graph_id}, {"node_classes": 1, "edge_classes": 1}
+    )
+    if graph is None:
+        return None
+    query = {"graph_id": graph_id}
+    if active_only:
+        query["is_active"] = True
+    nodes = (
+        await db["nodes"]
+        .find(query, {"name": 1, "type": 1, "is_active": 1, "is_reviewed": 1})
+        .to_list(None)
+    )
+    edges = (
+        await db["edges"]
+        .find(query, {"type": 1, "is_active": 1, "is_reviewed": 1})
+        .to_list(None)
+    )
+    triples = (
+        await db["triples"]
+        .find({"graph_id": graph_id}, {"_id": 0, "head": 1, "edge": 1, "tail": 1})
+        .to_list(None)
+    )
+    return compute_analytics(
+        nodes=nodes,
+        edges=edges,
+        triples=triples,
+        node_classes=graph.get("node_classes", []),
+        edge_classes=graph.get("edge_classes", []),
+        top_k=top_k,
+    )
+
+
+class AnalyticsCache:
+    """LRU of computed analytics keyed by graph and parameters, valid for one version."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # (graph id, parameters) -> (version, analytics)
+        self._results: "OrderedDict[Tuple[ObjectId, Hashable], Tuple[int, Dict]]" = (
+            OrderedDict()
+        )
+        self._locks: Dict[Tuple[ObjectId, Hashable], asyncio.Lock] = {}
+
+    def _lookup(self, key: Tuple[ObjectId, Hashable], version: int) -> Optional[Dict]:
+        entry = self._results.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        self._results.move_to_end(key)
+        return entry[1]
+
+    async def get(
+        self,
+        graph_id: ObjectId,
+        db: AsyncIOMotorDatabase,
+        active_only: bool = False,
+        top_k: int = 10,
+    ) -> Optional[Dict]:
+        """Returns the analytics of the current version of a graph (see `load_analytics`).
+
+        The result carries the `version` it was computed for.
+        """
+        graph_id = ObjectId(graph_id)
+        version = await get_graph_version(graph_id=graph_id, db=db)
+        if version is None:
+            return None
+        key = (graph_id, (active_only, top_k))
+        analytics = self._lookup(key, version)
+        if analytics is not None:
+            return analytics
+
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            analytics = self._lookup(key, version)
+            if analytics is not None:
+                return analytics
+
+            analytics = await load_analytics(
+                graph_id=graph_id, db=db, active_only=active_only, top_k=top_k
+            )
+            if analytics is None:
+                return None
+            # Items read after a concurrent change are tagged with the older version,
+            # so the next request after that change recomputes them
+            analytics = {"version": version, **analytics}
+            self._results[key] = (version, analytics)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+            logger.debug(
+                "Computed analytics for graph {} version {} ({} nodes, {} triples)",
+                graph_id,
+                version,
+                analytics["nodes"],
+                analytics["triples"],
+            )
+            return analytics
+
+    def invalidate(self, graph_id: ObjectId) -> None:
+        """Drops the analytics of a graph (e.g. when the graph is deleted)."""
+        graph_id = ObjectId(graph_id)
+        for key in [key for key in self._results if key[0] == graph_id]:
+            del self._results[key]
+        for key in [key for key in self._locks if key[0] == graph_id]:
+            if not self._locks[key].locked():
+                del self._locks[key]
+
+
+analytics_cache = AnalyticsCache(max_entries=settings.ANALYTICS_CACHE_MAX_ENTRIES)
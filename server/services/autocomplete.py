@@ -0,0 +1,129 @@
+"""Node name autocomplete.
+
+Each graph gets an in-memory index of its distinct node (name, type) pairs kept in
+case-folded sorted order, overall and per node type. Completing a prefix is a binary
+search followed by reading the next `limit` entries, so a lookup costs O(log n + k)
+however large the graph is, and only the matches are sent to the client. Services
+that create, rename or remove nodes call `name_index.refresh` with the affected node
+ids so cached indexes stay in sync (see `services.node_index`).
+"""
+
+import bisect
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from settings import settings
+from services.node_index import NodeIndexCache
+
+_PROJECTION = {"_id": 1, "name": 1, "type": 1}
+
+# (case-folded name, name, type) - sorted so prefix matches are contiguous
+Key = Tuple[str, str, ObjectId]
+
+
+def _key(name: str, node_type: ObjectId) -> Key:
+    return (name.casefold(), name, node_type)
+
+
+class GraphNameIndex:
+    """Sorted node names of a single graph."""
+
+    def __init__(self, nodes: Iterable[Dict]):
+        self._nodes: Dict[ObjectId, Tuple[str, ObjectId]] = {}
+        self._counts: Dict[Tuple[str, ObjectId], int] = {}
+        for node in nodes:
+            self._count(node["_id"], node.get("name") or "", node.get("type"))
+        self._keys: List[Key] = sorted(_key(*pair) for pair in self._counts)
+        self._by_type: Dict[ObjectId, List[Key]] = {}
+        for key in self._keys:
+            self._by_type.setdefault(key[2], []).append(key)
+
+    def _count(self, node_id: ObjectId, name: str, node_type: ObjectId) -> bool:
+        """Records a node; returns True if its (name, type) is new."""
+        self._nodes[node_id] = (name, node_type)
+        count = self._counts.get((name, node_type), 0)
+        self._counts[(name, node_type)] = count + 1
+        return count == 0
+
+    def _uncount(self, node_id: ObjectId) -> Optional[Tuple[str, ObjectId]]:
+        """Forgets a node; returns its (name, type) if no other node has it."""
+        pair = self._nodes.pop(node_id, None)
+        if pair is None:
+            return None
+        self._counts[pair] -= 1
+        if self._counts[pair]:
+            return None
+        del self._counts[pair]
+        return pair
+
+    def update(
+        self, nodes: Iterable[Dict] = (), removed_node_ids: Iterable[ObjectId] = ()
+    ) -> None:
+        """Adds/renames `nodes` and forgets the removed nodes."""
+        nodes = list(nodes)
+        for node_id in [*removed_node_ids, *(n["_id"] for n in nodes)]:
+            pair = self._uncount(node_id)
+            if pair is not None:
+                key = _key(*pair)
+                for keys in (self._keys, self._by_type[pair[1]]):
+                    del keys[bisect.bisect_left(keys, key)]
+        for node in nodes:
+            name, node_type = node.get("name") or "", node.get("type")
+            if self._count(node["_id"], name, node_type):
+                key = _key(name, node_type)
+                bisect.insort(self._keys, key)
+                bisect.insort(self._by_type.setdefault(node_type, []), key)
+
+    def complete(
+        self, prefix: str, limit: int, node_type: Optional[ObjectId] = None
+    ) -> List[Tuple[str, ObjectId]]:
+        """Returns up to `limit` (name, type) pairs whose name starts with `prefix`.
+
+        Matching ignores case; results are ordered alphabetically, so exact matches
+        come first.
+        """
+        keys = self._keys if node_type is None else self._by_type.get(node_type, [])
+        folded = prefix.casefold()
+        start = bisect.bisect_left(keys, (folded,))
+        matches = []
+        for key in keys[start : start + limit]:
+            if not key[0].startswith(folded):
+                break
+            matches.append((key[1], key[2]))
+        return matches
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class NameIndexCache(NodeIndexCache[GraphNameIndex]):
+    """LRU cache of per-graph name indexes, loaded on first use."""
+
+    def __init__(self, max_graphs: int, ttl_seconds: float):
+        super().__init__(
+            name="name",
+            build=GraphNameIndex,
+            projection=_PROJECTION,
+            max_graphs=max_graphs,
+            ttl_seconds=ttl_seconds,
+        )
+
+    async def complete(
+        self,
+        graph_id: ObjectId,
+        db: AsyncIOMotorDatabase,
+        prefix: str,
+        limit: int,
+        node_type: Optional[ObjectId] = None,
+    ) -> List[Tuple[str, ObjectId]]:
+        """Returns up to `limit` (name, type) pairs of a graph starting with `prefix`."""
+        index = await self.get(graph_id=graph_id, db=db)
+        return index.complete(prefix=prefix, limit=limit, node_type=node_type)
+
+
+name_index = NameIndexCache(
+    max_graphs=settings.NAME_INDEX_MAX_GRAPHS,
+    ttl_seconds=settings.NAME_INDEX_TTL_SECONDS,
+)
@@ -0,0 +1,312 @@
+"""Services for applying review, activation, acknowledgement and merge changes to many items at once"""
+
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from loguru import logger
+
+from settings import settings
+from models.misc import (
+    BulkAcknowledgeBody,
+    BulkActivationBody,
+    BulkItemFilter,
+    BulkMergeBody,
+    BulkReviewBody,
+)
+from services.issue_store import (
+    acknowledge_issue_documents,
+    has_open_issues_query,
+    uses_issue_collection,
+)
+from services.item import set_activation
+from services.merge import merge_node_clusters
+from services.review_queue import review_queue
+from services.versions import bump_graph_version
+
+
+def _too_many_items() -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail=f"At most {settings.BULK_MAX_ITEMS} items can be updated at once",
+    )
+
+
+def build_item_query(
+    graph_id: ObjectId,
+    item_ids: Optional[List[str]] = None,
+    item_filter: Optional[BulkItemFilter] = None,
+) -> Dict:
+    """Builds the query selecting a graph's items by id or by filter.
+
+    Raises HTTPException (400) if too many ids are given. The name pattern is matched
+    literally (case-insensitive substring).
+    """
+    query = {"graph_id": graph_id}
+
+    if item_ids is not None:
+        if len(item_ids) > settings.BULK_MAX_ITEMS:
+            raise _too_many_items()
+        query["_id"] = {"$in": [ObjectId(_id) for _id in item_ids]}
+        return query
+
+    if item_filter.type is not None:
+        query["type"] = ObjectId(item_filter.type)
+    if item_filter.name_pattern is not None:
+        query["name"] = {"$regex": re.escape(item_filter.name_pattern), "$options": "i"}
+    for is_error, flag in [
+        (True, item_filter.has_errors),
+        (False, item_filter.has_suggestions),
+    ]:
+        if flag is not None:
+            query.setdefault("$and", []).append(has_open_issues_query(is_error, flag))
+    if item_filter.is_reviewed is not None:
+        query["is_reviewed"] = item_filter.is_reviewed
+    if item_filter.is_active is not None:
+        query["is_active"] = item_filter.is_active
+    return query
+
+
+async def _matching_ids(collection, query: Dict) -> List[ObjectId]:
+    """Returns the ids of the items matching a query.
+
+    Raises HTTPException (400) if a filter selects more than `BULK_MAX_ITEMS` items,
+    so updates by id stay well below the command size limit.
+    """
+    limit = settings.BULK_MAX_ITEMS
+    items = await collection.find(query, {"_id": 1}).limit(limit + 1).to_list(None)
+    if len(items) > limit:
+        raise _too_many_items()
+    return [d["_id"] for d in items]
+
+
+async def bulk_review(
+    graph_id: ObjectId, data: BulkReviewBody, db: AsyncIOMotorDatabase
+) -> Dict:
+    """Sets the review state of many nodes or edges with a single update.
+
+    Returns the ids of the updated items and the change in reviewed node/edge counts.
+    """
+    try:
+        collection = db["nodes" if data.is_node else "edges"]
+        query = build_item_query(graph_id, data.item_ids, data.filter)
+        query["is_reviewed"] = {"$ne": data.is_reviewed}
+
+        updated_ids = await _matching_ids(collection, query)
+        result = await collection.update_many(
+            {"_id": {"$in": updated_ids}},
+            {
+                "$set": {
+                    "is_reviewed": data.is_reviewed,
+                    "updated_at": datetime.utcnow(),
+                }
+            },
+        )
+
+        await review_queue.refresh(
+            graph_id=graph_id,
+            db=db,
+            node_ids=updated_ids if data.is_node else [],
+            edge_ids=[] if data.is_node else updated_ids,
+        )
+        if result.modified_count:
+            await bump_graph_version(
+                graph_id=graph_id,
+                db=db,
+                changes={"nodes" if data.is_node else "edges": updated_ids},
+            )
+
+        diff = result.modified_count * (1 if data.is_reviewed else -1)
+        return {
+            "items_updated": result.modified_count,
+            "updated_ids": [str(_id) for _id in updated_ids],
+            "node_diff": diff if data.is_node else 0,
+            "edge_diff": 0 if data.is_node else diff,
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to bulk review items: {e}")
+        raise HTTPException(status_code=500)
+
+
+async def bulk_activation(
+    graph_id: ObjectId, data: BulkActivationBody, db: AsyncIOMotorDatabase
+) -> Dict:
+    """Sets the activation state of many nodes or edges.
+
+    Connected edges and orphaned nodes are deactivated as for single items (see
+    `services.item.set_activation`).
+    """
+    try:
+        collection = db["nodes" if data.is_node else "edges"]
+        query = build_item_query(graph_id, data.item_ids, data.filter)
+
+        updated_ids, orphan_nodes, orphan_edges = await set_activation(
+            graph_id=graph_id,
+            item_ids=await _matching_ids(collection, query),
+            is_node=data.is_node,
+            new_state=data.is_active,
+            db=db,
+        )
+
+        return {
+            "items_updated": len(updated_ids),
+            "updated_ids": [str(_id) for _id in updated_ids],
+            "updated_node_ids": [str(_id) for _id in orphan_nodes],
+            "updated_edge_ids": [str(_id) for _id in orphan_edges],
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to bulk update item activation: {e}")
+        raise HTTPException(status_code=500)
+
+
+async def bulk_acknowledge(
+    graph_id: ObjectId, data: BulkAcknowledgeBody, db: AsyncIOMotorDatabase
+) -> Dict:
+    """Acknowledges many errors or suggestions in one round trip.
+
+    Explicit (item, error/suggestion) pairs are sent as a single unordered `bulk_write`;
+    with a filter every error/suggestion on the matching items is acknowledged.
+    """
+    try:
+        array_name = "errors" if data.is_error else "suggestions"
+        collection = db["nodes" if data.is_node else "edges"]
+
+        if data.items is not None:
+            if len(data.items) > settings.BULK_MAX_ITEMS:
+                raise _too_many_items()
+            item_ids = list({ObjectId(i.item_id) for i in data.items})
+            if uses_issue_collection():
+                modified = await acknowledge_issue_documents(
+                    db,
+                    is_node=data.is_node,
+                    is_error=data.is_error,
+                    item_ids=await _matching_ids(
+                        collection, {"graph_id": graph_id, "_id": {"$in": item_ids}}
+                    ),
+                    issue_ids=[
+                        ObjectId(i.error_or_suggestion_item_id) for i in data.items
+                    ],
+                )
+            else:
+                requests = [
+                    UpdateOne(
+                        {
+                            "_id": ObjectId(i.item_id),
+                            "graph_id": graph_id,
+                            f"{array_name}.id": ObjectId(i.error_or_suggestion_item_id),
+                        },
+                        {
+                            "$set": {f"{array_name}.$.acknowledged": True},
+                            "$currentDate": {f"{array_name}.$.updated_at": True},
+                        },
+                    )
+                    for i in data.items
+                ]
+                modified = (
+                    (
+                        await collection.bulk_write(requests, ordered=False)
+                    ).modified_count
+                    if requests
+                    else 0
+                )
+        else:
+            query = build_item_query(graph_id, item_filter=data.filter)
+            query.setdefault("$and", []).append(
+                has_open_issues_query(data.is_error, True)
+            )
+            item_ids = await _matching_ids(collection, query)
+            if uses_issue_collection():
+                modified = await acknowledge_issue_documents(
+                    db, is_node=data.is_node, is_error=data.is_error, item_ids=item_ids
+                )
+            else:
+                result = await collection.update_many(
+                    {"_id": {"$in": item_ids}},
+                    {
+                        "$set": {f"{array_name}.$[].acknowledged": True},
+                        "$currentDate": {f"{array_name}.$[].updated_at": True},
+                    },
+                )
+                modified = result.modified_count
+
+        await review_queue.refresh(
+            graph_id=graph_id,
+            db=db,
+            node_ids=item_ids if data.is_node else [],
+            edge_ids=[] if data.is_node else item_ids,
+        )
+        if modified:
+            await bump_graph_version(
+                graph_id=graph_id,
+                db=db,
+                changes={"nodes" if data.is_node else "edges": item_ids},
+            )
+
+        return {"items_acknowledged": modified}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to bulk acknowledge items: {e}")
+        raise HTTPException(status_code=500)
+
+
+async def bulk_merge(
+    graph_id: ObjectId, data: BulkMergeBody, db: AsyncIOMotorDatabase
+) -> Dict:
+    """Merges many clusters of duplicate nodes at once.
+
+    Clusters must not share nodes. All edge/triple rewrites are planned in memory and
+    written with a handful of bulk operations (see `services.merge`).
+    """
+    try:
+        clusters = [[ObjectId(_id) for _id in c.node_ids] for c in data.clusters]
+        node_ids = [_id for cluster in clusters for _id in cluster]
+        if len(node_ids) > settings.BULK_MAX_MERGE_NODES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {settings.BULK_MAX_MERGE_NODES} nodes can be merged at once",
+            )
+        if len(set(node_ids)) != len(node_ids):
+            raise HTTPException(
+                status_code=400, detail="Merge clusters must not share nodes"
+            )
+
+        nodes = {
+            n["_id"]: n
+            for n in await db["nodes"]
+            .find({"_id": {"$in": node_ids}, "graph_id": graph_id})
+            .to_list(None)
+        }
+        missing = [str(_id) for _id in node_ids if _id not in nodes]
+        if missing:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Unable to merge nodes - nodes not found: {', '.join(missing)}",
+            )
+
+        merged = await merge_node_clusters(
+            graph_id=graph_id,
+            clusters=[[nodes[_id] for _id in cluster] for cluster in clusters],
+            names=[
+                {
+                    "name": c.name,
+                    "type": None if c.type is None else ObjectId(c.type),
+                }
+                for c in data.clusters
+            ],
+            db=db,
+        )
+        return {"items_merged": len(merged), "merged": merged}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to bulk merge nodes: {e}")
+        raise HTTPException(status_code=500)
@@ -0,0 +1,285 @@
+"""Per-class node and edge counters maintained at write time.
+
+The graph document carries `class_stats`:
+
+    {"nodes": {<class id>: {"count", "active", "reviewed", "erroring"}}, "edges": {...}}
+
+with the number of items of each class and of those that are active, reviewed or have
+open errors. Every node/edge records the key it is counted under in
+`class_stats_key` ([type, is_active, is_reviewed, is_erroring]).
+
+`bump_graph_version` hands the ids of the items a change touched to
+`update_class_stats`, which re-reads them and moves the items whose key changed
+between counters. Items moving from the same previous key to the same new key are
+moved with one conditional update on their recorded key, so an item changed
+concurrently is counted once by whichever update moved it. Ingest counts items as
+they are inserted (`ClassStats`) and merges discount the items they delete with
+`discount_class_stats`.
+
+Changes logged as resets drop the counters; `get_class_stats` recounts them from the
+items on the next read, as for graphs created before the counters existed.
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from services.issue_store import count_field, issue_array, issue_count
+
+STATS_FIELD = "class_stats"
+KEY_FIELD = "class_stats_key"
+KINDS = ("nodes", "edges")
+COUNTERS = ("count", "active", "reviewed", "erroring")
+UNTYPED = "untyped"  # Items without a type
+
+PROJECTION = {
+    "type": 1,
+    "is_active": 1,
+    "is_reviewed": 1,
+    KEY_FIELD: 1,
+    issue_array(is_error=True): 1,
+    count_field(is_error=True, open_only=True): 1,
+}
+
+# (type, is_active, is_reviewed, is_erroring)
+Key = Tuple[Optional[ObjectId], bool, bool, bool]
+
+
+def stat_key(doc: Dict) -> Key:
+    """Returns the counters an item (node/edge document) belongs to."""
+    return (
+        doc.get("type"),
+        bool(doc.get("is_active")),
+        bool(doc.get("is_reviewed")),
+        issue_count(doc, is_error=True, open_only=True) > 0,
+    )
+
+
+def _recorded_key(doc: Dict) -> Optional[Key]:
+    key = doc.get(KEY_FIELD)
+    return None if key is None else tuple(key)
+
+
+def _counter_paths(kind: str, key: Key) -> List[str]:
+    """Dotted paths (below `class_stats`) of the counters an item key adds to."""
+    prefix = f"{kind}.{UNTYPED if key[0] is None else key[0]}"
+    flags = zip(COUNTERS[1:], key[1:])
+    return [f"{prefix}.count"] + [f"{prefix}.{name}" for name, flag in flags if flag]
+
+
+class ClassStats:
+    """Counts items into per-class counters (e.g. while ingesting a graph)."""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = defaultdict(int)
+
+    def add(self, kind: str, doc: Dict) -> Key:
+        """Counts an item and returns its key."""
+        key = stat_key(doc)
+        for path in _counter_paths(kind, key):
+            self.counters[path] += 1
+        return key
+
+    def mark(self, kind: str, docs: Iterable[Dict]) -> None:
+        """Counts items about to be inserted and records their key on them."""
+        for doc in docs:
+            doc[KEY_FIELD] = list(self.add(kind, doc))
+
+    def document(self) -> Dict:
+        """The counters as stored on the graph document."""
+        stats = {kind: {} for kind in KINDS}
+        for path, value in self.counters.items():
+            kind, class_id, counter = path.split(".")
+            counters = stats[kind].setdefault(class_id, dict.fromkeys(COUNTERS, 0))
+            counters[counter] = value
+        return stats
+
+    def increments(self) -> Dict[str, int]:
+        """The counters as an `$inc` of the graph document."""
+        return {f"{STATS_FIELD}.{p}": v for p, v in self.counters.items() if v}
+
+
+def counts_changes(changes: Optional[Dict[str, Iterable]]) -> bool:
+    """Whether `changes` (see `update_class_stats`) can move items between counters.
+
+    Changes to triples or to the graph document alone never do.
+    """
+    return changes is None or any(changes.get(kind) for kind in KINDS)
+
+
+async def set_class_stats(
+    graph_id: ObjectId, db: AsyncIOMotorDatabase, stats: ClassStats
+) -> None:
+    await db["graphs"].update_one(
+        {"_id": graph_id}, {"$set": {STATS_FIELD: stats.document()}}
+    )
+
+
+async def _increment(
+    graph_id: ObjectId, db: AsyncIOMotorDatabase, stats: ClassStats
+) -> None:
+    increments = stats.increments()
+    if increments:
+        # Counters dropped meanwhile are recounted rather than partially recreated
+        await db["graphs"].update_one(
+            {"_id": graph_id, STATS_FIELD: {"$exists": True}}, {"$inc": increments}
+        )
+
+
+async def update_class_stats(
+    graph_id: ObjectId,
+    db: AsyncIOMotorDatabase,
+    changes: Optional[Dict[str, Iterable]],
+) -> None:
+    """Updates the counters of a graph after its "nodes"/"edges" in `changes` changed.
+
+    Without `changes` (a reset) the counters are dropped to be recounted on next read.
+    """
+    if changes is None:
+        await db["graphs"].update_one({"_id": graph_id}, {"$unset": {STATS_FIELD: ""}})
+        return
+    if not counts_changes(changes):
+        return
+    counted = await db["graphs"].find_one(
+        {"_id": graph_id, STATS_FIELD: {"$exists": True}}, {"_id": 1}
+    )
+    if counted is None:
+        return
+
+    stats = ClassStats()
+    for kind in KINDS:
+        item_ids = list({ObjectId(_id) for _id in changes.get(kind) or []})
+        if not item_ids:
+            continue
+        docs = (
+            await db[kind]
+            .find({"_id": {"$in": item_ids}, "graph_id": graph_id}, PROJECTION)
+            .to_list(None)
+        )
+        moves = defaultdict(list)
+        for doc in docs:
+            previous, current = _recorded_key(doc), stat_key(doc)
+            if previous != current:
+                moves[(previous, current)].append(doc["_id"])
+
+        for (previous, current), ids in moves.items():
+            result = await db[kind].update_many(
+                {
+                    "_id": {"$in": ids},
+                    KEY_FIELD: (
+                        {"$exists": False} if previous is None else list(previous)
+                    ),
+                },
+                {"$set": {KEY_FIELD: list(current)}},
+            )
+            moved = result.modified_count
+            for path in _counter_paths(kind, current):
+                stats.counters[path] += moved
+            if previous is not None:
+                for path in _counter_paths(kind, previous):
+                    stats.counters[path] -= moved
+    await _increment(graph_id, db, stats)
+
+
+async def discount_class_stats(
+    graph_id: ObjectId,
+    db: AsyncIOMotorDatabase,
+    nodes: Iterable[Dict] = (),
+    edges: Iterable[Dict] = (),
+) -> None:
+    """Removes deleted items (documents as read before deleting them) from the counters."""
+    stats = ClassStats()
+    for kind, docs in (("nodes", nodes), ("edges", edges)):
+        for doc in {d["_id"]: d for d in docs}.values():
+            key = _recorded_key(doc)
+            if key is not None:
+                for path in _counter_paths(kind, key):
+                    stats.counters[path] -= 1
+    await _increment(graph_id, db, stats)
+
+
+async def recount_class_stats(graph_id: ObjectId, db: AsyncIOMotorDatabase) -> Dict:
+    """Counts the items of a graph, records their keys and stores the counters.
+
+    The counters are only stored if the graph did not change meanwhile (its version,
+    see `services.versions`); otherwise the next read counts again.
+    """
+    graph = await db["graphs"].find_one({"_id": graph_id}, {"version": 1})
+    # Graphs that never changed have no version yet
+    unchanged = {"version": graph.get("version", {"$exists": False})}
+
+    stats = ClassStats()
+    for kind in KINDS:
+        unrecorded = defaultdict(list)
+        async for doc in db[kind].find({"graph_id": graph_id}, PROJECTION):
+            key = stats.add(kind, doc)
+            if _recorded_key(doc) != key:
+                unrecorded[key].append(doc["_id"])
+        for key, ids in unrecorded.items():
+            await db[kind].update_many(
+                {"_id": {"$in": ids}}, {"$set": {KEY_FIELD: list(key)}}
+            )
+
+    document = stats.document()
+    result = await db["graphs"].update_one(
+        {"_id": graph_id, **unchanged}, {"$set": {STATS_FIELD: document}}
+    )
+    if not result.modified_count:
+        logger.debug("Graph {} changed while counting its classes", graph_id)
+    return document
+
+
+def _by_class(counters: Dict[str, Dict], classes: List[Dict]) -> List[Dict]:
+    """Lists the counters of every class (items of unknown classes under `_id` None)."""
+    counters = dict(counters)
+    result = []
+    for item_class in classes:
+        values = counters.pop(str(item_class["_id"]), {})
+        result.append(
+            {
+                "_id": item_class["_id"],
+                "name": item_class.get("name"),
+                **{c: values.get(c, 0) for c in COUNTERS},
+            }
+        )
+    if counters:
+        result.append(
+            {
+                "_id": None,
+                "name": None,
+                **{c: sum(v.get(c, 0) for v in counters.values()) for c in COUNTERS},
+            }
+        )
+    return result
+
+
+async def get_class_stats(
+    graph_id: ObjectId, db: AsyncIOMotorDatabase
+) -> Optional[Dict]:
+    """Returns the per-class counters of a graph (None if missing or being deleted).
+
+    The result has the counters of each node class under "nodes", of each edge class
+    under "edges" and their sums under "totals".
+    """
+    graph = await db["graphs"].find_one(
+        {"_id": graph_id, "deletion": {"$exists": False}},
+        {STATS_FIELD: 1, "node_classes": 1, "edge_classes": 1},
+    )
+    if graph is None:
+        return None
+    stats = graph.get(STATS_FIELD)
+    if stats is None:
+        stats = await recount_class_stats(graph_id=graph_id, db=db)
+
+    result = {
+        "nodes": _by_class(stats.get("nodes", {}), graph.get("node_classes", [])),
+        "edges": _by_class(stats.get("edges", {}), graph.get("edge_classes", [])),
+    }
+    result["totals"] = {
+        kind: {c: sum(entry[c] for entry in result[kind]) for c in COUNTERS}
+        for kind in KINDS
+    }
+    return result
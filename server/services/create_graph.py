@@ -8,12 +8,14 @@ import traceback
 
 from loguru import logger
 from settings import settings
+from logging_utils import summarise, Sampler
 
 from services.utils import (
     generate_high_contrast_colors,
     gen_random_properties,
     parse_and_sanitise_properties,
 )
+from services.class_stats import ClassStats, set_class_stats
 from services.plugins import execute_plugins
 from services.graph import delete_graph
 
@@ -53,7 +55,7 @@ def extract_nodes_and_edges(
         list
     )  # Stores edge properties as {(head,head_type, relation, tail, tail_type): {...properties...})}
 
-    logger.info(graph.triples)
+    logger.debug("Extracting nodes and edges from {} triples", len(graph.triples))
 
     for entry in graph.triples:
         head_key = (entry.head, entry.head_type)
@@ -94,15 +96,7 @@ def extract_nodes_and_edges(
         logger.info("Untyped graph")
         node_classes.add(settings.UNTYPED_GRAPH_NODE_CLASS)
 
-    logger.info(f"triples: {triples}")
-
-    # Resolve properties
-    # logger.info(f"node_properties: {node_properties}")
-    # logger.info(f"edge_properties: {edge_properties}")
-
-    # logger.info(
-    #     f"nodes: {nodes}",
-    # )
+    logger.opt(lazy=True).debug("triples: {}", lambda: summarise(triples))
 
     # Enrich nodes/triples - detect property types...
     output_nodes = {}
@@ -119,12 +113,13 @@ def extract_nodes_and_edges(
             "properties": _properties,
         }
 
-    logger.info(f"output_nodes: {output_nodes}")
+    logger.opt(lazy=True).debug("output_nodes: {}", lambda: summarise(output_nodes))
 
     # Enrich nodes/triples - detect property types...
     output_triples = {}
+    sampler = Sampler()
     for triple_key, count in triples.items():
-        logger.info(f"triple key: {triple_key}")
+        sampler.debug("triple key: {}", triple_key)
         _edge_properties = edge_properties[triple_key]
         # Combine list of properties into single dict
         _combined_properties = {k: v for d in _edge_properties for k, v in d.items()}
@@ -137,7 +132,8 @@ def extract_nodes_and_edges(
             "properties": _properties,
         }
 
-    logger.info(f"output_triples {output_triples}")
+    sampler.flush("triple keys")
+    logger.opt(lazy=True).debug("output_triples: {}", lambda: summarise(output_triples))
 
     return nodes, triples, node_classes, edge_classes
 
@@ -163,10 +159,15 @@ async def create_insert_nodes(
     nodes: Dict[Tuple, int],
     node_classes_with_ids: Dict[str, ObjectId],
     graph_id: ObjectId,
+    degrees: Optional[Dict[Tuple, int]] = None,
+    class_stats: Optional[ClassStats] = None,
 ) -> Dict[Tuple, ObjectId]:
     """
     Create unique nodes with frequencies and insert into graph database.
 
+    `degrees` are the number of triples each node takes part in (see `services.degrees`).
+    The nodes are counted into `class_stats` (see `services.class_stats`).
+
     NOTE
     ----
     THIS ASSUMES THE INSERTED_IDS ARE THE SAME ORDER AS THE NODE DATA DOCS
@@ -181,17 +182,23 @@ async def create_insert_nodes(
 
     for (name, type_), frequency in nodes.items():
         node_data.append(
-            graph_model.CreateItem(
-                name=name,
-                type=node_classes_with_ids[
-                    type_
-                ],  # settings.UNTYPED_GRAPH_NODE_CLASS if type_ is None else type_, # TODO: make this work for untyped graphs.
-                value=frequency,
-                graph_id=graph_id,
-                properties=gen_random_properties(),
-            ).dict()
+            {
+                **graph_model.CreateItem(
+                    name=name,
+                    type=node_classes_with_ids[
+                        type_
+                    ],  # settings.UNTYPED_GRAPH_NODE_CLASS if type_ is None else type_, # TODO: make this work for untyped graphs.
+                    value=frequency,
+                    graph_id=graph_id,
+                    properties=gen_random_properties(),
+                ).dict(),
+                "active_degree": (degrees or {}).get((name, type_), 0),
+            }
         )
 
+    if class_stats is not None:
+        class_stats.mark("nodes", node_data)
+
     try:
         result = await nodes_db_collection.insert_many(node_data)
         for (name, type_), inserted_id in zip(nodes.keys(), result.inserted_ids):
@@ -210,10 +217,13 @@ async def create_insert_edges(
     triples: Dict[Tuple, int],
     edge_classes_with_ids: Dict[str, ObjectId],
     graph_id: ObjectId,
+    class_stats: Optional[ClassStats] = None,
 ) -> Dict[Tuple, ObjectId]:
     """
     Create unique edges with respective frequencies
 
+    The edges are counted into `class_stats` (see `services.class_stats`).
+
     NOTE
     ----
     THIS ASSUMES THE INSERTED_IDS ARE THE SAME ORDER AS THE EDGE DATA DOCS
@@ -234,6 +244,9 @@ async def create_insert_edges(
             ).dict()
         )
 
+    if class_stats is not None:
+        class_stats.mark("edges", edge_data)
+
     try:
         result = await edges_db_collection.insert_many(edge_data)
         for (head, head_type, relation, tail, tail_type), inserted_id in zip(
@@ -335,7 +348,7 @@ async def create_graph(graph: graph_model.InputGraph, db: AsyncIOMotorDatabase):
 
         graph_id = db_graph.inserted_id
 
-        logger.info(f"Created base graph project with _id: {str(graph_id)}")
+        logger.info("Created base graph project with _id: {}", graph_id)
 
         nodes, triples, node_classes, edge_classes = extract_nodes_and_edges(
             graph=graph
@@ -346,11 +359,18 @@ async def create_graph(graph: graph_model.InputGraph, db: AsyncIOMotorDatabase):
         )
 
         # "nodes" are {(name, type): {"frequency": int, "properties": List[Dict]}}
+        class_stats = ClassStats()
+        degrees = Counter()
+        for head, head_type, _, tail, tail_type in triples:
+            degrees.update({(head, head_type), (tail, tail_type)})
+
         node_ids = await create_insert_nodes(
             nodes_db_collection=db["nodes"],
             nodes=nodes,
             node_classes_with_ids=node_classes_with_ids,
             graph_id=graph_id,
+            degrees=degrees,
+            class_stats=class_stats,
         )
 
         edge_ids = await create_insert_edges(
@@ -358,7 +378,9 @@ async def create_graph(graph: graph_model.InputGraph, db: AsyncIOMotorDatabase):
             triples=triples,
             edge_classes_with_ids=edge_classes_with_ids,
             graph_id=graph_id,
+            class_stats=class_stats,
         )
+        await set_class_stats(graph_id=graph_id, db=db, stats=class_stats)
 
         await add_graph_ontology_and_counts(
             graphs_db_collection=db["graphs"],
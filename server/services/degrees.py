@@ -0,0 +1,86 @@
+"""Maintained per-node active degree.
+
+Each node document carries `active_degree`: the number of its triples whose edge is
+active (a self-referencing triple counts once). Services that create, delete or
+(de)activate triples keep it up to date with `adjust_active_degrees`, so detecting
+nodes orphaned by a deactivation is a single read of the affected nodes.
+
+Nodes created before the counter existed are counted on first read.
+"""
+
+from collections import Counter
+from typing import Dict, Iterable
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from services.hydration import find_incident_triples
+
+
+def triple_endpoints(triples: Iterable[Dict]) -> Counter:
+    """Counts the triples incident to each node ({head, tail} triples)."""
+    counts = Counter()
+    for t in triples:
+        counts.update({t["head"], t["tail"]})
+    return counts
+
+
+async def adjust_active_degrees(
+    db: AsyncIOMotorDatabase, deltas: Dict[ObjectId, int]
+) -> None:
+    """Increments `active_degree` of nodes by their delta with one update per distinct delta."""
+    by_delta = {}
+    for node_id, delta in deltas.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(node_id)
+    for delta, node_ids in by_delta.items():
+        await db["nodes"].update_many(
+            {"_id": {"$in": node_ids}, "active_degree": {"$exists": True}},
+            {"$inc": {"active_degree": delta}},
+        )
+
+
+async def get_active_degrees(
+    db: AsyncIOMotorDatabase, graph_id: ObjectId, node_ids: Iterable[ObjectId]
+) -> Dict[ObjectId, int]:
+    """Returns the active degree of the given nodes."""
+    node_ids = list(set(node_ids))
+    nodes = (
+        await db["nodes"]
+        .find({"_id": {"$in": node_ids}}, {"active_degree": 1})
+        .to_list(None)
+    )
+    degrees = {n["_id"]: n["active_degree"] for n in nodes if "active_degree" in n}
+
+    missing = [_id for _id in node_ids if _id not in degrees]
+    if missing:
+        degrees.update(await count_active_degrees(db, graph_id, missing))
+    return degrees
+
+
+async def count_active_degrees(
+    db: AsyncIOMotorDatabase, graph_id: ObjectId, node_ids: Iterable[ObjectId]
+) -> Dict[ObjectId, int]:
+    """Counts (and stores) the active degree of nodes from their triples and edges."""
+    node_ids = list(node_ids)
+    triples = await find_incident_triples(db=db, graph_id=graph_id, node_ids=node_ids)
+    active_edges = {
+        e["_id"]
+        for e in await db["edges"]
+        .find(
+            {"_id": {"$in": [t["edge"] for t in triples]}, "is_active": True},
+            {"_id": 1},
+        )
+        .to_list(None)
+    }
+    counts = triple_endpoints(t for t in triples if t["edge"] in active_edges)
+    degrees = {node_id: counts.get(node_id, 0) for node_id in node_ids}
+
+    by_degree = {}
+    for node_id, degree in degrees.items():
+        by_degree.setdefault(degree, []).append(node_id)
+    for degree, ids in by_degree.items():
+        await db["nodes"].update_many(
+            {"_id": {"$in": ids}}, {"$set": {"active_degree": degree}}
+        )
+    return degrees
@@ -0,0 +1,181 @@
+"""Background deletion of graphs.
+
+Deleting a graph marks its document with a `deletion` progress field (hiding it from
+reads) and removes its change log, issues, triples, edges and nodes in the background
+in `_id`-ordered chunks of `GRAPH_DELETE_BATCH_SIZE`, so no single delete holds locks
+for long. The graph document itself is removed last. Deletions interrupted by a
+restart, and documents orphaned by deletions before graphs were deleted in full, are
+cleaned up by `collect_garbage` (see `db_manager.py`).
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from settings import settings
+from services.adjacency import adjacency_cache
+from services.analytics import analytics_cache
+from services.autocomplete import name_index
+from services.search import search_index
+from services.issue_store import ISSUES_COLLECTION
+from services.response_cache import response_cache
+from services.review_queue import review_queue
+from services.sampling import sample_pool
+from services.versions import CHANGES_COLLECTION
+
+# Graphs that are not being deleted (reads treat the others as missing)
+NOT_DELETED = {"deletion": {"$exists": False}}
+
+# Deleted in this order so no issue/triple is left pointing at deleted nodes/edges
+GRAPH_COLLECTIONS = [CHANGES_COLLECTION, ISSUES_COLLECTION, "triples", "edges", "nodes"]
+
+
+async def start_graph_deletion(
+    graph_id: ObjectId, db: AsyncIOMotorDatabase
+) -> Tuple[Optional[Dict], bool]:
+    """Marks a graph for deletion.
+
+    Returns the deletion progress (None if the graph does not exist) and whether the
+    deletion needs to be started, i.e. it is not already running.
+    """
+    graph = await db["graphs"].find_one({"_id": graph_id}, {"deletion": 1})
+    if graph is None:
+        return None, False
+    if graph.get("deletion", {}).get("status") == "running":
+        return graph["deletion"], False
+
+    now = datetime.utcnow()
+    deletion = {
+        "status": "running",
+        "total": {
+            collection: await db[collection].count_documents({"graph_id": graph_id})
+            for collection in GRAPH_COLLECTIONS
+        },
+        "deleted": {collection: 0 for collection in GRAPH_COLLECTIONS},
+        "started_at": now,
+        "updated_at": now,
+    }
+    await db["graphs"].update_one({"_id": graph_id}, {"$set": {"deletion": deletion}})
+
+    adjacency_cache.invalidate(graph_id)
+    sample_pool.invalidate(graph_id)
+    review_queue.invalidate(graph_id)
+    name_index.invalidate(graph_id)
+    search_index.invalidate(graph_id)
+    response_cache.invalidate(graph_id)
+    analytics_cache.invalidate(graph_id)
+    return deletion, True
+
+
+async def delete_in_batches(
+    collection, query: Dict, on_batch=None, batch_size: Optional[int] = None
+) -> int:
+    """Deletes the documents matching `query` in `_id` ordered batches.
+
+    `on_batch(count)` is awaited after each batch. Returns the number of deleted documents.
+    """
+    batch_size = batch_size or settings.GRAPH_DELETE_BATCH_SIZE
+    total = 0
+    while True:
+        ids = [
+            d["_id"]
+            for d in await collection.find(query, {"_id": 1})
+            .sort("_id", 1)
+            .limit(batch_size)
+            .to_list(batch_size)
+        ]
+        if not ids:
+            return total
+        result = await collection.delete_many({"_id": {"$in": ids}})
+        total += result.deleted_count
+        if on_batch is not None:
+            await on_batch(result.deleted_count)
+        if settings.GRAPH_DELETE_PAUSE_SECONDS:
+            await asyncio.sleep(settings.GRAPH_DELETE_PAUSE_SECONDS)
+
+
+async def delete_graph_documents(graph_id: ObjectId, db: AsyncIOMotorDatabase) -> None:
+    """Deletes the documents of a graph marked for deletion, then the graph itself.
+
+    Progress is recorded on the graph document after every batch.
+    """
+    try:
+        for collection in GRAPH_COLLECTIONS:
+
+            async def on_batch(count: int, collection: str = collection):
+                await db["graphs"].update_one(
+                    {"_id": graph_id},
+                    {
+                        "$inc": {f"deletion.deleted.{collection}": count},
+                        "$set": {"deletion.updated_at": datetime.utcnow()},
+                    },
+                )
+
+            await delete_in_batches(
+                db[collection], {"graph_id": graph_id}, on_batch=on_batch
+            )
+
+        await db["graphs"].delete_one({"_id": graph_id})
+        logger.info("Deleted graph {}", graph_id)
+    except Exception as e:
+        logger.error(f"Failed to delete graph {graph_id}: {e}")
+        await db["graphs"].update_one(
+            {"_id": graph_id},
+            {"$set": {"deletion.status": "failed", "deletion.error": str(e)}},
+        )
+
+
+async def get_deletion_progress(
+    graph_id: ObjectId, db: AsyncIOMotorDatabase
+) -> Optional[Dict]:
+    """Returns the deletion progress of a graph (None once it no longer exists)."""
+    graph = await db["graphs"].find_one({"_id": graph_id}, {"deletion": 1})
+    if graph is None:
+        return None
+    return graph.get("deletion", {"status": "not_deleted"})
+
+
+async def collect_garbage(
+    db: AsyncIOMotorDatabase, older_than_seconds: float = 0
+) -> Dict[str, int]:
+    """Finishes interrupted graph deletions and removes orphaned documents.
+
+    Deletions not updated for `older_than_seconds` are resumed; issues, nodes, edges
+    and triples whose graph no longer exists are deleted. Returns the number of resumed
+    deletions and deleted orphans per collection.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=older_than_seconds)
+    stale = (
+        await db["graphs"]
+        .find(
+            {
+                "$or": [
+                    {"deletion.status": "failed"},
+                    {"deletion.updated_at": {"$lte": cutoff}},
+                ]
+            },
+            {"_id": 1},
+        )
+        .to_list(None)
+    )
+    for graph in stale:
+        await delete_graph_documents(graph["_id"], db)
+
+    graph_ids = {
+        g["_id"] for g in await db["graphs"].find({}, {"_id": 1}).to_list(None)
+    }
+    collected = {"resumed_deletions": len(stale)}
+    for collection in GRAPH_COLLECTIONS:
+        orphan_graph_ids: List[ObjectId] = [
+            _id
+            for _id in await db[collection].distinct("graph_id")
+            if _id not in graph_ids
+        ]
+        collected[collection] = await delete_in_batches(
+            db[collection], {"graph_id": {"$in": orphan_graph_ids}}
+        )
+    return collected
@@ -0,0 +1,159 @@
+"""Live change events of graphs.
+
+Clients subscribe to a graph's changes with `/graph/events/{graph_id}`, a
+server-sent event stream. Every entry appended to the change log (see
+`services.versions`) is published as a compact `change` event:
+
+    id: <version>
+    event: change
+    data: {"version": ..., "nodes": [...], "edges": [...], "triples": [...],
+           "graph": false, "reset": false}
+
+with the ids of the changed items, which clients fetch with `/graph/changes`.
+Entries are published by the worker that wrote them (`CHANGE_EVENTS_SOURCE="local"`)
+or, with several workers, by every worker watching the change log with a MongoDB
+change stream (`"change_stream"`, requires a replica set).
+
+Each event is serialized once and handed to every subscriber's bounded queue, so
+fan-out costs a queue append per client. Clients that fall more than
+`CHANGE_EVENTS_QUEUE_SIZE` events behind are sent a `reset` event and disconnected
+rather than slowing down the others, as are reconnecting clients more than
+`CHANGE_EVENTS_MAX_REPLAY` versions behind before their events start; clients that notice a gap in the versions
+should also resync with `/graph/changes`.
+"""
+
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from loguru import logger
+
+from settings import settings
+from services.serialization import dumps
+
+EVENT_FIELDS = ("nodes", "edges", "triples", "graph", "reset")
+
+HEARTBEAT = b": keep-alive\n\n"
+RESET = b"event: reset\ndata: {}\n\n"
+
+
+def format_event(entry: Dict) -> bytes:
+    """Formats a change log entry as a server-sent event."""
+    data = {"version": entry["version"], **{f: entry[f] for f in EVENT_FIELDS}}
+    return (
+        f"id: {entry['version']}\nevent: change\ndata: ".encode()
+        + dumps(data)
+        + b"\n\n"
+    )
+
+
+class Subscriber:
+    def __init__(self, graph_id: ObjectId, queue_size: int):
+        self.graph_id = graph_id
+        self.queue: "asyncio.Queue[Tuple[int, bytes]]" = asyncio.Queue(queue_size)
+        self.lagged = False
+
+
+class ChangeBroker:
+    """Fans change events out to the subscribers of each graph in this worker."""
+
+    def __init__(self, queue_size: int, max_subscribers: int):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers: Dict[ObjectId, Set[Subscriber]] = {}
+
+    def subscribe(self, graph_id: ObjectId) -> Optional[Subscriber]:
+        """Registers a subscriber (None once the graph has `max_subscribers`)."""
+        graph_id = ObjectId(graph_id)
+        subscribers = self._subscribers.setdefault(graph_id, set())
+        if len(subscribers) >= self.max_subscribers:
+            return None
+        subscriber = Subscriber(graph_id, self.queue_size)
+        subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscribers = self._subscribers.get(subscriber.graph_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[subscriber.graph_id]
+
+    def subscriber_count(self, graph_id: ObjectId) -> int:
+        return len(self._subscribers.get(ObjectId(graph_id), ()))
+
+    def publish(self, entry: Dict) -> None:
+        """Queues a change log entry for the subscribers of its graph."""
+        subscribers = self._subscribers.get(entry["graph_id"])
+        if not subscribers:
+            return
+        event = (entry["version"], format_event(entry))
+        for subscriber in list(subscribers):
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Told to resync once it has drained its queue
+                subscriber.lagged = True
+                self.unsubscribe(subscriber)
+
+    async def stream(
+        self, subscriber: Subscriber, replay: Optional[List[Dict]] = ()
+    ) -> AsyncIterator[bytes]:
+        """Yields the replayed entries, then the subscriber's events as they arrive.
+
+        The subscriber must be registered before `replay` is read from the change
+        log so no entry is missed; entries received twice are skipped. A `replay` of
+        None (too many entries to replay) is sent as a `reset` event instead.
+        """
+        try:
+            last = None
+            if replay is None:
+                yield RESET
+                replay = ()
+            for entry in replay:
+                last = entry["version"]
+                yield format_event(entry)
+            while True:
+                if subscriber.lagged and subscriber.queue.empty():
+                    yield RESET
+                    return
+                try:
+                    version, event = await asyncio.wait_for(
+                        subscriber.queue.get(),
+                        timeout=settings.CHANGE_EVENTS_HEARTBEAT_SECONDS,
+                    )
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT
+                    continue
+                if last is not None and version <= last:
+                    continue
+                last = version
+                yield event
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def watch(self, collection) -> None:
+        """Publishes the entries any worker inserts into the change log collection.
+
+        Runs until cancelled and restarts the change stream after errors (events
+        missed meanwhile show up as version gaps to clients).
+        """
+        while True:
+            try:
+                async with collection.watch(
+                    [{"$match": {"operationType": "insert"}}]
+                ) as changes:
+                    async for change in changes:
+                        self.publish(change["fullDocument"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Change stream failed, restarting: {e}")
+                await asyncio.sleep(5)
+
+
+change_broker = ChangeBroker(
+    queue_size=settings.CHANGE_EVENTS_QUEUE_SIZE,
+    max_subscribers=settings.CHANGE_EVENTS_MAX_SUBSCRIBERS,
+)
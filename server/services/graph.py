@@ -1,13 +1,25 @@
 """Services for performing CRUD operation on entire graphs"""
 
-from typing import List, Dict, Tuple, Optional
+from typing import AsyncIterator, List, Dict, Tuple, Optional, Union
 from fastapi import HTTPException, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
+import base64
+import binascii
+import heapq
 import traceback
 from loguru import logger
 
+from settings import settings
+from metrics import track
+from services.adjacency import adjacency_cache, GraphAdjacency
+from services.hydration import hydrate_triples, iter_populated_graph_triples
+from services.sampling import sample_pool
+from services.deletion import NOT_DELETED, start_graph_deletion
+from services.issue_store import COUNT_PROJECTION, issue_count
+from services.serialization import project, project_many
 from services.utils import flatten_nested_dict
+from services.versions import bump_graph_version
 from models import graph as graph_model
 from models.misc import SettingUpdate
 
@@ -23,7 +35,10 @@ async def read_graphs(
 
     graphs = (
         await db["graphs"]
-        .find({}, {"_id": 1, "created_at": 1, "updated_at": 1, "name": 1})
+        .find(
+            NOT_DELETED,
+            {"_id": 1, "created_at": 1, "updated_at": 1, "name": 1},
+        )
         .skip(skip)
         .limit(limit)
         .to_list(limit)
@@ -63,63 +78,12 @@ async def get_subgraph_review_progress(graph_id: ObjectId, db: AsyncIOMotorDatab
     )
 
     # 1. Create neighbours
-    pipeline = [
-        {"$match": {"graph_id": graph_id}},
-        {
-            "$facet": {
-                "fromHead": [
-                    {
-                        "$group": {
-                            "_id": "$head",
-                            "nodes": {"$addToSet": "$tail"},
-                            "links": {"$addToSet": "$edge"},
-                        }
-                    }
-                ],
-                "fromTail": [
-                    {
-                        "$group": {
-                            "_id": "$tail",
-                            "nodes": {"$addToSet": "$head"},
-                            "links": {"$addToSet": "$edge"},
-                        }
-                    }
-                ],
-            }
-        },
-        {"$project": {"all": {"$concatArrays": ["$fromHead", "$fromTail"]}}},
-        {"$unwind": "$all"},
-        {
-            "$group": {
-                "_id": "$all._id",
-                "nodes": {"$addToSet": "$all.nodes"},
-                "links": {"$addToSet": "$all.links"},
-            }
-        },
-        {
-            "$project": {
-                "_id": 1,
-                "nodes": {
-                    "$reduce": {
-                        "input": "$nodes",
-                        "initialValue": [],
-                        "in": {"$setUnion": ["$$this", "$$value"]},
-                    }
-                },
-                "links": {
-                    "$reduce": {
-                        "input": "$links",
-                        "initialValue": [],
-                        "in": {"$setUnion": ["$$this", "$$value"]},
-                    }
-                },
-            }
-        },
+    adjacency = await adjacency_cache.get(graph_id=graph_id, db=db)
+    neighbours = [
+        {"_id": node_id, "nodes": nodes, "links": links}
+        for node_id, nodes, links in adjacency.neighbourhoods()
     ]
 
-    neighbours = await db["triples"].aggregate(pipeline).to_list(None)
-    # print("neighbours", neighbours)
-
     # 2. Get counts of errors on all nodes/edges
     node_counts = {
         n["_id"]: {
@@ -172,10 +136,16 @@ async def get_subgraph_review_progress(graph_id: ObjectId, db: AsyncIOMotorDatab
     return reviewed_nodes, reviewed_edges, subgraph_progress
 
 
-async def read_graph(graph_id: ObjectId, db: AsyncIOMotorDatabase) -> graph_model.Graph:
+async def read_graph(
+    graph_id: ObjectId, db: AsyncIOMotorDatabase, plain: bool = False
+) -> Union[graph_model.Graph, Dict]:
     """
     Fetches the details of a single graph.
 
+    With `plain` the graph is returned as a plain dict in the shape of
+    `graph_model.Graph` and its subgraphs are not validated (see
+    `services.serialization`).
+
     TODO
     ----
     - Compute errors and suggestions for subgraphs and return them.
@@ -185,7 +155,7 @@ async def read_graph(graph_id: ObjectId, db: AsyncIOMotorDatabase) -> graph_mode
     try:
         db_graph = await db["graphs"].find_one({"_id": graph_id})
 
-        if db_graph is None:
+        if db_graph is None or "deletion" in db_graph:
             raise HTTPException(status_code=404, detail="Graph not found")
 
         nodes = (
@@ -197,8 +167,7 @@ async def read_graph(graph_id: ObjectId, db: AsyncIOMotorDatabase) -> graph_mode
                     "name": 1,
                     "type": 1,
                     "value": 1,
-                    "errors": 1,
-                    "suggestions": 1,
+                    **COUNT_PROJECTION,
                     "is_reviewed": 1,
                 },
             )
@@ -213,8 +182,7 @@ async def read_graph(graph_id: ObjectId, db: AsyncIOMotorDatabase) -> graph_mode
                     "_id": 1,
                     "name": 1,
                     "value": 1,
-                    "errors": 1,
-                    "suggestions": 1,
+                    **COUNT_PROJECTION,
                     "is_reviewed": 1,
                 },
             )
@@ -224,76 +192,26 @@ async def read_graph(graph_id: ObjectId, db: AsyncIOMotorDatabase) -> graph_mode
         # Get errors and suggestions on subgraphs centred on nodes...
 
         # 1. Create neighbours
-        pipeline = [
-            {"$match": {"graph_id": graph_id}},
-            {
-                "$facet": {
-                    "fromHead": [
-                        {
-                            "$group": {
-                                "_id": "$head",
-                                "nodes": {"$addToSet": "$tail"},
-                                "links": {"$addToSet": "$edge"},
-                            }
-                        }
-                    ],
-                    "fromTail": [
-                        {
-                            "$group": {
-                                "_id": "$tail",
-                                "nodes": {"$addToSet": "$head"},
-                                "links": {"$addToSet": "$edge"},
-                            }
-                        }
-                    ],
-                }
-            },
-            {"$project": {"all": {"$concatArrays": ["$fromHead", "$fromTail"]}}},
-            {"$unwind": "$all"},
-            {
-                "$group": {
-                    "_id": "$all._id",
-                    "nodes": {"$addToSet": "$all.nodes"},
-                    "links": {"$addToSet": "$all.links"},
-                }
-            },
-            {
-                "$project": {
-                    "_id": 1,
-                    "nodes": {
-                        "$reduce": {
-                            "input": "$nodes",
-                            "initialValue": [],
-                            "in": {"$setUnion": ["$$this", "$$value"]},
-                        }
-                    },
-                    "links": {
-                        "$reduce": {
-                            "input": "$links",
-                            "initialValue": [],
-                            "in": {"$setUnion": ["$$this", "$$value"]},
-                        }
-                    },
-                }
-            },
-        ]
-
-        neighbours = await db["triples"].aggregate(pipeline).to_list(None)
-        # print("neighbours", neighbours)
+        with track("neighbours", operation="read_graph.neighbours"):
+            adjacency = await adjacency_cache.get(graph_id=graph_id, db=db)
+            neighbours = [
+                {"_id": node_id, "nodes": nodes, "links": links}
+                for node_id, nodes, links in adjacency.neighbourhoods()
+            ]
 
         # 2. Get counts of errors on all nodes/edges
         node_counts = {
             n["_id"]: {
-                "errors": len(n["errors"]),
-                "suggestions": len(n["suggestions"]),
+                "errors": issue_count(n, is_error=True),
+                "suggestions": issue_count(n, is_error=False),
                 "is_reviewed": n["is_reviewed"],
             }
             for n in nodes
         }
         edge_counts = {
             e["_id"]: {
-                "errors": len(e["errors"]),
-                "suggestions": len(e["suggestions"]),
+                "errors": issue_count(e, is_error=True),
+                "suggestions": issue_count(e, is_error=False),
                 "is_reviewed": e["is_reviewed"],
             }
             for e in edges
@@ -338,30 +256,44 @@ async def read_graph(graph_id: ObjectId, db: AsyncIOMotorDatabase) -> graph_mode
                 _edges_reviewed += int(edge_counts[e_id]["is_reviewed"])
                 _edges += 1
 
+            # Keys and values in the shape of graph_model.SubGraph
             subgraphs.append(
-                graph_model.SubGraph(
-                    _id=node_id,
-                    name=node_id2detail[node_id]["name"],
-                    value=node_id2detail[node_id]["value"],
-                    errors=_errors,
-                    node_count=_nodes,
-                    edge_count=_edges,
-                    nodes_reviewed=_nodes_reviewed,
-                    edges_reviewed=_edges_reviewed,
-                    suggestions=_suggestions,
-                    reviewed_progress=int(
+                {
+                    "_id": str(node_id),
+                    "name": node_id2detail[node_id]["name"],
+                    "type": str(node_id2detail[node_id]["type"]),
+                    "value": str(node_id2detail[node_id]["value"]),
+                    "errors": _errors,
+                    "suggestions": _suggestions,
+                    "reviewed_progress": int(
                         (_nodes_reviewed + _edges_reviewed) / (_nodes + _edges) * 100
                     ),
-                    type=node_id2detail[node_id]["type"],
-                )
+                    "node_count": _nodes,
+                    "edge_count": _edges,
+                    "nodes_reviewed": _nodes_reviewed,
+                    "edges_reviewed": _edges_reviewed,
+                }
             )
 
             total_errors += _errors
             total_suggestions += _suggestions
 
+        if plain:
+            # Only the graph document itself is validated
+            graph = graph_model.Graph(
+                **db_graph,
+                subgraphs=[],
+                reviewed_nodes=reviewed_nodes,
+                reviewed_edges=reviewed_edges,
+                total_errors=total_errors,
+                total_suggestions=total_suggestions,
+            ).dict(by_alias=True)
+            graph["subgraphs"] = subgraphs
+            return graph
+
         return graph_model.Graph(
             **db_graph,
-            subgraphs=subgraphs,
+            subgraphs=[graph_model.SubGraph(**s) for s in subgraphs],
             reviewed_nodes=reviewed_nodes,
             reviewed_edges=reviewed_edges,
             total_errors=total_errors,
@@ -375,8 +307,11 @@ async def get_item_classes(
     graph_id: ObjectId, db: AsyncIOMotorDatabase
 ) -> Tuple[Dict[ObjectId, str], Dict[ObjectId, str]]:
     item_classes = await db["graphs"].find_one(
-        {"_id": graph_id}, {"node_classes": 1, "edge_classes": 1, "_id": 0}
+        {"_id": graph_id, **NOT_DELETED},
+        {"node_classes": 1, "edge_classes": 1, "_id": 0},
     )
+    if item_classes is None:
+        raise HTTPException(status_code=404, detail="Graph not found")
     nodeId2Details = {nc["_id"]: nc for nc in item_classes["node_classes"]}
     edgeId2Details = {ec["_id"]: ec for ec in item_classes["edge_classes"]}
 
@@ -444,15 +379,201 @@ def get_node_neighbours(nodes, links):
     return neighbours
 
 
+def create_plain_graph_data(
+    triples: List[Dict],
+) -> Tuple[Dict[str, Dict], Dict[str, Dict], Dict[str, Dict]]:
+    """Plain dict counterpart of `create_nodes_links` and `get_node_neighbours`.
+
+    Returns the nodes, links and neighbours in the shape of `graph_model.GraphData`
+    keyed by stringified ids.
+    """
+    nodes = {}
+    links = {}
+    neighbours = {}
+
+    for t in triples:
+        for node_type in ["head", "tail"]:
+            node = t[node_type]
+            node_id = str(node["_id"])
+            if node_id not in nodes:
+                nodes[node_id] = {
+                    **project(node, graph_model.Node),
+                    "_id": node_id,
+                    "properties": project_many(
+                        node.get("properties"), graph_model.Property
+                    ),
+                    "errors": project_many(node.get("errors"), graph_model.Error),
+                    "suggestions": project_many(
+                        node.get("suggestions"), graph_model.Suggestion
+                    ),
+                }
+                neighbours[node_id] = {"nodes": set(), "links": set()}
+
+        link_id = str(t["edge"]["_id"])
+        source = str(t["head"]["_id"])
+        target = str(t["tail"]["_id"])
+        links[link_id] = {
+            **project(t["edge"], graph_model.Link),
+            "_id": link_id,
+            "source": source,
+            "target": target,
+            "errors": project_many(t["edge"].get("errors"), graph_model.Error),
+            "suggestions": project_many(
+                t["edge"].get("suggestions"), graph_model.Suggestion
+            ),
+        }
+
+        neighbours[source]["nodes"].add(target)
+        neighbours[target]["nodes"].add(source)
+        neighbours[source]["links"].add(link_id)
+        neighbours[target]["links"].add(link_id)
+
+    neighbours = {
+        k: {"nodes": list(v["nodes"]), "links": list(v["links"])}
+        for k, v in neighbours.items()
+    }
+    return nodes, links, neighbours
+
+
+def _triple_sort_key(triple: Dict) -> Tuple[ObjectId, ObjectId, ObjectId, ObjectId]:
+    return (triple["head"], triple["edge"], triple["tail"], triple["_id"])
+
+
+def encode_subgraph_cursor(focus_node_id: ObjectId, triple: Dict) -> str:
+    """Encodes the position after `triple` in a focus node's sorted triples as an opaque token."""
+    key = (focus_node_id,) + _triple_sort_key(triple)
+    return base64.urlsafe_b64encode(b"".join(oid.binary for oid in key)).decode()
+
+
+def decode_subgraph_cursor(cursor: str) -> Tuple[ObjectId, Tuple[ObjectId, ...]]:
+    """Decodes a token from `encode_subgraph_cursor` into (focus node id, sort key).
+
+    Raises ValueError if the token is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode())
+    except (binascii.Error, UnicodeEncodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if len(raw) != 60:
+        raise ValueError("Invalid cursor")
+    oids = [ObjectId(raw[i : i + 12]) for i in range(0, 60, 12)]
+    return oids[0], tuple(oids[1:])
+
+
+def page_focus_triples(
+    focus_triples: List[Dict], skip: int, limit: int, after: Optional[Tuple] = None
+) -> Tuple[List[Dict], bool]:
+    """Returns a page of triples in (head, edge, tail, _id) order and whether more follow.
+
+    With `after` (a sort key from a cursor) the page starts after that key (keyset
+    pagination) and `skip` is ignored. Only the requested page is sorted.
+    """
+    if after is not None:
+        focus_triples = [t for t in focus_triples if _triple_sort_key(t) > after]
+        skip = 0
+    head = heapq.nsmallest(skip + limit + 1, focus_triples, key=_triple_sort_key)
+    return head[skip : skip + limit], len(head) > skip + limit
+
+
+async def get_k_hop_triples(
+    adjacency: GraphAdjacency,
+    focus_node_id: ObjectId,
+    hops: int,
+    max_nodes: int,
+    max_edges: int,
+    max_fanout: int,
+    node_types: Optional[List[ObjectId]],
+    db: AsyncIOMotorDatabase,
+) -> Tuple[List[Dict], graph_model.SubgraphTruncation]:
+    """Bounded breadth-first expansion around a focus node.
+
+    Expands at most `hops` hops from the focus node, following at most `max_fanout`
+    triples per visited node and stopping once `max_nodes` nodes or `max_edges` triples
+    were collected. If `node_types` is given, only neighbours of those types are added.
+    The returned truncation metadata states which limits were hit.
+    """
+    truncation = graph_model.SubgraphTruncation()
+    visited = {focus_node_id}
+    triples = {}
+    frontier = [focus_node_id]
+
+    for hop in range(hops):
+        candidates = []
+        for node_id in frontier:
+            incident = adjacency.incident_triples(node_id)
+            if len(incident) > max_fanout:
+                truncation.fanout = True
+                incident = incident[:max_fanout]
+            for index in incident:
+                triple = adjacency.triple(index)
+                other = triple["tail"] if triple["head"] == node_id else triple["head"]
+                candidates.append((triple, other))
+
+        allowed = None
+        if node_types:
+            # One query per hop to filter the new neighbours by type
+            new_ids = list({other for _, other in candidates if other not in visited})
+            allowed = {
+                n["_id"]
+                for n in await db["nodes"]
+                .find(
+                    {"_id": {"$in": new_ids}, "type": {"$in": node_types}}, {"_id": 1}
+                )
+                .to_list(None)
+            }
+
+        next_frontier = []
+        for triple, other in candidates:
+            if triple["_id"] in triples:
+                continue
+            if other not in visited:
+                if allowed is not None and other not in allowed:
+                    continue
+                if len(visited) >= max_nodes:
+                    truncation.nodes = True
+                    continue
+                visited.add(other)
+                next_frontier.append(other)
+            if len(triples) >= max_edges:
+                truncation.edges = True
+                break
+            triples[triple["_id"]] = triple
+
+        truncation.hops_completed = hop + 1
+        frontier = next_frontier
+        if not frontier or truncation.edges:
+            break
+
+    return list(triples.values()), truncation
+
+
 async def get_subgraph(
     graph_id: ObjectId,
     node_id: Optional[str],
     skip: int,
     limit: int,
     db: AsyncIOMotorDatabase,
+    hops: int = 1,
+    max_nodes: Optional[int] = None,
+    max_edges: Optional[int] = None,
+    max_fanout: Optional[int] = None,
+    node_types: Optional[List[str]] = None,
+    cursor: Optional[str] = None,
+    plain: bool = False,
 ):
     """Fetches a single subgraph
 
+    The focus node's triples are paged with either `skip`/`limit` or, for deep pages,
+    the `cursor` returned as `next_cursor` by the previous page. Only the page is
+    joined with its nodes and edges.
+
+    With `hops` > 1 the subgraph is the bounded k-hop neighbourhood of the focus node
+    (see `get_k_hop_triples`) instead of a page of the focus node's own triples. Limits
+    are capped by the SUBGRAPH_MAX_* settings.
+
+    With `plain` the subgraph is returned as a plain dict in the shape of
+    `graph_model.GraphDataWithFocusNode` (see `create_plain_graph_data`).
+
     TODO
     ----
     - Add subgraph reviewed progress:
@@ -472,31 +593,23 @@ async def get_subgraph(
 
     """
     try:
-        logger.info(f"Fetching subgraph: {graph_id}/{node_id}/{skip}/{limit}")
+        logger.debug("Fetching subgraph: {}/{}/{}/{}", graph_id, node_id, skip, limit)
 
         nodeId2Details, edgeId2Details = await get_item_classes(
             graph_id=graph_id, db=db
         )
 
+        after = None
+        if cursor is not None:
+            node_id, after = decode_subgraph_cursor(cursor)
+
         if node_id is not None:
-            logger.info(f"Node supplied - no random sampling")
+            logger.debug("Node supplied - no random sampling")
             focus_node_id = node_id
         else:
-            logger.info(f"No node supplied - randomly sampling node")
-            random_node = (
-                await db["nodes"]
-                .aggregate(
-                    [
-                        {"$match": {"graph_id": ObjectId(graph_id)}},
-                        {"$sample": {"size": 1}},
-                    ]
-                )
-                .to_list(None)
-            )
-            if random_node is None:
-                raise HTTPException(detail="No node found")
-
-            focus_node_id = random_node[0]["_id"] if random_node else None
+            logger.debug("No node supplied - randomly sampling node")
+            with track("sample", operation="get_subgraph.sample"):
+                focus_node_id = await sample_pool.next_node(graph_id=graph_id, db=db)
 
         if focus_node_id is None:
             raise HTTPException(detail="No node found")
@@ -508,55 +621,46 @@ async def get_subgraph(
             **{**focus_node, "color": nodeId2Details[focus_node["type"]]["color"]}
         )
 
-        max_triples = await db["triples"].count_documents(
-            {
-                "graph_id": graph_id,
-                "$or": [{"head": focus_node_id}, {"tail": focus_node_id}],
-            }
-        )
-
-        pipeline = [
-            {
-                "$match": {
-                    "graph_id": graph_id,
-                    "$or": [{"head": focus_node_id}, {"tail": focus_node_id}],
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "nodes",
-                    "localField": "head",
-                    "foreignField": "_id",
-                    "as": "head",
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "nodes",
-                    "localField": "tail",
-                    "foreignField": "_id",
-                    "as": "tail",
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "edges",
-                    "localField": "edge",
-                    "foreignField": "_id",
-                    "as": "edge",
-                }
-            },
-            {"$unwind": "$head"},
-            {"$unwind": "$tail"},
-            {"$unwind": "$edge"},
-            {
-                "$sort": {"head._id": 1, "edge._id": 1, "tail._id": 1, "_id": 1},
-            },
-            {"$skip": skip},
-            {"$limit": limit},
-        ]
+        # Sort and page the focus node's triples from the adjacency so only the
+        # requested page is populated with its nodes/edges.
+        adjacency = await adjacency_cache.get(graph_id=graph_id, db=db)
+        focus_triples = adjacency.triples_for_nodes([focus_node_id])
+        max_triples = len(focus_triples)
+        hops = max(1, min(hops, settings.SUBGRAPH_MAX_HOPS))
+        truncation = None
+        next_cursor = None
+
+        if hops == 1:
+            page, has_more = page_focus_triples(
+                focus_triples, skip=skip, limit=limit, after=after
+            )
+            if has_more and page:
+                next_cursor = encode_subgraph_cursor(focus_node_id, page[-1])
+        else:
+            with track("k_hop", operation="get_subgraph.k_hop"):
+                k_hop_triples, truncation = await get_k_hop_triples(
+                    adjacency=adjacency,
+                    focus_node_id=focus_node_id,
+                    hops=hops,
+                    max_nodes=min(
+                        max_nodes or settings.SUBGRAPH_MAX_NODES,
+                        settings.SUBGRAPH_MAX_NODES,
+                    ),
+                    max_edges=min(
+                        max_edges or settings.SUBGRAPH_MAX_EDGES,
+                        settings.SUBGRAPH_MAX_EDGES,
+                    ),
+                    max_fanout=min(
+                        max_fanout or settings.SUBGRAPH_MAX_FANOUT,
+                        settings.SUBGRAPH_MAX_FANOUT,
+                    ),
+                    node_types=[ObjectId(t) for t in node_types or []],
+                    db=db,
+                )
+            page = sorted(k_hop_triples, key=_triple_sort_key)
 
-        triples = await db["triples"].aggregate(pipeline).to_list(None)
+        with track("triples", operation="get_subgraph.triples"):
+            triples = await hydrate_triples(db=db, triples=page)
 
         # Add "color" to items so the graph in the UI can render accordingly
         triples = [
@@ -578,6 +682,25 @@ async def get_subgraph(
             for t in triples
         ]
 
+        if plain:
+            nodes, links, neighbours = create_plain_graph_data(triples)
+            logger.debug(
+                "Sample contains: {} nodes and {} edges", len(nodes), len(links)
+            )
+            return {
+                "nodes": nodes,
+                "links": links,
+                "neighbours": neighbours,
+                "central_node_id": str(focus_node_id),
+                "max_triples": max_triples,
+                "reviewed": 0,
+                "skip": skip,
+                "limit": limit,
+                "hops": hops,
+                "truncation": truncation,
+                "next_cursor": next_cursor,
+            }
+
         # TODO: Links should have errors/properties/suggestions/... on them
         nodes, links = create_nodes_links(triples)
 
@@ -587,7 +710,7 @@ async def get_subgraph(
             logger.error(f"Error creating subgraph neighbours: {e}")
             raise HTTPException(details="Unable to fetch subgraph")
 
-        logger.info(f"Sample contains: {len(nodes)} nodes and {len(links)} edges")
+        logger.debug("Sample contains: {} nodes and {} edges", len(nodes), len(links))
 
         return graph_model.GraphDataWithFocusNode(
             nodes=nodes,
@@ -598,136 +721,114 @@ async def get_subgraph(
             reviewed=0,
             skip=skip,
             limit=limit,
+            hops=hops,
+            truncation=truncation,
+            next_cursor=next_cursor,
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"An error occurred: {e}")
 
 
-async def delete_graph(graph_id: ObjectId, db: AsyncIOMotorDatabase):
-    """Deletes a single graph including its nodes, edges, and triples."""
-
-    try:
-        db_graph = await db["graphs"].find_one({"_id": graph_id})
-
-        if db_graph is None:
-            raise Exception("Graph not found")
-
-        await db["graphs"].delete_one({"_id": graph_id})
-        await db["edges"].delete_one({"graph_id": graph_id})
-        await db["nodes"].delete_one({"graph_id": graph_id})
-        await db["triples"].delete_one({"graph_id": graph_id})
+async def delete_graph(
+    graph_id: ObjectId, db: AsyncIOMotorDatabase
+) -> Tuple[Dict, bool]:
+    """Marks a single graph for deletion.
 
-        return "Deleted graph"
-    except Exception as e:
-        logger.error(f"Failed to delete graph: {e}")
+    Its nodes, edges, and triples are deleted in the background with
+    `services.deletion.delete_graph_documents` when the returned flag is set. Returns
+    the deletion progress.
+    """
+    deletion, start = await start_graph_deletion(graph_id=graph_id, db=db)
+    if deletion is None:
+        raise HTTPException(status_code=404, detail="Graph not found")
+    return deletion, start
+
+
+def _download_triple(
+    t: Dict, nodeId2Name: Dict, edgeId2Name: Dict
+) -> graph_model.DownloadTriple:
+    return graph_model.DownloadTriple(
+        head=t["head"]["name"],
+        head_type=nodeId2Name.get(t["head"]["type"]),
+        head_properties={
+            # "main": t["head"]["properties"],
+            "is_reviewed": t["head"]["is_reviewed"],
+            "is_active": t["head"]["is_active"],
+            "created_at": t["head"]["created_at"],
+            "updated_at": t["head"]["updated_at"],
+        },
+        head_errors=t["head"]["errors"],
+        head_suggestions=t["head"]["suggestions"],
+        relation=edgeId2Name.get(t["edge"]["type"]),
+        relation_properties={
+            "main": t["edge"]["properties"],
+            "is_reviewed": t["edge"]["is_reviewed"],
+            "is_active": t["edge"]["is_active"],
+            "created_at": t["edge"]["created_at"],
+            "updated_at": t["edge"]["updated_at"],
+        },
+        relation_errors=t["edge"]["errors"],
+        relation_suggestions=t["edge"]["suggestions"],
+        tail=t["tail"]["name"],
+        tail_type=nodeId2Name.get(t["tail"]["type"]),
+        tail_properties={
+            "main": t["tail"]["properties"],
+            "is_reviewed": t["tail"]["is_reviewed"],
+            "is_active": t["tail"]["is_active"],
+            "created_at": t["tail"]["created_at"],
+            "updated_at": t["tail"]["updated_at"],
+        },
+        tail_errors=t["tail"]["errors"],
+        tail_suggestions=t["tail"]["suggestions"],
+    )
 
 
-async def download(
+async def stream_download(
     graph_id: ObjectId, db: AsyncIOMotorDatabase
-):  # -> graph_model.GraphDownload:
-    """Prepares graph data for download as JSON in client. Converts _id types to human readable format."""
-    try:
-        graph = await db["graphs"].find_one({"_id": graph_id})
+) -> Tuple[graph_model.DownloadMeta, AsyncIterator[graph_model.DownloadTriple]]:
+    """Prepares graph data for download as JSON in client. Converts _id types to human readable format.
 
+    Returns the graph's metadata and an iterator over its triples, which are read
+    from a cursor and transformed batch by batch as the response is streamed.
+    """
+    try:
+        graph = await db["graphs"].find_one({"_id": graph_id, **NOT_DELETED})
         if graph is None:
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, details="Graph does not exist"
+                status_code=status.HTTP_404_NOT_FOUND, detail="Graph does not exist"
             )
+        meta = graph_model.DownloadMeta(**graph)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error occurred downloading graph: {e}")
+        raise HTTPException(status_code=500)
 
-        nodeId2Name = {n["_id"]: n["name"] for n in graph["node_classes"]}
-        edgeId2Name = {e["_id"]: e["name"] for e in graph["edge_classes"]}
+    nodeId2Name = {n["_id"]: n["name"] for n in graph["node_classes"]}
+    edgeId2Name = {e["_id"]: e["name"] for e in graph["edge_classes"]}
 
-        triple_pipeline = [
-            {
-                "$match": {
-                    "graph_id": graph_id,
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "nodes",
-                    "localField": "head",
-                    "foreignField": "_id",
-                    "as": "head",
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "nodes",
-                    "localField": "tail",
-                    "foreignField": "_id",
-                    "as": "tail",
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "edges",
-                    "localField": "edge",
-                    "foreignField": "_id",
-                    "as": "edge",
-                }
-            },
-            {"$unwind": "$head"},
-            {"$unwind": "$tail"},
-            {"$unwind": "$edge"},
-            {
-                "$project": {
-                    "_id": 0,
-                    "graph_id": 0,
-                    "head.graph_id": 0,
-                    "head._id": 0,
-                    "edge.graph_id": 0,
-                    "edge._id": 0,
-                    "tail.graph_id": 0,
-                    "tail._id": 0,
-                }
-            },
-        ]
+    async def data():
+        try:
+            with track("triples", operation="download.triples"):
+                async for t in iter_populated_graph_triples(db=db, graph_id=graph_id):
+                    yield _download_triple(t, nodeId2Name, edgeId2Name)
+        except Exception as e:
+            # The response has started; the client receives a truncated body
+            logger.error(f"Error occurred downloading graph: {e}")
+            raise
 
-        triples = await db["triples"].aggregate(triple_pipeline).to_list(None)
-
-        # Transform triples
-        data = [
-            graph_model.DownloadTriple(
-                head=t["head"]["name"],
-                head_type=nodeId2Name.get(t["head"]["type"]),
-                head_properties={
-                    # "main": t["head"]["properties"],
-                    "is_reviewed": t["head"]["is_reviewed"],
-                    "is_active": t["head"]["is_active"],
-                    "created_at": t["head"]["created_at"],
-                    "updated_at": t["head"]["updated_at"],
-                },
-                head_errors=t["head"]["errors"],
-                head_suggestions=t["head"]["suggestions"],
-                relation=edgeId2Name.get(t["edge"]["type"]),
-                relation_properties={
-                    "main": t["edge"]["properties"],
-                    "is_reviewed": t["edge"]["is_reviewed"],
-                    "is_active": t["edge"]["is_active"],
-                    "created_at": t["edge"]["created_at"],
-                    "updated_at": t["edge"]["updated_at"],
-                },
-                relation_errors=t["edge"]["errors"],
-                relation_suggestions=t["edge"]["suggestions"],
-                tail=t["tail"]["name"],
-                tail_type=nodeId2Name.get(t["tail"]["type"]),
-                tail_properties={
-                    "main": t["tail"]["properties"],
-                    "is_reviewed": t["tail"]["is_reviewed"],
-                    "is_active": t["tail"]["is_active"],
-                    "created_at": t["tail"]["created_at"],
-                    "updated_at": t["tail"]["updated_at"],
-                },
-                tail_errors=t["tail"]["errors"],
-                tail_suggestions=t["tail"]["suggestions"],
-            )
-            for t in triples
-        ]
+    return meta, data()
 
-        meta = graph_model.DownloadMeta(**graph)
-        return graph_model.GraphDownload(meta=meta, data=data)
 
+async def download(
+    graph_id: ObjectId, db: AsyncIOMotorDatabase
+) -> graph_model.GraphDownload:
+    """Collects a whole graph download in memory (see `stream_download`)."""
+    meta, data = await stream_download(graph_id=graph_id, db=db)
+    try:
+        return graph_model.GraphDownload(meta=meta, data=[t async for t in data])
     except Exception as e:
         logger.error(f"Error occurred downloading graph: {e}")
         raise HTTPException(status_code=500)
@@ -752,7 +853,7 @@ async def update_settings(
         update_data = data.dict(exclude_unset=True)
         # Prepend 'settings.' to each key in the update_data
         update_data = dict(flatten_nested_dict(update_data, parent_key="settings"))
-        print("update_data", update_data)
+        logger.debug("update_data: {}", update_data)
 
         result = await db["graphs"].update_one(
             {"_id": graph_id},
@@ -761,6 +862,8 @@ async def update_settings(
         )
         # Return if modified.
         updated = result.modified_count > 0
+        if updated:
+            await bump_graph_version(graph_id=graph_id, db=db, changes={"graph": True})
         return {"item_modified": updated}
     except:
         traceback.print_exc()
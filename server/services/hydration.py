@@ -0,0 +1,171 @@
+"""Services for populating triples with their node and edge documents.
+
+Triples only reference their head/tail nodes and edge by _id. Instead of joining
+every triple with `$lookup` (which re-fetches a hub node once per incident triple),
+the distinct node and edge ids are loaded with batched `$in` queries and the
+populated triples are assembled in Python. Populated triples share the node and
+edge dicts, so callers must copy them before modifying them. Full documents (no
+projection) carry their errors and suggestions in either issue storage layout.
+
+`find_incident_triples` reads the triples of nodes/edges from the database for
+mutations, which must not rely on the per-process adjacency cache (see
+`services.adjacency`) as it may be stale under several workers.
+
+`iter_populated_graph_triples` hydrates a graph's triples batch by batch as they are
+read from their cursor, for callers (e.g. downloads) that do not need them all at
+once.
+"""
+
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from settings import settings
+from services.issue_store import attach_issues
+
+
+async def load_documents(
+    collection,
+    ids: Iterable[ObjectId],
+    projection: Optional[Dict] = None,
+) -> Dict[ObjectId, Dict]:
+    """Loads documents by _id in batches of `HYDRATION_BATCH_SIZE` ids.
+
+    The projection must not exclude `_id`.
+    """
+    ids = list(ids)
+    documents = {}
+    batch_size = settings.HYDRATION_BATCH_SIZE
+    for i in range(0, len(ids), batch_size):
+        async for doc in collection.find(
+            {"_id": {"$in": ids[i : i + batch_size]}}, projection
+        ):
+            documents[doc["_id"]] = doc
+    return documents
+
+
+async def find_incident_triples(
+    db: AsyncIOMotorDatabase,
+    graph_id: ObjectId,
+    node_ids: Iterable[ObjectId] = (),
+    edge_ids: Iterable[ObjectId] = (),
+) -> List[Dict]:
+    """Reads the distinct triples incident to any of `node_ids` or of any of `edge_ids`.
+
+    Triples are returned as `{_id, head, edge, tail}` (as from the adjacency cache).
+    Ids are queried in batches of `HYDRATION_BATCH_SIZE`.
+    """
+    queries = []
+    batch_size = settings.HYDRATION_BATCH_SIZE
+    node_ids, edge_ids = list(set(node_ids)), list(set(edge_ids))
+    for i in range(0, len(node_ids), batch_size):
+        batch = node_ids[i : i + batch_size]
+        queries += [{"head": {"$in": batch}}, {"tail": {"$in": batch}}]
+    for i in range(0, len(edge_ids), batch_size):
+        queries.append({"edge": {"$in": edge_ids[i : i + batch_size]}})
+
+    triples = {}
+    for query in queries:
+        async for t in db["triples"].find(
+            {"graph_id": graph_id, **query}, {"head": 1, "edge": 1, "tail": 1}
+        ):
+            triples[t["_id"]] = t
+    return list(triples.values())
+
+
+def assemble_triples(
+    triples: Iterable[Dict],
+    nodes: Dict[ObjectId, Dict],
+    edges: Dict[ObjectId, Dict],
+) -> List[Dict]:
+    """Replaces triple head/tail/edge ids with their documents.
+
+    Triples referencing a missing document are dropped (as with `$unwind`).
+    """
+    populated = []
+    for t in triples:
+        head = nodes.get(t["head"])
+        tail = nodes.get(t["tail"])
+        edge = edges.get(t["edge"])
+        if head is None or tail is None or edge is None:
+            continue
+        populated.append({**t, "head": head, "edge": edge, "tail": tail})
+    return populated
+
+
+async def hydrate_triples(
+    db: AsyncIOMotorDatabase,
+    triples: List[Dict],
+    node_projection: Optional[Dict] = None,
+    edge_projection: Optional[Dict] = None,
+) -> List[Dict]:
+    """Populates triples (e.g. from the adjacency cache) with two `$in` queries.
+
+    The order of `triples` is kept.
+    """
+    node_ids = {t["head"] for t in triples} | {t["tail"] for t in triples}
+    edge_ids = {t["edge"] for t in triples}
+
+    nodes = await load_documents(db["nodes"], node_ids, node_projection)
+    edges = await load_documents(db["edges"], edge_ids, edge_projection)
+    await attach_issues(
+        db,
+        nodes=nodes.values() if node_projection is None else (),
+        edges=edges.values() if edge_projection is None else (),
+    )
+    return assemble_triples(triples, nodes, edges)
+
+
+async def get_populated_graph_triples(
+    db: AsyncIOMotorDatabase,
+    graph_id: ObjectId,
+    node_projection: Optional[Dict] = None,
+    edge_projection: Optional[Dict] = None,
+) -> List[Dict]:
+    """Fetches every triple of a graph populated with its nodes and edges.
+
+    Nodes and edges are read by `graph_id` rather than by id, so each collection is
+    scanned once regardless of graph size.
+    """
+    triples = (
+        await db["triples"]
+        .find({"graph_id": graph_id}, {"head": 1, "edge": 1, "tail": 1})
+        .to_list(None)
+    )
+    nodes = {
+        n["_id"]: n
+        async for n in db["nodes"].find({"graph_id": graph_id}, node_projection)
+    }
+    edges = {
+        e["_id"]: e
+        async for e in db["edges"].find({"graph_id": graph_id}, edge_projection)
+    }
+    await attach_issues(
+        db,
+        nodes=nodes.values() if node_projection is None else (),
+        edges=edges.values() if edge_projection is None else (),
+    )
+    return assemble_triples(triples, nodes, edges)
+
+
+async def iter_populated_graph_triples(
+    db: AsyncIOMotorDatabase, graph_id: ObjectId
+) -> AsyncIterator[Dict]:
+    """Yields every triple of a graph populated with its nodes and edges.
+
+    Triples are hydrated `HYDRATION_BATCH_SIZE` at a time, so only one batch of them
+    and their documents is held in memory.
+    """
+    batch = []
+    async for triple in db["triples"].find(
+        {"graph_id": graph_id}, {"head": 1, "edge": 1, "tail": 1}
+    ).sort("_id"):
+        batch.append(triple)
+        if len(batch) == settings.HYDRATION_BATCH_SIZE:
+            for populated in await hydrate_triples(db, batch):
+                yield populated
+            batch = []
+    if batch:
+        for populated in await hydrate_triples(db, batch):
+            yield populated
@@ -0,0 +1,71 @@
+"""Indexes used by the services.
+
+`ensure_indexes` creates them (a no-op for existing indexes). It runs on start-up (see
+`CREATE_INDEXES_ON_STARTUP`) and from `db_manager.py create-indexes`.
+"""
+
+from typing import Dict, List
+
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, IndexModel
+
+from settings import settings
+from services.issue_store import ISSUES_COLLECTION
+from services.versions import CHANGES_COLLECTION
+
+
+def _issue_indexes() -> List[IndexModel]:
+    # Partial so items without errors/suggestions are not indexed
+    return [
+        IndexModel(
+            [("graph_id", ASCENDING), (f"{array}.id", ASCENDING)],
+            name=f"graph_id_{array}_id",
+            partialFilterExpression={f"{array}.id": {"$exists": True}},
+        )
+        for array in ["errors", "suggestions"]
+    ]
+
+
+def _graph_indexes() -> List[IndexModel]:
+    # Batched deletes/garbage collection (sorted on `_id`), counts and whole-graph loads
+    return [IndexModel([("graph_id", ASCENDING), ("_id", ASCENDING)])]
+
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "nodes": _graph_indexes() + _issue_indexes(),
+    "edges": _graph_indexes() + _issue_indexes(),
+    "triples": _graph_indexes()
+    + [
+        # Review queue refreshes and mutations look up the triples of nodes/edges
+        IndexModel([("edge", ASCENDING)]),
+        IndexModel([("head", ASCENDING)]),
+        IndexModel([("tail", ASCENDING)]),
+    ],
+    # Used when issues are stored in their own collection (`ISSUE_STORAGE`)
+    ISSUES_COLLECTION: [
+        IndexModel([("graph_id", ASCENDING), ("item_id", ASCENDING)]),
+        # Hydration, acknowledgement, count refreshes, migration and merges look
+        # issues up by their items only
+        IndexModel([("item_id", ASCENDING)]),
+        IndexModel(
+            [("graph_id", ASCENDING), ("type", ASCENDING), ("acknowledged", ASCENDING)]
+        ),
+        # Keyset pagination of listings
+        IndexModel([("graph_id", ASCENDING), ("kind", ASCENDING), ("_id", ASCENDING)]),
+    ],
+    CHANGES_COLLECTION: [
+        IndexModel([("graph_id", ASCENDING), ("version", ASCENDING)], unique=True),
+        IndexModel(
+            [("created_at", ASCENDING)],
+            expireAfterSeconds=settings.CHANGE_LOG_TTL_SECONDS,
+        ),
+    ],
+}
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> None:
+    """Creates the indexes of every collection."""
+    for collection, indexes in INDEXES.items():
+        names = await db[collection].create_indexes(indexes)
+        logger.debug("Ensured indexes on {}: {}", collection, ", ".join(names))
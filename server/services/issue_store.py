@@ -0,0 +1,357 @@
+"""Storage of errors and suggestions (issues).
+
+With `ISSUE_STORAGE = "embedded"` (the default) issues are kept in the `errors` and
+`suggestions` arrays of their node/edge. With `ISSUE_STORAGE = "collection"` they are
+documents in the `issues` collection instead:
+
+    {_id, graph_id, item_id, is_node, kind: "error" | "suggestion", type, value,
+     action, acknowledged, created_at, updated_at}
+
+and the arrays on items stay empty. Items then carry denormalised counts
+(`error_count`, `open_error_count`, `suggestion_count`, `open_suggestion_count`) so
+reads that only need counts never load issues; `attach_issues` fills the arrays of
+items that are returned in full. `db_manager.py migrate-issues` moves existing issues
+between the two layouts.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from settings import settings
+
+ISSUES_COLLECTION = "issues"
+
+
+def uses_issue_collection() -> bool:
+    return settings.ISSUE_STORAGE == "collection"
+
+
+def issue_array(is_error: bool) -> str:
+    return "errors" if is_error else "suggestions"
+
+
+def count_field(is_error: bool, open_only: bool = False) -> str:
+    kind = "error" if is_error else "suggestion"
+    return f"open_{kind}_count" if open_only else f"{kind}_count"
+
+
+# Projection of the issue counts (and embedded arrays) of items
+COUNT_PROJECTION = {
+    field: 1
+    for is_error in (True, False)
+    for field in (
+        issue_array(is_error),
+        count_field(is_error),
+        count_field(is_error, open_only=True),
+    )
+}
+
+
+def issue_count(doc: Dict, is_error: bool, open_only: bool = False) -> int:
+    """Returns the number of (open) errors/suggestions of an item in either layout."""
+    field = count_field(is_error, open_only)
+    if field in doc:
+        return doc[field]
+    issues = doc.get(issue_array(is_error)) or []
+    if open_only:
+        return sum(1 for i in issues if not i.get("acknowledged", False))
+    return len(issues)
+
+
+def has_open_issues_query(is_error: bool, flag: bool) -> Dict:
+    """Query on items with (or without) unacknowledged errors/suggestions."""
+    if uses_issue_collection():
+        field = count_field(is_error, open_only=True)
+        return {field: {"$gt": 0}} if flag else {field: {"$not": {"$gt": 0}}}
+    has_open = {"$elemMatch": {"acknowledged": {"$ne": True}}}
+    return {issue_array(is_error): has_open if flag else {"$not": has_open}}
+
+
+def to_issue_document(
+    issue: Dict, graph_id: ObjectId, item_id: ObjectId, is_node: bool, is_error: bool
+) -> Dict:
+    """Converts an embedded error/suggestion into an `issues` document."""
+    kind = "error" if is_error else "suggestion"
+    now = datetime.utcnow()
+    return {
+        "_id": issue.get("id") or ObjectId(),
+        "graph_id": graph_id,
+        "item_id": item_id,
+        "is_node": is_node,
+        "kind": kind,
+        "type": issue[f"{kind}_type"],
+        "value": issue[f"{kind}_value"],
+        "action": issue.get("action"),
+        "acknowledged": issue.get("acknowledged", False),
+        "created_at": issue.get("created_at", now),
+        "updated_at": issue.get("updated_at", now),
+    }
+
+
+def to_embedded_issue(doc: Dict) -> Dict:
+    """Converts an `issues` document into its embedded form."""
+    kind = doc["kind"]
+    return {
+        "id": doc["_id"],
+        "item_id": doc["item_id"],
+        f"{kind}_type": doc["type"],
+        f"{kind}_value": doc["value"],
+        "action": doc.get("action"),
+        "acknowledged": doc["acknowledged"],
+        "created_at": doc["created_at"],
+        "updated_at": doc["updated_at"],
+    }
+
+
+def counts_of(issues: Iterable[Dict]) -> Dict[str, int]:
+    """Returns the count fields of an item with the given `issues` documents."""
+    counts = {
+        count_field(is_error, open_only): 0
+        for is_error in (True, False)
+        for open_only in (False, True)
+    }
+    for issue in issues:
+        is_error = issue["kind"] == "error"
+        counts[count_field(is_error)] += 1
+        if not issue["acknowledged"]:
+            counts[count_field(is_error, open_only=True)] += 1
+    return counts
+
+
+def split_issues(
+    items: Iterable[Dict], is_node: bool, new_ids: bool = False
+) -> List[Dict]:
+    """Moves the embedded issues of item documents into `issues` documents.
+
+    The items' arrays are emptied and their counts set. With `new_ids` the issues are
+    given new ids (e.g. when copied onto a merged item).
+    """
+    documents = []
+    for item in items:
+        item_documents = [
+            to_issue_document(
+                {**issue, "id": ObjectId()} if new_ids else issue,
+                graph_id=item["graph_id"],
+                item_id=item["_id"],
+                is_node=is_node,
+                is_error=is_error,
+            )
+            for is_error in (True, False)
+            for issue in item.get(issue_array(is_error)) or []
+        ]
+        item.update({"errors": [], "suggestions": [], **counts_of(item_documents)})
+        documents.extend(item_documents)
+    return documents
+
+
+async def add_issues(
+    db: AsyncIOMotorDatabase,
+    graph_id: ObjectId,
+    is_node: bool,
+    is_error: bool,
+    issues: List[Dict],
+) -> List[ObjectId]:
+    """Adds embedded-form errors/suggestions (with `item_id`s) to their items.
+
+    Returns the ids of the items issues were added to.
+    """
+    if not issues:
+        return []
+    collection = db["nodes" if is_node else "edges"]
+    by_item = defaultdict(list)
+    for issue in issues:
+        by_item[ObjectId(issue["item_id"])].append(issue)
+
+    if not uses_issue_collection():
+        await collection.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": item_id},
+                    {"$push": {issue_array(is_error): {"$each": item_issues}}},
+                )
+                for item_id, item_issues in by_item.items()
+            ],
+            ordered=False,
+        )
+        return list(by_item)
+
+    documents = [
+        to_issue_document(issue, graph_id, item_id, is_node, is_error)
+        for item_id, item_issues in by_item.items()
+        for issue in item_issues
+    ]
+    await db[ISSUES_COLLECTION].insert_many(documents, ordered=False)
+    await refresh_issue_counts(db, is_node, by_item.keys())
+    return list(by_item)
+
+
+async def attach_issues(
+    db: AsyncIOMotorDatabase,
+    nodes: Iterable[Dict] = (),
+    edges: Iterable[Dict] = (),
+) -> None:
+    """Fills the `errors`/`suggestions` arrays of items from the `issues` collection.
+
+    Does nothing when issues are embedded.
+    """
+    if uses_issue_collection():
+        await _fill_issues(db, [*nodes, *edges])
+
+
+async def _fill_issues(db: AsyncIOMotorDatabase, items: List[Dict]) -> None:
+    items_by_id = {item["_id"]: item for item in items}
+    if not items_by_id:
+        return
+    for item in items:
+        item["errors"] = []
+        item["suggestions"] = []
+    async for doc in (
+        db[ISSUES_COLLECTION]
+        .find({"item_id": {"$in": list(items_by_id)}})
+        .sort("_id", 1)
+    ):
+        items_by_id[doc["item_id"]][issue_array(doc["kind"] == "error")].append(
+            to_embedded_issue(doc)
+        )
+
+
+async def refresh_issue_counts(
+    db: AsyncIOMotorDatabase, is_node: bool, item_ids: Iterable[ObjectId]
+) -> None:
+    """Recounts the denormalised issue counts of items from the `issues` collection."""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return
+    issues = defaultdict(list)
+    async for doc in db[ISSUES_COLLECTION].find(
+        {"item_id": {"$in": item_ids}}, {"item_id": 1, "kind": 1, "acknowledged": 1}
+    ):
+        issues[doc["item_id"]].append(doc)
+    await db["nodes" if is_node else "edges"].bulk_write(
+        [
+            UpdateOne({"_id": item_id}, {"$set": counts_of(issues[item_id])})
+            for item_id in item_ids
+        ],
+        ordered=False,
+    )
+
+
+async def acknowledge_issue_documents(
+    db: AsyncIOMotorDatabase,
+    is_node: bool,
+    is_error: bool,
+    item_ids: List[ObjectId],
+    issue_ids: Optional[List[ObjectId]] = None,
+) -> int:
+    """Acknowledges `issues` documents of the given items (all or only `issue_ids`).
+
+    Returns the number of acknowledged issues.
+    """
+    query = {
+        "item_id": {"$in": item_ids},
+        "kind": "error" if is_error else "suggestion",
+        "acknowledged": {"$ne": True},
+    }
+    if issue_ids is not None:
+        query["_id"] = {"$in": issue_ids}
+    result = await db[ISSUES_COLLECTION].update_many(
+        query, {"$set": {"acknowledged": True, "updated_at": datetime.utcnow()}}
+    )
+    if result.modified_count:
+        await refresh_issue_counts(db, is_node, item_ids)
+    return result.modified_count
+
+
+async def migrate_issues(
+    db: AsyncIOMotorDatabase, to_collection: bool, batch_size: int = 1000
+) -> Dict[str, int]:
+    """Moves every issue into the `issues` collection (or back into item arrays).
+
+    Safe to re-run after an interruption. Returns the number of migrated items per
+    collection.
+    """
+    migrated = {}
+    for collection, is_node in [("nodes", True), ("edges", False)]:
+        migrated[collection] = 0
+        if to_collection:
+            query = {
+                "$or": [
+                    {"errors.0": {"$exists": True}},
+                    {"suggestions.0": {"$exists": True}},
+                ]
+            }
+            while True:
+                items = await db[collection].find(query).limit(batch_size).to_list(None)
+                if not items:
+                    break
+                await _move_to_collection(db, db[collection], items, is_node)
+                migrated[collection] += len(items)
+        else:
+            item_ids = await db[ISSUES_COLLECTION].distinct(
+                "item_id", {"is_node": is_node}
+            )
+            for i in range(0, len(item_ids), batch_size):
+                batch = item_ids[i : i + batch_size]
+                items = await db[collection].find({"_id": {"$in": batch}}).to_list(None)
+                await _move_to_items(db, db[collection], items)
+                # Also drops issues of items that no longer exist
+                await db[ISSUES_COLLECTION].delete_many({"item_id": {"$in": batch}})
+                migrated[collection] += len(items)
+    return migrated
+
+
+async def _move_to_collection(db, collection, items: List[Dict], is_node: bool):
+    documents = split_issues(items, is_node)
+    # Upserts so re-running after an interruption does not duplicate issues
+    await db[ISSUES_COLLECTION].bulk_write(
+        [
+            UpdateOne(
+                {"_id": d["_id"]},
+                {"$setOnInsert": {k: v for k, v in d.items() if k != "_id"}},
+                upsert=True,
+            )
+            for d in documents
+        ],
+        ordered=False,
+    )
+    await collection.bulk_write(
+        [
+            UpdateOne(
+                {"_id": item["_id"]},
+                {
+                    "$set": {
+                        k: item[k] for k in ["errors", "suggestions", *counts_of([])]
+                    }
+                },
+            )
+            for item in items
+        ],
+        ordered=False,
+    )
+
+
+async def _move_to_items(db, collection, items: List[Dict]):
+    if not items:
+        return
+    await _fill_issues(db, items)
+    await collection.bulk_write(
+        [
+            UpdateOne(
+                {"_id": item["_id"]},
+                {
+                    "$set": {
+                        "errors": item["errors"],
+                        "suggestions": item["suggestions"],
+                    },
+                    "$unset": {field: "" for field in counts_of([])},
+                },
+            )
+            for item in items
+        ],
+        ordered=False,
+    )
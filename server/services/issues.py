@@ -0,0 +1,236 @@
+"""Services for listing the errors and suggestions (issues) of a graph.
+
+Embedded issues (in the `errors`/`suggestions` arrays of nodes and edges) are unwound
+and filtered server-side; issues in the `issues` collection (see `services.issue_store`)
+are queried directly. Either way listings page through issues by id (keyset
+pagination), so issues before the cursor are skipped by the initial match rather than
+read and dropped with `$skip`. The partial `graph_id_<array>_id` indexes and the
+`issues` indexes (see `services.indexes`) cover that match.
+
+The collection is read in `_id` order until the page is full, so a page costs about
+its own size (plus the skipped issues of other classes when filtering by item class).
+Embedded issues are still unwound and top-k sorted from every item with an issue
+after the cursor, so those pages cost more the more issues follow (the first most).
+"""
+
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from services.graph import get_item_classes
+from services.issue_store import (
+    ISSUES_COLLECTION,
+    to_embedded_issue,
+    uses_issue_collection,
+)
+
+
+def _issue_pipeline(
+    graph_id: ObjectId,
+    array: str,
+    issue_match: Dict,
+    limit: int,
+    after: Optional[ObjectId] = None,
+    item_type: Optional[ObjectId] = None,
+) -> List[Dict]:
+    id_match = {"$gt": after} if after is not None else {"$exists": True}
+    match = {"graph_id": graph_id, f"{array}.id": id_match}
+    if item_type is not None:
+        match["type"] = item_type
+    if issue_match:
+        match[array] = {"$elemMatch": issue_match}
+
+    return [
+        {"$match": match},
+        {"$project": {"name": 1, "type": 1, array: 1}},
+        {"$unwind": f"${array}"},
+        {
+            "$match": {
+                f"{array}.id": id_match,
+                **{f"{array}.{k}": v for k, v in issue_match.items()},
+            }
+        },
+        {"$sort": {f"{array}.id": 1}},
+        {"$limit": limit},
+    ]
+
+
+async def _edge_names(
+    edge_ids: List[ObjectId], db: AsyncIOMotorDatabase
+) -> Dict[ObjectId, str]:
+    """Names edges by their head and tail nodes."""
+    triples = (
+        await db["triples"]
+        .find({"edge": {"$in": edge_ids}}, {"head": 1, "edge": 1, "tail": 1})
+        .to_list(None)
+    )
+    node_ids = list({t["head"] for t in triples} | {t["tail"] for t in triples})
+    names = {
+        n["_id"]: n["name"]
+        for n in await db["nodes"]
+        .find({"_id": {"$in": node_ids}}, {"name": 1})
+        .to_list(None)
+    }
+    return {
+        t["edge"]: f"{names.get(t['head'], '')} -> {names.get(t['tail'], '')}"
+        for t in triples
+    }
+
+
+async def _list_issue_documents(
+    graph_id: ObjectId,
+    is_error: bool,
+    db: AsyncIOMotorDatabase,
+    limit: int,
+    after: Optional[ObjectId],
+    issue_query: Dict,
+    is_node: Optional[bool],
+    item_type: Optional[ObjectId],
+) -> List[Tuple[ObjectId, bool, Dict]]:
+    """Returns (id, is_node, item with the issue) of issues in the `issues` collection."""
+    query = {
+        "graph_id": graph_id,
+        "kind": "error" if is_error else "suggestion",
+        **issue_query,
+    }
+    if after is not None:
+        query["_id"] = {"$gt": after}
+    if is_node is not None:
+        query["is_node"] = is_node
+
+    pipeline = [{"$match": query}, {"$sort": {"_id": 1}}]
+    if item_type is not None:
+        # Issues do not store their item's class (which can change), so each is
+        # joined to its item by id while the page fills up
+        type_match = []
+        for collection, item_is_node in [("nodes", True), ("edges", False)]:
+            if is_node is None or is_node == item_is_node:
+                pipeline.append(
+                    {
+                        "$lookup": {
+                            "from": collection,
+                            "localField": "item_id",
+                            "foreignField": "_id",
+                            "as": collection,
+                        }
+                    }
+                )
+                type_match.append({f"{collection}.type": item_type})
+        pipeline += [
+            {"$match": {"$or": type_match}},
+            {"$project": {"nodes": 0, "edges": 0}},
+        ]
+    pipeline.append({"$limit": limit})
+
+    docs = await db[ISSUES_COLLECTION].aggregate(pipeline).to_list(None)
+    items = {}
+    for collection, item_is_node in [("nodes", True), ("edges", False)]:
+        item_ids = [d["item_id"] for d in docs if d["is_node"] == item_is_node]
+        if item_ids:
+            async for item in db[collection].find(
+                {"_id": {"$in": item_ids}}, {"name": 1, "type": 1}
+            ):
+                items[item["_id"]] = item
+
+    array = "errors" if is_error else "suggestions"
+    return [
+        (
+            d["_id"],
+            d["is_node"],
+            {
+                **items.get(d["item_id"], {"_id": d["item_id"]}),
+                array: to_embedded_issue(d),
+            },
+        )
+        for d in docs
+    ]
+
+
+async def list_issues(
+    graph_id: ObjectId,
+    is_error: bool,
+    db: AsyncIOMotorDatabase,
+    limit: int,
+    after: Optional[ObjectId] = None,
+    issue_type: Optional[str] = None,
+    acknowledged: Optional[bool] = None,
+    is_node: Optional[bool] = None,
+    item_type: Optional[ObjectId] = None,
+) -> Tuple[List[Dict], Optional[ObjectId]]:
+    """Returns a page of a graph's errors or suggestions ordered by id.
+
+    Filters on the error/suggestion type, acknowledged state, item kind (node/edge) and
+    item class. Returns the issues (with item details) and the id to continue after if
+    there are more.
+    """
+    array = "errors" if is_error else "suggestions"
+    issue_match = {}
+    if issue_type is not None:
+        issue_match["error_type" if is_error else "suggestion_type"] = issue_type
+    if acknowledged is not None:
+        issue_match["acknowledged"] = True if acknowledged else {"$ne": True}
+
+    nodeId2Details, edgeId2Details = await get_item_classes(graph_id=graph_id, db=db)
+
+    results = []
+    if uses_issue_collection():
+        issue_query = {}
+        if issue_type is not None:
+            issue_query["type"] = issue_type
+        if acknowledged is not None:
+            issue_query["acknowledged"] = True if acknowledged else {"$ne": True}
+        results.append(
+            await _list_issue_documents(
+                graph_id=graph_id,
+                is_error=is_error,
+                db=db,
+                limit=limit + 1,
+                after=after,
+                issue_query=issue_query,
+                is_node=is_node,
+                item_type=item_type,
+            )
+        )
+    for collection, item_is_node in [("nodes", True), ("edges", False)]:
+        if uses_issue_collection() or (is_node is not None and is_node != item_is_node):
+            continue
+        docs = (
+            await db[collection]
+            .aggregate(
+                _issue_pipeline(
+                    graph_id=graph_id,
+                    array=array,
+                    issue_match=issue_match,
+                    limit=limit + 1,
+                    after=after,
+                    item_type=item_type,
+                )
+            )
+            .to_list(None)
+        )
+        results.append([(d[array]["id"], item_is_node, d) for d in docs])
+
+    page = list(heapq.merge(*results, key=lambda r: r[0]))[: limit + 1]
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    edge_names = await _edge_names(
+        [d["_id"] for _, item_is_node, d in page if not item_is_node], db
+    )
+    issues = []
+    for _, item_is_node, d in page:
+        classes = nodeId2Details if item_is_node else edgeId2Details
+        issues.append(
+            {
+                **d[array],
+                "item_id": d["_id"],
+                "is_node": item_is_node,
+                "item_name": d.get("name", "")
+                if item_is_node
+                else edge_names.get(d["_id"], ""),
+                "item_type": classes.get(d.get("type"), {}).get("name"),
+            }
+        )
+    return issues, (page[-1][0] if has_more else None)
@@ -1,18 +1,24 @@
 """Services for performing CRUD operations on graph items (nodes/edges)"""
 
-from typing import Dict
+from typing import Dict, List, Tuple
 from fastapi import HTTPException, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
 import traceback
 from datetime import datetime
-from collections import defaultdict
 from loguru import logger
 
-from models import graph as graph_model
 from models.misc import ItemClass, ItemClassWithId, ItemType, ItemUpdate, ReviewBody
-from .utils import concatenate_arrays
 from .graph import get_subgraph_review_progress
+from .adjacency import adjacency_cache
+from .review_queue import review_queue
+from .autocomplete import name_index
+from .search import search_index
+from .versions import bump_graph_version
+from .degrees import adjust_active_degrees, get_active_degrees, triple_endpoints
+from .hydration import find_incident_triples
+from .merge import merge_node_clusters
+from .issue_store import acknowledge_issue_documents, uses_issue_collection
 
 
 async def delete_property(
@@ -27,6 +33,19 @@ async def delete_property(
         )
 
         property_deleted = result.modified_count > 0
+        if property_deleted:
+            item = await db["nodes" if is_node else "edges"].find_one(
+                {"_id": ObjectId(item_id)}, {"graph_id": 1}
+            )
+            if is_node:
+                await search_index.refresh(
+                    graph_id=item["graph_id"], db=db, node_ids=[item["_id"]]
+                )
+            await bump_graph_version(
+                graph_id=item["graph_id"],
+                db=db,
+                changes={"nodes" if is_node else "edges": [item["_id"]]},
+            )
 
         return {"property_deleted": property_deleted}
     except Exception as e:
@@ -52,7 +71,7 @@ async def merge_nodes(
 
         if source_node is None:
             raise HTTPException(
-                status_code=404, details="Unable to merge node - source node not found."
+                status_code=404, detail="Unable to merge node - source node not found."
             )
 
         graph_id = ObjectId(source_node["graph_id"])
@@ -68,209 +87,23 @@ async def merge_nodes(
 
         if target_node is None:
             raise HTTPException(
-                status_code=404, details="Unable to merge node - target node not found."
+                status_code=404, detail="Unable to merge node - target node not found."
             )
 
-        # Both source/target nodes exist
-        source_id = ObjectId(source_node["_id"])
-        target_id = ObjectId(target_node["_id"])
-
-        # Create new merged node (merges properties together), sets is_reviewed and is_active to defaults.
-        merged_node_properties = concatenate_arrays(
-            array1=target_node.get("properties", []),
-            array2=source_node.get("properties", []),
-        )
-
-        new_merged_node = graph_model.CreateItem(
-            name=new_source_name,
-            type=new_source_type,
-            properties=merged_node_properties,
-            value=source_node["value"] + target_node["value"],
-            errors=source_node["errors"] + target_node["errors"],
-            suggestions=source_node["suggestions"] + target_node["suggestions"],
-            is_reviewed=False,
-            is_active=True,
+        # Merge target first so its properties take precedence; the merged node takes the new name/type.
+        merged = await merge_node_clusters(
             graph_id=graph_id,
+            clusters=[[target_node, source_node]],
+            names=[{"name": new_source_name, "type": new_source_type}],
+            db=db,
         )
+        return merged[0]
 
-        # Find all triples that are referenced to the source/target nodes and reassign them to the new node; deleting any that would be self referenced.
-        pipeline = [
-            {
-                "$match": {
-                    "graph_id": graph_id,
-                    "$or": [
-                        {"head": {"$in": [source_id, target_id]}},
-                        {"tail": {"$in": [source_id, target_id]}},
-                    ],
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "nodes",
-                    "localField": "head",
-                    "foreignField": "_id",
-                    "as": "head",
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "nodes",
-                    "localField": "tail",
-                    "foreignField": "_id",
-                    "as": "tail",
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "edges",
-                    "localField": "edge",
-                    "foreignField": "_id",
-                    "as": "edge",
-                }
-            },
-            {"$unwind": "$head"},
-            {"$unwind": "$tail"},
-            {"$unwind": "$edge"},
-            {
-                "$project": {
-                    "graph_id": 0,
-                    "head.graph_id": 0,
-                    "edge.graph_id": 0,
-                    "tail.graph_id": 0,
-                }
-            },
-        ]
-
-        triples = await db["triples"].aggregate(pipeline).to_list(None)
-
-        # 3. Create new merged node
-        db_new_merged_node = await db["nodes"].insert_one(new_merged_node.dict())
-        new_merged_node_id = db_new_merged_node.inserted_id
-
-        def replace_id(id):
-            return new_merged_node_id if id in [source_id, target_id] else id
-
-        # UPDATE triples and edges
-        new_edges = defaultdict(list)
-        for triple in triples:
-            head_id = replace_id(triple["head"]["_id"])
-            tail_id = replace_id(triple["tail"]["_id"])
-            edge_type = triple["edge"]["type"]
-
-            if head_id != tail_id:
-                # Update edge information
-                base_triple = (head_id, edge_type, tail_id)
-                new_edges[base_triple].append(triple["edge"])
-
-        # Merge edges, create new triples and edges, remove old triples/edges
-        for base_triple, edges in new_edges.items():
-            head_id, edge_type, tail_id = base_triple
-
-            # TODO: filter errors/suggestions to make context make sense.
-            edge_errors = []
-            edge_suggestions = []
-            edge_properties = []
-            edge_value = 0
-            edge_ids = []
-
-            for e in edges:
-                edge_errors.extend(e["errors"])
-                edge_suggestions.extend(e["suggestions"])
-                edge_properties.extend(e["properties"])
-                edge_value += e["value"]
-                edge_ids.append(ObjectId(e["_id"]))
-
-            merged_edge = graph_model.CreateItem(
-                type=edge_type,
-                value=edge_value,
-                properties=edge_properties,
-                errors=edge_errors,
-                suggestions=edge_suggestions,
-                is_reviewed=False,
-                is_active=True,
-                graph_id=graph_id,
-            )
-
-            # Create new edge
-            _new_merged_edge = await db["edges"].insert_one(merged_edge.dict())
-            _new_merged_edge_id = _new_merged_edge.inserted_id
-
-            # Create new triple
-            await db["triples"].insert_one(
-                {
-                    "head": ObjectId(head_id),
-                    "edge": _new_merged_edge_id,
-                    "tail": ObjectId(tail_id),
-                    "graph_id": graph_id,
-                    "updated_at": datetime.utcnow(),
-                    "created_at": datetime.utcnow(),
-                }
-            )
-
-            # Delete existing edges
-            await db["edges"].delete_many({"_id": {"$in": edge_ids}})
-
-            # # Delete old triple(s)
-            await db["triples"].delete_many(
-                {"graph_id": graph_id, "edge": {"$in": edge_ids}}
-            )
-
-        # Delete existing nodes
-        await db["nodes"].delete_many({"_id": {"$in": [source_id, target_id]}})
-
-        # Return new subgraph data
-        unique_nodes = {}
-        unique_edges = {}
-
-        total_errors = 0
-        total_suggestions = 0
-        total_reviewed = 0
-
-        for item in triples:
-            for node_type in ["head", "tail"]:
-                node = item[node_type]
-                node_id = node["_id"]
-
-                if node_id not in unique_nodes:
-                    unique_nodes[node_id] = node
-                    total_errors += len(node["errors"])
-                    total_suggestions += len(node["suggestions"])
-                    total_reviewed += int(node["is_reviewed"])
-
-            edge = item["edge"]
-            edge_id = edge["_id"]
-
-            if edge_id not in unique_edges:
-                unique_edges[edge_id] = edge
-                total_errors += len(edge["errors"])
-                total_suggestions += len(edge["suggestions"])
-                total_reviewed += int(edge["is_reviewed"])
-
-        total_items = len(unique_nodes) + len(unique_edges)
-
-        new_subgraph = graph_model.SubGraph(
-            _id=new_merged_node_id,
-            name=new_merged_node.name,
-            type=new_merged_node.type,
-            value=new_merged_node.value,
-            errors=total_errors,
-            suggestions=total_suggestions,
-            reviewed_progress=total_reviewed / total_items,
-            node_count=0,
-            edge_count=0,
-            nodes_reviewed=0,
-            edges_reviewed=0,
-        )
-
-        return graph_model.MergedNode(
-            item_modified=True,
-            new_node=graph_model.Node(**new_merged_node.dict(), _id=new_merged_node_id),
-            old_node_ids=[str(source_id), str(target_id)],
-            new_subgraph=new_subgraph,
-        )
-
-    except:
-        traceback.print_exc()
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to merge nodes: {e}")
+        raise HTTPException(status_code=500, detail="Unable to merge nodes")
 
 
 async def acknowledge(
@@ -290,19 +123,48 @@ async def acknowledge(
     try:
         array_name = "errors" if is_error else "suggestions"
 
-        result = await db["nodes" if is_node else "edges"].update_one(
-            {
-                "_id": item_id,
-                f"{array_name}.id": eos_item_id,
-            },
-            {
-                "$set": {
-                    f"{array_name}.$.acknowledged": True,
+        if uses_issue_collection():
+            updated = (
+                await acknowledge_issue_documents(
+                    db,
+                    is_node=is_node,
+                    is_error=is_error,
+                    item_ids=[item_id],
+                    issue_ids=[eos_item_id],
+                )
+                > 0
+            )
+        else:
+            result = await db["nodes" if is_node else "edges"].update_one(
+                {
+                    "_id": item_id,
+                    f"{array_name}.id": eos_item_id,
                 },
-                "$currentDate": {f"{array_name}.$.updated_at": True},
-            },
-        )
-        updated = result.modified_count > 0
+                {
+                    "$set": {
+                        f"{array_name}.$.acknowledged": True,
+                    },
+                    "$currentDate": {f"{array_name}.$.updated_at": True},
+                },
+            )
+            updated = result.modified_count > 0
+
+        if updated:
+            item = await db["nodes" if is_node else "edges"].find_one(
+                {"_id": item_id}, {"graph_id": 1}
+            )
+            await review_queue.refresh(
+                graph_id=item["graph_id"],
+                db=db,
+                node_ids=[item_id] if is_node else [],
+                edge_ids=[] if is_node else [item_id],
+            )
+            await bump_graph_version(
+                graph_id=item["graph_id"],
+                db=db,
+                changes={"nodes" if is_node else "edges": [item_id]},
+            )
+
         return {"item_acknowledged": updated}
 
     except Exception as e:
@@ -319,8 +181,7 @@ async def update_item(
 
     """
     try:
-        print('Executing: "update_item" ')
-        print(data, item_type)
+        logger.debug('Executing: "update_item" on {} {}', item_type, item_id)
 
         if item_type not in ItemType:
             raise HTTPException(
@@ -349,7 +210,7 @@ async def update_item(
             )
             graph_id = ObjectId(item["graph_id"])
             if name_or_type_update:
-                print("Node having name/type updated...")
+                logger.debug("Node having name/type updated...")
                 # Need to check whether any other nodes on this graph exist with the same node/type combo.
 
                 existing_node = await db["nodes"].find_one(
@@ -361,7 +222,7 @@ async def update_item(
                     }
                 )
 
-                print(f"Node exists: {existing_node}")
+                logger.debug("Node exists: {}", existing_node is not None)
 
                 linked_triples = 0
                 if existing_node:
@@ -381,7 +242,6 @@ async def update_item(
                         .to_list(None)
                     )
                     linked_triples = len(triples)
-                    print("existing_node", existing_node)
                     return {
                         "node_exists": existing_node is not None,
                         "linked_triples": linked_triples,
@@ -399,7 +259,7 @@ async def update_item(
             update_data.pop("reverse_direction", None)
 
         if update_data.get("reverse_direction"):
-            print("reversing edge!")
+            logger.debug("Reversing edge: {}", item_id)
             try:
                 # Get triple edge is on
                 triple = await db["triples"].find_one({"edge": item_id})
@@ -411,19 +271,43 @@ async def update_item(
                         "$currentDate": {"updated_at": True},
                     },
                 )
+                adjacency_cache.add_triples(
+                    triple["graph_id"],
+                    [{**triple, "head": triple["tail"], "tail": triple["head"]}],
+                )
+                await review_queue.refresh(
+                    graph_id=triple["graph_id"], db=db, edge_ids=[item_id]
+                )
+                await bump_graph_version(
+                    graph_id=triple["graph_id"],
+                    db=db,
+                    changes={"triples": [triple["_id"]]},
+                )
             except:
                 traceback.print_exc()
 
         else:
-            print("updating item")
+            logger.debug("Updating item: {}", item_id)
             try:
-                result = await db[
-                    "nodes" if item_type == ItemType.node else "edges"
-                ].update_one(
+                collection = "nodes" if item_type == ItemType.node else "edges"
+                result = await db[collection].update_one(
                     {"_id": item_id},
                     {"$set": update_data, "$currentDate": {"updated_at": True}},
                     # upsert=True,
                 )
+                if item_type == ItemType.node:
+                    await name_index.refresh(
+                        graph_id=item["graph_id"], db=db, node_ids=[item_id]
+                    )
+                    await search_index.refresh(
+                        graph_id=item["graph_id"], db=db, node_ids=[item_id]
+                    )
+                if result.modified_count:
+                    await bump_graph_version(
+                        graph_id=item["graph_id"],
+                        db=db,
+                        changes={collection: [item_id]},
+                    )
             except:
                 traceback.print_exc()
 
@@ -433,6 +317,102 @@ async def update_item(
         traceback.print_exc()
 
 
+async def set_activation(
+    graph_id: ObjectId,
+    item_ids: List[ObjectId],
+    is_node: bool,
+    new_state: bool,
+    db: AsyncIOMotorDatabase,
+) -> Tuple[List[ObjectId], List[ObjectId], List[ObjectId]]:
+    """
+    Sets the activation state of items (nodes or edges) of a graph.
+
+    Deactivating nodes also deactivates their connected edges, and deactivating nodes or
+    edges deactivates neighbouring nodes left without any active triple (orphans).
+    Orphans are detected from the nodes' maintained `active_degree` with a single read.
+
+    Returns:
+    The ids of the items whose state changed, the orphaned node ids and the connected
+    edge ids that were deactivated.
+    """
+    collection = "nodes" if is_node else "edges"
+    updated_at = datetime.utcnow()
+
+    changing = [
+        i["_id"]
+        for i in await db[collection]
+        .find({"_id": {"$in": item_ids}, "is_active": {"$ne": new_state}}, {"_id": 1})
+        .to_list(None)
+    ]
+    if not changing:
+        return [], [], []
+
+    # Read from the database: the adjacency cache may be stale under several workers
+    connected_triples = await find_incident_triples(
+        db=db,
+        graph_id=graph_id,
+        node_ids=changing if is_node else (),
+        edge_ids=() if is_node else changing,
+    )
+
+    orphan_nodes = []
+    orphan_edges = []
+    losses = {}
+
+    # Only do 1-hop or orphan logic if deactivating.
+    if new_state is False:
+        if is_node:
+            # All connected edges are deactivated with the nodes
+            orphan_edges = [t["edge"] for t in connected_triples]
+            active_edges = {
+                e["_id"]
+                for e in await db["edges"]
+                .find({"_id": {"$in": orphan_edges}, "is_active": True}, {"_id": 1})
+                .to_list(None)
+            }
+            deactivated = [t for t in connected_triples if t["edge"] in active_edges]
+        else:
+            deactivated = connected_triples
+
+        # Nodes are orphaned once they have no remaining active triples
+        losses = triple_endpoints(deactivated)
+        degrees = await get_active_degrees(db, graph_id, losses.keys())
+        deactivated_nodes = set(changing) if is_node else set()
+        orphan_nodes = [
+            node_id
+            for node_id, loss in losses.items()
+            if node_id not in deactivated_nodes and degrees.get(node_id, 0) - loss <= 0
+        ]
+
+    await db[collection].update_many(
+        {"_id": {"$in": changing}},
+        {"$set": {"is_active": new_state, "updated_at": updated_at}},
+    )
+
+    if new_state is False:
+        await adjust_active_degrees(db, {k: -v for k, v in losses.items()})
+
+        # Update the orphan nodes and edges
+        await db["nodes"].update_many(
+            {"_id": {"$in": orphan_nodes}},
+            {"$set": {"is_active": new_state, "updated_at": updated_at}},
+        )
+        await db["edges"].update_many(
+            {"_id": {"$in": orphan_edges}},
+            {"$set": {"is_active": new_state, "updated_at": updated_at}},
+        )
+    elif not is_node:
+        # Reactivated edges count towards their nodes' active degree again
+        await adjust_active_degrees(db, triple_endpoints(connected_triples))
+
+    node_ids = orphan_nodes + (changing if is_node else [])
+    edge_ids = orphan_edges + ([] if is_node else changing)
+    await bump_graph_version(
+        graph_id=graph_id, db=db, changes={"nodes": node_ids, "edges": edge_ids}
+    )
+    return changing, orphan_nodes, orphan_edges
+
+
 async def toggle_activation(item_id: ObjectId, is_node: bool, db: AsyncIOMotorDatabase):
     """
     Toggles the activation state of a given item and its neighbours in the database.
@@ -466,71 +446,15 @@ async def toggle_activation(item_id: ObjectId, is_node: bool, db: AsyncIOMotorDa
         # Get current 'is_active' state and compute its inverse
         is_active = item.get("is_active", False)
         new_state = not is_active
-        updated_at = datetime.utcnow()
 
-        # Update the item with the new 'is_active' state
-        update_result = await db[collection].update_one(
-            {"_id": item_id},
-            {"$set": {"is_active": new_state, "updated_at": updated_at}},
+        updated_ids, orphan_nodes, orphan_edges = await set_activation(
+            graph_id=item["graph_id"],
+            item_ids=[item_id],
+            is_node=is_node,
+            new_state=new_state,
+            db=db,
         )
-
-        # Check if the update was successful
-        item_updated = update_result.modified_count > 0
-
-        orphan_nodes = []
-        orphan_edges = []
-
-        # Only do 1-hop or orphan logic if deactivating.
-        if new_state is False:
-            if is_node:
-                connected_edges = (
-                    await db["triples"]
-                    .find({"$or": [{"head": item_id}, {"tail": item_id}]})
-                    .to_list(None)
-                )
-
-                for edge in connected_edges:
-                    # get the count of edges connected to the head and tail
-                    count_head = await db["triples"].count_documents(
-                        {"$or": [{"head": edge["head"]}, {"tail": edge["head"]}]}
-                    )
-                    count_tail = await db["triples"].count_documents(
-                        {"$or": [{"head": edge["tail"]}, {"tail": edge["tail"]}]}
-                    )
-                    # if the count is 1, they will be orphaned if the edge is removed
-                    if count_head == 1:
-                        orphan_nodes.append(edge["head"])
-                    if count_tail == 1:
-                        orphan_nodes.append(edge["tail"])
-
-                    orphan_edges.append(edge["edge"])  # NOTE: _id is the triple id.
-
-            else:  # is_node = False
-                # get the edge with the provided id
-                edge = await db["triples"].find_one({"_id": item_id})
-                if edge:
-                    # get the count of edges connected to the head and tail
-                    count_head = await db["triples"].count_documents(
-                        {"$or": [{"head": edge["head"]}, {"tail": edge["head"]}]}
-                    )
-                    count_tail = await db["triples"].count_documents(
-                        {"$or": [{"head": edge["tail"]}, {"tail": edge["tail"]}]}
-                    )
-                    # if the count is 1, they will be orphaned if the edge is removed
-                    if count_head == 1:
-                        orphan_nodes.append(edge["head"])
-                    if count_tail == 1:
-                        orphan_nodes.append(edge["tail"])
-
-            # Update the orphan nodes and edges
-            await db["nodes"].update_many(
-                {"_id": {"$in": orphan_nodes}},
-                {"$set": {"is_active": new_state, "updated_at": updated_at}},
-            )
-            await db["edges"].update_many(
-                {"_id": {"$in": orphan_edges}},
-                {"$set": {"is_active": new_state, "updated_at": updated_at}},
-            )
+        item_updated = len(updated_ids) > 0
 
         return {
             "item_updated": item_updated,
@@ -629,6 +553,19 @@ async def toggle_review(
                 else:
                     edge_diff = 1 if not is_reviewed else -1
 
+        if item_reviewed:
+            neighbours = (data.neighbours or {}) if data.review_all else {}
+            node_ids = ([item_id] if is_node else []) + neighbours.get("nodes", [])
+            edge_ids = ([] if is_node else [item_id]) + neighbours.get("links", [])
+            await review_queue.refresh(
+                graph_id=item["graph_id"], db=db, node_ids=node_ids, edge_ids=edge_ids
+            )
+            await bump_graph_version(
+                graph_id=item["graph_id"],
+                db=db,
+                changes={"nodes": node_ids, "edges": edge_ids},
+            )
+
         # # TODO: Returns updated reviewed_progress for all items involved
         # if is_node:
         #     match_query = {"$match": {"$or": [{"head": item_id}, {"tail": item_id}]}}
@@ -743,6 +680,7 @@ async def add_item_class(
             result = await db["graphs"].update_one(
                 {"_id": graph_id}, {"$push": {class_list_name: new_class_object}}
             )
+            await bump_graph_version(graph_id=graph_id, db=db, changes={"graph": True})
 
             return {
                 "classes_modified": result.modified_count > 0,
@@ -768,8 +706,7 @@ async def update_item_class(
         if graph is None:
             raise HTTPException(status_code=404, detail="Graph not found")
 
-        print("item_class", item_class)
-        print("class_list_name", class_list_name)
+        logger.debug("Updating {} item class: {}", class_list_name, item_class.id)
 
         result = await db["graphs"].update_one(
             {
@@ -785,6 +722,8 @@ async def update_item_class(
             },
         )
 
+        if result.modified_count:
+            await bump_graph_version(graph_id=graph_id, db=db, changes={"graph": True})
         return {"classes_modified": result.modified_count > 0}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,323 @@
+"""Merging of duplicate nodes.
+
+Clusters of duplicate nodes are merged in two phases. `plan_merges` rewrites every
+triple incident to a clustered node in memory: each node is mapped to the new node of
+its cluster, triples that become self-referencing are dropped and the edges of triples
+sharing a (head, edge type, tail) are merged into a single edge. `apply_merge_plan`
+then writes the plan as a single atomic mutation (see `services.transactions`) with a
+fixed number of bulk operations, however many clusters are merged.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from models import graph as graph_model
+from services.adjacency import adjacency_cache
+from services.autocomplete import name_index
+from services.class_stats import discount_class_stats
+from services.search import search_index
+from services.degrees import adjust_active_degrees, triple_endpoints
+from services.hydration import find_incident_triples, hydrate_triples
+from services.issue_store import (
+    ISSUES_COLLECTION,
+    attach_issues,
+    split_issues,
+    uses_issue_collection,
+)
+from services.review_queue import review_queue
+from services.transactions import Delete, Mutation, apply_mutation
+from services.versions import bump_graph_version
+from services.utils import concatenate_arrays
+
+
+class MergePlan(NamedTuple):
+    nodes: List[Dict]  # New merged node documents
+    edges: List[Dict]  # New merged edge documents
+    triples: List[Dict]  # New triples
+    removed_node_ids: List[ObjectId]
+    removed_nodes: List[Dict]  # Node documents merged into the new nodes
+    removed_edge_ids: List[ObjectId]
+    removed_triples: List[Dict]  # Hydrated triples replaced or dropped by the merge
+    summaries: List[graph_model.MergedNode]
+
+
+def merge_node_documents(
+    graph_id: ObjectId,
+    target: Dict,
+    sources: List[Dict],
+    name: Optional[str] = None,
+    type: Optional[ObjectId] = None,
+) -> graph_model.CreateItem:
+    """Combines a cluster of nodes into a new node.
+
+    The target's name and type are kept unless given; its properties take precedence
+    over those of the sources.
+    """
+    properties = target.get("properties", [])
+    for source in sources:
+        properties = concatenate_arrays(
+            array1=properties, array2=source.get("properties", [])
+        )
+    nodes = sources + [target]
+    return graph_model.CreateItem(
+        name=target["name"] if name is None else name,
+        type=target["type"] if type is None else type,
+        properties=properties,
+        value=sum(n["value"] for n in nodes),
+        errors=[e for n in nodes for e in n["errors"]],
+        suggestions=[s for n in nodes for s in n["suggestions"]],
+        is_reviewed=False,
+        is_active=True,
+        graph_id=graph_id,
+    )
+
+
+def _merge_edge_documents(
+    graph_id: ObjectId, edge_type: ObjectId, edges: List[Dict]
+) -> graph_model.CreateItem:
+    # TODO: filter errors/suggestions to make context make sense.
+    return graph_model.CreateItem(
+        type=edge_type,
+        value=sum(e["value"] for e in edges),
+        properties=[p for e in edges for p in e["properties"]],
+        errors=[err for e in edges for err in e["errors"]],
+        suggestions=[s for e in edges for s in e["suggestions"]],
+        is_reviewed=False,
+        is_active=True,
+        graph_id=graph_id,
+    )
+
+
+def _summarise(
+    node_id: ObjectId, node: graph_model.CreateItem, triples: List[Dict]
+) -> graph_model.SubGraph:
+    """Summarises the triples a merged node was built from."""
+    unique_items = {}
+    for triple in triples:
+        for item in (triple["head"], triple["edge"], triple["tail"]):
+            unique_items.setdefault(item["_id"], item)
+
+    items = unique_items.values()
+    total_items = len(unique_items)
+    return graph_model.SubGraph(
+        _id=node_id,
+        name=node.name,
+        type=node.type,
+        value=node.value,
+        errors=sum(len(i["errors"]) for i in items),
+        suggestions=sum(len(i["suggestions"]) for i in items),
+        reviewed_progress=(
+            sum(int(i["is_reviewed"]) for i in items) / total_items
+            if total_items
+            else 0
+        ),
+        node_count=0,
+        edge_count=0,
+        nodes_reviewed=0,
+        edges_reviewed=0,
+    )
+
+
+def plan_merges(
+    graph_id: ObjectId,
+    clusters: List[List[Dict]],
+    triples: List[Dict],
+    names: Optional[List[Optional[Dict]]] = None,
+) -> MergePlan:
+    """Plans the merge of disjoint clusters of node documents.
+
+    The first node of each cluster is its target. `triples` are the hydrated triples
+    incident to the clustered nodes and `names` optionally overrides the
+    `{"name", "type"}` of each merged node.
+    """
+    now = datetime.utcnow()
+    new_ids: Dict[ObjectId, ObjectId] = {}
+    nodes = []
+    merged = []
+    for index, cluster in enumerate(clusters):
+        override = (names[index] if names else None) or {}
+        node = merge_node_documents(
+            graph_id=graph_id,
+            target=cluster[0],
+            sources=cluster[1:],
+            name=override.get("name"),
+            type=override.get("type"),
+        )
+        node_id = ObjectId()
+        for n in cluster:
+            new_ids[n["_id"]] = node_id
+        nodes.append({"_id": node_id, **node.dict(), "active_degree": 0})
+        merged.append((node_id, node, [n["_id"] for n in cluster]))
+
+    merged_ids = set(new_ids.values())
+    groups = defaultdict(list)
+    triples_by_node = defaultdict(list)
+    for triple in triples:
+        head_id = new_ids.get(triple["head"]["_id"], triple["head"]["_id"])
+        tail_id = new_ids.get(triple["tail"]["_id"], triple["tail"]["_id"])
+        for node_id in {head_id, tail_id} & merged_ids:
+            triples_by_node[node_id].append(triple)
+        if head_id != tail_id:
+            groups[(head_id, triple["edge"]["type"], tail_id)].append(triple["edge"])
+
+    edges = []
+    new_triples = []
+    for (head_id, edge_type, tail_id), group in groups.items():
+        edge_id = ObjectId()
+        edges.append(
+            {"_id": edge_id, **_merge_edge_documents(graph_id, edge_type, group).dict()}
+        )
+        new_triples.append(
+            {
+                "_id": ObjectId(),
+                "head": head_id,
+                "edge": edge_id,
+                "tail": tail_id,
+                "graph_id": graph_id,
+                "updated_at": now,
+                "created_at": now,
+            }
+        )
+
+    degrees = triple_endpoints(new_triples)
+    for n in nodes:
+        n["active_degree"] = degrees.get(n["_id"], 0)
+
+    return MergePlan(
+        nodes=nodes,
+        edges=edges,
+        triples=new_triples,
+        removed_node_ids=list(new_ids),
+        removed_nodes=[n for cluster in clusters for n in cluster],
+        removed_edge_ids=list({t["edge"]["_id"] for t in triples}),
+        removed_triples=triples,
+        summaries=[
+            graph_model.MergedNode(
+                item_modified=True,
+                new_node=graph_model.Node(**node.dict(), _id=node_id),
+                old_node_ids=[str(_id) for _id in old_ids],
+                new_subgraph=_summarise(node_id, node, triples_by_node[node_id]),
+            )
+            for node_id, node, old_ids in merged
+        ],
+    )
+
+
+async def apply_merge_plan(
+    graph_id: ObjectId, plan: MergePlan, db: AsyncIOMotorDatabase
+) -> None:
+    """Writes a merge plan atomically and updates the graph's cached structures."""
+    removed_triple_ids = [t["_id"] for t in plan.removed_triples]
+    mutation = Mutation(
+        operation="merge",
+        inserts={
+            "nodes": plan.nodes,
+            "edges": plan.edges,
+            "triples": plan.triples,
+        },
+        deletes=[
+            Delete("triples", "_id", removed_triple_ids),
+            Delete("edges", "_id", plan.removed_edge_ids),
+            Delete("nodes", "_id", plan.removed_node_ids),
+        ],
+    )
+    if uses_issue_collection():
+        # The merged items' issues are copied into the collection with the items
+        mutation.inserts[ISSUES_COLLECTION] = split_issues(
+            plan.nodes, is_node=True, new_ids=True
+        ) + split_issues(plan.edges, is_node=False, new_ids=True)
+        mutation.deletes.append(
+            Delete(
+                ISSUES_COLLECTION,
+                "item_id",
+                plan.removed_node_ids + plan.removed_edge_ids,
+            )
+        )
+
+    # Merged nodes are inserted with their final degree; only neighbours change
+    merged_ids = {n["_id"] for n in plan.nodes}
+    removed: Set[ObjectId] = set(plan.removed_node_ids)
+    degree_deltas = triple_endpoints(plan.triples)
+    degree_deltas.subtract(
+        triple_endpoints(
+            {"head": t["head"]["_id"], "tail": t["tail"]["_id"]}
+            for t in plan.removed_triples
+            if t["edge"]["is_active"]
+        )
+    )
+    neighbour_deltas = {
+        node_id: delta
+        for node_id, delta in degree_deltas.items()
+        if node_id not in merged_ids and node_id not in removed
+    }
+
+    try:
+        await apply_mutation(db, mutation)
+    except Exception:
+        # A failed merge may have been rolled forward; rebuild cached structures and
+        # have the neighbours' degrees recounted on next use
+        adjacency_cache.invalidate(graph_id)
+        review_queue.invalidate(graph_id)
+        name_index.invalidate(graph_id)
+        search_index.invalidate(graph_id)
+        await db["nodes"].update_many(
+            {"_id": {"$in": list(neighbour_deltas)}},
+            {"$unset": {"active_degree": ""}},
+        )
+        await bump_graph_version(graph_id=graph_id, db=db)
+        raise
+
+    adjacency_cache.remove_triples(graph_id, removed_triple_ids)
+    adjacency_cache.add_triples(graph_id, plan.triples)
+    await adjust_active_degrees(db, neighbour_deltas)
+    await review_queue.refresh(
+        graph_id=graph_id,
+        db=db,
+        node_ids=plan.removed_node_ids + list(merged_ids),
+        edge_ids=plan.removed_edge_ids + [e["_id"] for e in plan.edges],
+    )
+    await name_index.refresh(
+        graph_id=graph_id, db=db, node_ids=plan.removed_node_ids + list(merged_ids)
+    )
+    await search_index.refresh(
+        graph_id=graph_id, db=db, node_ids=plan.removed_node_ids + list(merged_ids)
+    )
+    await discount_class_stats(
+        graph_id=graph_id,
+        db=db,
+        nodes=plan.removed_nodes,
+        edges=[t["edge"] for t in plan.removed_triples],
+    )
+    await bump_graph_version(
+        graph_id=graph_id,
+        db=db,
+        changes={
+            "nodes": plan.removed_node_ids + list(merged_ids),
+            "edges": plan.removed_edge_ids + [e["_id"] for e in plan.edges],
+            "triples": removed_triple_ids + [t["_id"] for t in plan.triples],
+        },
+    )
+
+
+async def merge_node_clusters(
+    graph_id: ObjectId,
+    clusters: List[List[Dict]],
+    db: AsyncIOMotorDatabase,
+    names: Optional[List[Optional[Dict]]] = None,
+) -> List[graph_model.MergedNode]:
+    """Merges disjoint clusters of node documents (target first) of a graph."""
+    node_ids = [n["_id"] for cluster in clusters for n in cluster]
+    await attach_issues(db, nodes=[n for cluster in clusters for n in cluster])
+    # Read from the database: the adjacency cache may be stale under several workers
+    incident = await find_incident_triples(db=db, graph_id=graph_id, node_ids=node_ids)
+    triples = await hydrate_triples(db=db, triples=incident)
+
+    plan = plan_merges(
+        graph_id=graph_id, clusters=clusters, triples=triples, names=names
+    )
+    await apply_merge_plan(graph_id=graph_id, plan=plan, db=db)
+    return plan.summaries
@@ -0,0 +1,126 @@
+"""Per-graph caches of in-memory node indexes.
+
+Autocomplete (`services.autocomplete`) and search (`services.search`) keep an index
+built from the nodes of each graph. `NodeIndexCache` holds those indexes in an LRU of
+up to `max_graphs` graphs, each rebuilt from the database once it is older than
+`ttl_seconds`. Concurrent first uses of a graph build its index once. Services that
+create, change or remove nodes call `refresh` with the affected node ids, which
+re-reads only those nodes into cached indexes.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+from bson import ObjectId
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+# An index with `update(nodes, removed_node_ids)` and `__len__`
+Index = TypeVar("Index")
+
+
+class NodeIndexCache(Generic[Index]):
+    """LRU cache of per-graph node indexes, loaded on first use.
+
+    `build` creates the index of a graph from its node documents (read with
+    `projection`); `name` labels the index in logs.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        build: Callable[[List[Dict]], Index],
+        projection: Dict,
+        max_graphs: int,
+        ttl_seconds: float,
+    ):
+        self.name = name
+        self.build = build
+        self.projection = projection
+        self.max_graphs = max_graphs
+        self.ttl_seconds = ttl_seconds
+        self._indexes: "OrderedDict[ObjectId, Tuple[Index, float]]" = OrderedDict()
+        self._locks: Dict[ObjectId, asyncio.Lock] = {}
+
+    def _lookup(self, graph_id: ObjectId) -> Optional[Index]:
+        entry = self._indexes.get(graph_id)
+        if entry is None:
+            return None
+        index, loaded_at = entry
+        if time.monotonic() - loaded_at > self.ttl_seconds:
+            del self._indexes[graph_id]
+            return None
+        self._indexes.move_to_end(graph_id)
+        return index
+
+    async def get(self, graph_id: ObjectId, db: AsyncIOMotorDatabase) -> Index:
+        """Returns the index of a graph, building it if needed."""
+        graph_id = ObjectId(graph_id)
+        index = self._lookup(graph_id)
+        if index is not None:
+            return index
+
+        async with self._locks.setdefault(graph_id, asyncio.Lock()):
+            index = self._lookup(graph_id)
+            if index is not None:
+                return index
+
+            nodes = (
+                await db["nodes"]
+                .find({"graph_id": graph_id}, self.projection)
+                .to_list(None)
+            )
+            index = self.build(nodes)
+
+            self._indexes[graph_id] = (index, time.monotonic())
+            while len(self._indexes) > self.max_graphs:
+                self._indexes.popitem(last=False)
+            logger.debug(
+                "Built {} index for graph {} ({} entries)",
+                self.name,
+                graph_id,
+                len(index),
+            )
+            return index
+
+    async def refresh(
+        self,
+        graph_id: ObjectId,
+        db: AsyncIOMotorDatabase,
+        node_ids: Iterable[ObjectId] = (),
+    ) -> None:
+        """Re-reads the given nodes into a cached index.
+
+        Ids that no longer exist are removed. Graphs that are not cached are skipped
+        as they are built from the database on first use.
+        """
+        graph_id = ObjectId(graph_id)
+        if self._lookup(graph_id) is None:
+            return
+        node_ids = [ObjectId(_id) for _id in node_ids]
+
+        try:
+            nodes = (
+                await db["nodes"]
+                .find({"_id": {"$in": node_ids}}, self.projection)
+                .to_list(None)
+            )
+        except Exception as e:
+            logger.error(f"Failed to refresh {self.name} index, dropping it: {e}")
+            self.invalidate(graph_id)
+            return
+
+        index = self._lookup(graph_id)
+        if index is None:
+            return
+        found = {n["_id"] for n in nodes}
+        index.update(
+            nodes=nodes,
+            removed_node_ids=[_id for _id in node_ids if _id not in found],
+        )
+
+    def invalidate(self, graph_id: ObjectId) -> None:
+        """Drops the index of a graph (e.g. when the graph is deleted)."""
+        self._indexes.pop(ObjectId(graph_id), None)
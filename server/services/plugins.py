@@ -3,11 +3,17 @@ from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
 from loguru import logger
 
+from logging_utils import summarise
+from metrics import track, PLUGIN_DURATION
+
 from models import graph as graph_model
 
 from plugin_models import ModelInput, ModelTriple
 from plugin_manager import PluginManager
 from settings import settings
+from services.hydration import get_populated_graph_triples
+from services.issue_store import add_issues
+from services.versions import bump_graph_version
 
 
 def get_available_plugins():
@@ -26,55 +32,17 @@ async def get_graph_data(
     TODO
     ----
     - Make this call only done once and allow data to be used in both plugins independently
-    - Refactor as this triple extraction and formatting is the same as the "download" route
+    - Refactor as this triple formatting is the same as the "download" route
 
     """
 
-    populated_triple_pipeline = [
-        {
-            "$match": {
-                "graph_id": graph_id,
-            }
-        },
-        {
-            "$lookup": {
-                "from": "nodes",
-                "localField": "head",
-                "foreignField": "_id",
-                "as": "head",
-            }
-        },
-        {
-            "$lookup": {
-                "from": "nodes",
-                "localField": "tail",
-                "foreignField": "_id",
-                "as": "tail",
-            }
-        },
-        {
-            "$lookup": {
-                "from": "edges",
-                "localField": "edge",
-                "foreignField": "_id",
-                "as": "edge",
-            }
-        },
-        {"$unwind": "$head"},
-        {"$unwind": "$tail"},
-        {"$unwind": "$edge"},
-        {
-            "$project": {
-                "_id": 0,
-                "graph_id": 0,
-                "head.graph_id": 0,
-                "edge.graph_id": 0,
-                "tail.graph_id": 0,
-            }
-        },
-    ]
-
-    triples = await db["triples"].aggregate(populated_triple_pipeline).to_list(None)
+    # Plugins do not see errors/suggestions
+    triples = await get_populated_graph_triples(
+        db=db,
+        graph_id=graph_id,
+        node_projection={"errors": 0, "suggestions": 0},
+        edge_projection={"errors": 0, "suggestions": 0},
+    )
 
     graph = await db["graphs"].find_one(
         {"_id": graph_id}, {"node_classes": 1, "edge_classes": 1}
@@ -115,37 +83,41 @@ async def execute_edm(
     data: ModelInput,
     nodeName2Id: Dict[str, ObjectId],
     edgeName2Id: Dict[str, ObjectId],
-):
-    """Executes error detection model (EDM)"""
-
-    edm_output = edm_plugin.execute(triples=data.dict(exclude_unset=True)["triples"])
-
-    logger.debug(f"edm_output sample: {edm_output.data[:5]}")
+    *,
+    graph_id: ObjectId,
+) -> List[ObjectId]:
+    """Executes error detection model (EDM). Returns the ids of the nodes given errors."""
+
+    with track(
+        "plugin_edm", PLUGIN_DURATION, kind="edm", plugin=type(edm_plugin).__module__
+    ):
+        edm_output = edm_plugin.execute(
+            triples=data.dict(exclude_unset=True)["triples"]
+        )
+
+    logger.opt(lazy=True).debug(
+        "edm_output sample: {}", lambda: summarise(edm_output.data)
+    )
 
     # Update nodes with EDM errors
+    new_errors = []
     for err in edm_output.data:
         # Convert error into expected format for error array
 
         if err.is_node:
-            # _item_type = node_classes_with_ids.get(err.action.item_type_name)
-
             # Add item_type id to object.
             err.action.data.item_type = str(
                 nodeName2Id.get(err.action.data.item_type_name)
             )
-            # print("err action data", err.action.data)
-
-            new_error = graph_model.Error(**err.dict()).dict()
-
-            # print("adding new error to node!")
-            # Can optimise my tracking node errors and pushing them all at once as some nodes will have more than one error.
-            result = await db["nodes"].update_one(
-                {"_id": ObjectId(err.item_id)}, {"$push": {"errors": new_error}}
-            )
-            # print("modified", result.modified_count > 0)
+            new_errors.append(graph_model.Error(**err.dict()).dict())
 
         # TODO: implement link errors...
 
+    # All errors are added at once, grouped by node
+    return await add_issues(
+        db, graph_id=graph_id, is_node=True, is_error=True, issues=new_errors
+    )
+
 
 async def execute_cm(
     db: AsyncIOMotorDatabase,
@@ -153,29 +125,31 @@ async def execute_cm(
     data: ModelInput,
     nodeName2Id: Dict[str, ObjectId] = None,
     edgeName2Id: Dict[str, ObjectId] = None,
-):
-    """ """
+    *,
+    graph_id: ObjectId,
+) -> List[ObjectId]:
+    """Executes completion model (CM). Returns the ids of the nodes given suggestions."""
     # Execute plugin
-    cm_output = cm_plugin.execute(triples=data.dict(exclude_unset=True)["triples"])
+    with track(
+        "plugin_cm", PLUGIN_DURATION, kind="cm", plugin=type(cm_plugin).__module__
+    ):
+        cm_output = cm_plugin.execute(triples=data.dict(exclude_unset=True)["triples"])
 
     # Update nodes with CM suggestion
-    for suggestion in cm_output.data:
-        # print("suggestion", suggestion)
-        # Convert suggestion into expected format for suggestion array
-
-        new_suggestion = graph_model.Suggestion(
+    new_suggestions = [
+        graph_model.Suggestion(
             suggestion_type=suggestion.suggestion_type,
             suggestion_value=suggestion.suggestion_value,
+            item_id=ObjectId(suggestion.id),
         ).dict()
+        for suggestion in cm_output.data
+        if suggestion.is_node
+    ]
 
-        if suggestion.is_node:
-            # print("adding new suggestion to node!")
-            # Can optimise my tracking node suggestion and pushing them all at once as some nodes will have more than one error.
-            result = await db["nodes"].update_one(
-                {"_id": ObjectId(suggestion.id)},
-                {"$push": {"suggestions": new_suggestion}},
-            )
-            # print("modified", result.modified_count > 0)
+    # All suggestions are added at once, grouped by node
+    return await add_issues(
+        db, graph_id=graph_id, is_node=True, is_error=False, issues=new_suggestions
+    )
 
 
 async def execute_plugins(
@@ -195,29 +169,43 @@ async def execute_plugins(
 
     try:
         plugins = get_available_plugins()
-        logger.debug(f"Available plugins: {plugins}")
+        logger.debug("Available plugins: {}", plugins)
 
         if graph_plugins.edm or graph_plugins.cm:
-            data, nodeName2Id, edgeName2Id = await get_graph_data(
-                db=db, graph_id=graph_id
-            )
-            logger.info(f"Created graph data")
+            with track("plugin_data", operation="plugins.get_graph_data"):
+                data, nodeName2Id, edgeName2Id = await get_graph_data(
+                    db=db, graph_id=graph_id
+                )
+            logger.info("Created graph data")
 
+        changed_nodes = set()
         if graph_plugins.edm:
             edm_plugin = plugins["edm"][graph_plugins.edm]
-            logger.info(f"Executing EDM plugin - {graph_plugins.edm}")
-            await execute_edm(
-                db=db,
-                edm_plugin=edm_plugin,
-                data=data,
-                nodeName2Id=nodeName2Id,
-                edgeName2Id=edgeName2Id,
+            logger.info("Executing EDM plugin - {}", graph_plugins.edm)
+            changed_nodes.update(
+                await execute_edm(
+                    db=db,
+                    edm_plugin=edm_plugin,
+                    data=data,
+                    nodeName2Id=nodeName2Id,
+                    edgeName2Id=edgeName2Id,
+                    graph_id=graph_id,
+                )
             )
 
         if graph_plugins.cm:
             cm_plugin = plugins["cm"][graph_plugins.cm]
-            logger.info(f"Executing CM plugin - {graph_plugins.cm}")
-            await execute_cm(db=db, cm_plugin=cm_plugin, data=data)
+            logger.info("Executing CM plugin - {}", graph_plugins.cm)
+            changed_nodes.update(
+                await execute_cm(
+                    db=db, cm_plugin=cm_plugin, data=data, graph_id=graph_id
+                )
+            )
+
+        if changed_nodes:
+            await bump_graph_version(
+                graph_id=graph_id, db=db, changes={"nodes": list(changed_nodes)}
+            )
 
     except Exception as e:
         logger.error(f"Error executing plugin(s): {e}")
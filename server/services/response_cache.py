@@ -0,0 +1,133 @@
+"""Versioned caching of read responses.
+
+Read endpoints of a graph are tagged with a strong ETag derived from the graph's
+version (see `services.versions`), the route and the query parameters. Requests whose
+`If-None-Match` carries the current tag get an empty 304 without building the
+response; otherwise the serialized body is served from an in-process LRU keyed by
+(graph, version, route, parameters) or built and stored there. A mutation bumps the
+version, so stale entries are never served and are dropped once a newer version of
+the graph is stored. Lookups are counted in `cleangraph_response_cache_total`.
+"""
+
+import hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+from bson import ObjectId
+from fastapi import Request, Response
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+import metrics
+from settings import settings
+from services.serialization import json_response, render
+from services.versions import get_graph_version
+
+# (graph id, version, route, sorted query parameters)
+Key = Tuple[ObjectId, int, str, Hashable]
+
+
+class ResponseCache:
+    """LRU of serialized response bodies bounded by their total size."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._bodies: "OrderedDict[Key, bytes]" = OrderedDict()
+        self._keys: Dict[ObjectId, Set[Key]] = {}
+        self._versions: Dict[ObjectId, int] = {}
+        self._size = 0
+
+    def get(self, key: Key) -> Optional[bytes]:
+        body = self._bodies.get(key)
+        if body is not None:
+            self._bodies.move_to_end(key)
+        return body
+
+    def put(self, key: Key, body: bytes) -> None:
+        graph_id, version = key[0], key[1]
+        if version < self._versions.get(graph_id, -1) or len(body) > self.max_bytes:
+            return
+        if version > self._versions.get(graph_id, -1):
+            self.invalidate(graph_id)
+            self._versions[graph_id] = version
+        if key in self._bodies:
+            self._remove(key)
+        self._bodies[key] = body
+        self._keys.setdefault(graph_id, set()).add(key)
+        self._size += len(body)
+        while self._size > self.max_bytes:
+            self._remove(next(iter(self._bodies)))
+
+    def _remove(self, key: Key) -> None:
+        self._size -= len(self._bodies.pop(key))
+        keys = self._keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+
+    def invalidate(self, graph_id: ObjectId) -> None:
+        """Drops the cached responses of a graph (e.g. when the graph is deleted)."""
+        graph_id = ObjectId(graph_id)
+        for key in self._keys.pop(graph_id, set()):
+            if key in self._bodies:
+                self._size -= len(self._bodies.pop(key))
+        self._versions.pop(graph_id, None)
+
+
+def _etag(key: Key) -> str:
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+    return f'"{key[1]}-{digest}"'
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison (compressed responses carry the tag as a weak ETag)."""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    tags = [t[2:] if t.startswith("W/") else t for t in tags]
+    return "*" in tags or etag in tags
+
+
+async def cached_response(
+    request: Request,
+    graph_id: ObjectId,
+    db: AsyncIOMotorDatabase,
+    build: Callable[[], Awaitable[Any]],
+    validate: bool = True,
+) -> Any:
+    """Serves a graph read endpoint with ETag revalidation and response caching.
+
+    `build` produces the (uncached) response content. Returns its result unchanged
+    (see `services.serialization.json_response`) when caching is disabled or the
+    graph does not exist, so errors surface as usual; a None result (a failed build)
+    is returned likewise and never cached or tagged. Content that does not match the
+    route's response model is passed with `validate=False`.
+    """
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return json_response(await build(), validate=validate)
+    version = await get_graph_version(graph_id=graph_id, db=db)
+    if version is None:
+        return json_response(await build(), validate=validate)
+
+    route = getattr(request.scope.get("route"), "path", request.url.path)
+    params = tuple(sorted(request.query_params.multi_items()))
+    key = (graph_id, version, route, params)
+    etag = _etag(key)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if _matches(request.headers.get("if-none-match"), etag):
+        metrics.RESPONSE_CACHE_LOOKUPS.inc(route=route, result="not_modified")
+        return Response(status_code=304, headers=headers)
+
+    body = response_cache.get(key)
+    if body is None:
+        metrics.RESPONSE_CACHE_LOOKUPS.inc(route=route, result="miss")
+        content = await build()
+        if content is None:
+            return content
+        body = render(content)
+        response_cache.put(key, body)
+    else:
+        metrics.RESPONSE_CACHE_LOOKUPS.inc(route=route, result="hit")
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+response_cache = ResponseCache(max_bytes=settings.RESPONSE_CACHE_MAX_BYTES)
@@ -0,0 +1,326 @@
+"""Review-prioritised work queue of focus nodes.
+
+Each graph gets a priority queue of the nodes whose subgraphs most need review. A
+node's score combines the open (unacknowledged) errors and suggestions on the node and
+its incident edges, the unreviewed fraction of those 1 + degree items and the node's
+degree:
+
+    score = ERROR_WEIGHT * errors + SUGGESTION_WEIGHT * suggestions
+            + UNREVIEWED_WEIGHT * unreviewed / (1 + degree)
+            + DEGREE_WEIGHT * log(1 + degree)
+
+Nodes without unreviewed items or open errors/suggestions are not queued. Per-node
+aggregates are maintained incrementally; services that change review state, errors or
+suggestions call `review_queue.refresh` with the affected node/edge ids so only their
+scores are recomputed. The queue is a heap with lazy deletion, so the next node is
+returned in (amortised) O(log n) without touching the database.
+"""
+
+import asyncio
+import heapq
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from settings import settings
+from services.adjacency import adjacency_cache
+from services.issue_store import count_field, issue_count
+
+_PROJECTION = {
+    "_id": 1,
+    "is_reviewed": 1,
+    "errors.acknowledged": 1,
+    "suggestions.acknowledged": 1,
+    count_field(is_error=True, open_only=True): 1,
+    count_field(is_error=False, open_only=True): 1,
+}
+
+
+def _item_state(doc: Dict) -> Tuple[int, int, int]:
+    """Returns the (open errors, open suggestions, unreviewed) contribution of an item."""
+    return (
+        issue_count(doc, is_error=True, open_only=True),
+        issue_count(doc, is_error=False, open_only=True),
+        int(not doc.get("is_reviewed", False)),
+    )
+
+
+class GraphReviewQueue:
+    """Priority queue of the nodes of a single graph."""
+
+    def __init__(
+        self,
+        nodes: Iterable[Dict],
+        edges: Iterable[Dict],
+        triples: Iterable[Dict],
+    ):
+        self._nodes: Dict[ObjectId, Tuple[int, int, int]] = {
+            n["_id"]: _item_state(n) for n in nodes
+        }
+        self._edges: Dict[ObjectId, Tuple[int, int, int]] = {
+            e["_id"]: _item_state(e) for e in edges
+        }
+        self._endpoints: Dict[ObjectId, Set[ObjectId]] = {}
+        # node id -> [open errors, open suggestions, unreviewed, edge count] of its edges
+        self._incident: Dict[ObjectId, List[int]] = {}
+        for t in triples:
+            if t["edge"] in self._edges:
+                self._attach(t["edge"], {t["head"], t["tail"]})
+
+        self._scores: Dict[ObjectId, float] = {}
+        self._heap: List[Tuple[float, ObjectId]] = []
+        for node_id in self._nodes:
+            self._rescore(node_id, push=False)
+        self._heap = [(-score, node_id) for node_id, score in self._scores.items()]
+        heapq.heapify(self._heap)
+
+    def _attach(self, edge_id: ObjectId, endpoints: Set[ObjectId]) -> None:
+        self._endpoints[edge_id] = endpoints
+        errors, suggestions, unreviewed = self._edges[edge_id]
+        for node_id in endpoints:
+            agg = self._incident.setdefault(node_id, [0, 0, 0, 0])
+            agg[0] += errors
+            agg[1] += suggestions
+            agg[2] += unreviewed
+            agg[3] += 1
+
+    def _detach(self, edge_id: ObjectId) -> Set[ObjectId]:
+        endpoints = self._endpoints.pop(edge_id, set())
+        errors, suggestions, unreviewed = self._edges[edge_id]
+        for node_id in endpoints:
+            agg = self._incident[node_id]
+            agg[0] -= errors
+            agg[1] -= suggestions
+            agg[2] -= unreviewed
+            agg[3] -= 1
+        return endpoints
+
+    def score(self, node_id: ObjectId) -> Optional[float]:
+        """Returns the priority of a node (None if it does not need review)."""
+        state = self._nodes.get(node_id)
+        if state is None:
+            return None
+        errors, suggestions, unreviewed, degree = self._incident.get(
+            node_id, [0, 0, 0, 0]
+        )
+        errors += state[0]
+        suggestions += state[1]
+        unreviewed += state[2]
+        if errors + suggestions + unreviewed == 0:
+            return None
+        return (
+            settings.REVIEW_PRIORITY_ERROR_WEIGHT * errors
+            + settings.REVIEW_PRIORITY_SUGGESTION_WEIGHT * suggestions
+            + settings.REVIEW_PRIORITY_UNREVIEWED_WEIGHT * unreviewed / (1 + degree)
+            + settings.REVIEW_PRIORITY_DEGREE_WEIGHT * math.log1p(degree)
+        )
+
+    def _rescore(self, node_id: ObjectId, push: bool = True) -> None:
+        score = self.score(node_id)
+        if score is None:
+            self._scores.pop(node_id, None)
+        elif self._scores.get(node_id) != score:
+            self._scores[node_id] = score
+            if push:
+                heapq.heappush(self._heap, (-score, node_id))
+
+    def update(
+        self,
+        nodes: Iterable[Dict] = (),
+        edges: Iterable[Dict] = (),
+        triples: Iterable[Dict] = (),
+        removed_node_ids: Iterable[ObjectId] = (),
+        removed_edge_ids: Iterable[ObjectId] = (),
+    ) -> None:
+        """Applies changed node/edge documents, their triples and removals."""
+        touched = set()
+
+        for edge_id in removed_edge_ids:
+            if edge_id in self._edges:
+                touched |= self._detach(edge_id)
+                del self._edges[edge_id]
+
+        for node_id in removed_node_ids:
+            self._nodes.pop(node_id, None)
+            touched.add(node_id)
+
+        endpoints = {t["edge"]: {t["head"], t["tail"]} for t in triples}
+        for e in edges:
+            edge_id = e["_id"]
+            if edge_id in self._edges:
+                previous = self._detach(edge_id)
+                touched |= previous
+            else:
+                previous = set()
+            self._edges[edge_id] = _item_state(e)
+            current = endpoints.get(edge_id, previous)
+            self._attach(edge_id, current)
+            touched |= current
+
+        for n in nodes:
+            self._nodes[n["_id"]] = _item_state(n)
+            touched.add(n["_id"])
+
+        for node_id in touched:
+            self._rescore(node_id)
+
+    def next(
+        self, exclude: Iterable[ObjectId] = ()
+    ) -> Optional[Tuple[ObjectId, float]]:
+        """Returns the highest priority (node id, score) not in `exclude`."""
+        exclude = set(exclude)
+        skipped = []
+        result = None
+        while self._heap:
+            negative_score, node_id = self._heap[0]
+            if self._scores.get(node_id) != -negative_score:
+                heapq.heappop(self._heap)  # Stale entry
+                continue
+            if node_id in exclude:
+                skipped.append(heapq.heappop(self._heap))
+                continue
+            result = (node_id, -negative_score)
+            break
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+        return result
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+
+class ReviewQueueCache:
+    """LRU cache of per-graph review queues, loaded on first use."""
+
+    def __init__(self, max_graphs: int, ttl_seconds: float):
+        self.max_graphs = max_graphs
+        self.ttl_seconds = ttl_seconds
+        self._queues: "OrderedDict[ObjectId, Tuple[GraphReviewQueue, float]]" = (
+            OrderedDict()
+        )
+        self._locks: Dict[ObjectId, asyncio.Lock] = {}
+
+    def _lookup(self, graph_id: ObjectId) -> Optional[GraphReviewQueue]:
+        entry = self._queues.get(graph_id)
+        if entry is None:
+            return None
+        queue, loaded_at = entry
+        if time.monotonic() - loaded_at > self.ttl_seconds:
+            del self._queues[graph_id]
+            return None
+        self._queues.move_to_end(graph_id)
+        return queue
+
+    async def get(
+        self, graph_id: ObjectId, db: AsyncIOMotorDatabase
+    ) -> GraphReviewQueue:
+        """Returns the review queue of a graph, building it if needed."""
+        graph_id = ObjectId(graph_id)
+        queue = self._lookup(graph_id)
+        if queue is not None:
+            return queue
+
+        async with self._locks.setdefault(graph_id, asyncio.Lock()):
+            queue = self._lookup(graph_id)
+            if queue is not None:
+                return queue
+
+            adjacency = await adjacency_cache.get(graph_id=graph_id, db=db)
+            nodes = (
+                await db["nodes"]
+                .find({"graph_id": graph_id}, _PROJECTION)
+                .to_list(None)
+            )
+            edges = (
+                await db["edges"]
+                .find({"graph_id": graph_id}, _PROJECTION)
+                .to_list(None)
+            )
+            queue = GraphReviewQueue(nodes, edges, adjacency.triples())
+
+            self._queues[graph_id] = (queue, time.monotonic())
+            while len(self._queues) > self.max_graphs:
+                self._queues.popitem(last=False)
+            logger.debug(
+                "Built review queue for graph {} ({} nodes queued)",
+                graph_id,
+                len(queue),
+            )
+            return queue
+
+    async def next(
+        self,
+        graph_id: ObjectId,
+        db: AsyncIOMotorDatabase,
+        exclude: Iterable[ObjectId] = (),
+    ) -> Optional[Tuple[ObjectId, float]]:
+        """Returns the (node id, score) whose subgraph should be reviewed next."""
+        queue = await self.get(graph_id=graph_id, db=db)
+        return queue.next(exclude=exclude)
+
+    async def refresh(
+        self,
+        graph_id: ObjectId,
+        db: AsyncIOMotorDatabase,
+        node_ids: Iterable[ObjectId] = (),
+        edge_ids: Iterable[ObjectId] = (),
+    ) -> None:
+        """Re-reads the given nodes/edges (and the triples of the edges) into a cached queue.
+
+        Ids that no longer exist are removed from the queue. Graphs that are not cached
+        are skipped as they are built from the database on first use.
+        """
+        graph_id = ObjectId(graph_id)
+        if self._lookup(graph_id) is None:
+            return
+        node_ids = [ObjectId(_id) for _id in node_ids]
+        edge_ids = [ObjectId(_id) for _id in edge_ids]
+
+        try:
+            nodes = (
+                await db["nodes"]
+                .find({"_id": {"$in": node_ids}}, _PROJECTION)
+                .to_list(None)
+            )
+            edges = (
+                await db["edges"]
+                .find({"_id": {"$in": edge_ids}}, _PROJECTION)
+                .to_list(None)
+            )
+            triples = (
+                await db["triples"]
+                .find({"edge": {"$in": edge_ids}}, {"head": 1, "edge": 1, "tail": 1})
+                .to_list(None)
+            )
+        except Exception as e:
+            logger.error(f"Failed to refresh review queue, dropping it: {e}")
+            self.invalidate(graph_id)
+            return
+
+        queue = self._lookup(graph_id)
+        if queue is None:
+            return
+        found_nodes = {n["_id"] for n in nodes}
+        found_edges = {e["_id"] for e in edges}
+        queue.update(
+            nodes=nodes,
+            edges=edges,
+            triples=triples,
+            removed_node_ids=[_id for _id in node_ids if _id not in found_nodes],
+            removed_edge_ids=[_id for _id in edge_ids if _id not in found_edges],
+        )
+
+    def invalidate(self, graph_id: ObjectId) -> None:
+        """Drops the queue of a graph (e.g. when the graph is deleted)."""
+        self._queues.pop(ObjectId(graph_id), None)
+
+
+review_queue = ReviewQueueCache(
+    max_graphs=settings.REVIEW_QUEUE_MAX_GRAPHS,
+    ttl_seconds=settings.REVIEW_QUEUE_TTL_SECONDS,
+)
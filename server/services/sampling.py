@@ -0,0 +1,129 @@
+"""Sampling of random focus nodes for subgraphs.
+
+`$sample` on the nodes collection falls back to a random sort of every matching
+document on large collections. Instead, a pool of candidate focus node ids is kept
+per graph and handed out in O(1). Candidates are drawn from the graph's cached
+adjacency (so they always have triples); with `SAMPLE_POOL_PRIORITISE` unreviewed
+nodes with errors come first, followed by unreviewed nodes. The pool is refilled in
+the background (on the process-wide database client) once it drops below
+`SAMPLE_POOL_REFILL_FRACTION` of its size.
+"""
+
+import asyncio
+import random
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from bson import ObjectId
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from dependencies import get_shared_db
+from settings import settings
+from services.adjacency import adjacency_cache
+from services.issue_store import count_field, issue_count
+
+
+class SamplePool:
+    """Per-graph pools of candidate focus node ids."""
+
+    def __init__(self, size: int, refill_fraction: float, prioritise: bool):
+        self.size = size
+        self.refill_fraction = refill_fraction
+        self.prioritise = prioritise
+        self._pools: Dict[ObjectId, Deque[ObjectId]] = {}
+        self._refills: Dict[ObjectId, asyncio.Task] = {}
+
+    async def next_node(
+        self, graph_id: ObjectId, db: AsyncIOMotorDatabase
+    ) -> Optional[ObjectId]:
+        """Returns a random focus node id (or None if the graph has no nodes)."""
+        graph_id = ObjectId(graph_id)
+        adjacency = await adjacency_cache.get(graph_id=graph_id, db=db)
+        pool = self._pools.setdefault(graph_id, deque())
+
+        for _ in range(2):
+            while pool:
+                node_id = pool.popleft()
+                if len(pool) < self.size * self.refill_fraction:
+                    self._schedule_refill(graph_id)
+                # Skip nodes that were merged/deleted since the pool was filled
+                if adjacency.degree(node_id) > 0:
+                    return node_id
+            await self._refill(graph_id, db)
+
+        return await self._sample_any(graph_id, db)
+
+    def _schedule_refill(self, graph_id: ObjectId) -> None:
+        task = self._refills.get(graph_id)
+        if task is None or task.done():
+            # The request's client is closed once its response is sent
+            self._refills[graph_id] = asyncio.create_task(
+                self._refill(graph_id, get_shared_db())
+            )
+
+    async def _refill(self, graph_id: ObjectId, db: AsyncIOMotorDatabase) -> None:
+        try:
+            candidates = await self._candidates(graph_id, db)
+        except Exception as e:
+            logger.error(f"Failed to refill sample pool for graph {graph_id}: {e}")
+            return
+        self._pools.setdefault(graph_id, deque()).extend(candidates)
+        logger.debug(
+            "Refilled sample pool for graph {} with {} nodes", graph_id, len(candidates)
+        )
+
+    async def _candidates(
+        self, graph_id: ObjectId, db: AsyncIOMotorDatabase
+    ) -> List[ObjectId]:
+        adjacency = await adjacency_cache.get(graph_id=graph_id, db=db)
+        node_ids = adjacency.node_ids
+        candidates = random.sample(
+            node_ids, min(len(node_ids), self.size * (4 if self.prioritise else 1))
+        )
+        if not self.prioritise or not candidates:
+            return candidates[: self.size]
+
+        unreviewed = await (
+            db["nodes"]
+            .find(
+                {"_id": {"$in": candidates}, "is_reviewed": False},
+                {"_id": 1, "errors": {"$slice": 1}, count_field(is_error=True): 1},
+            )
+            .to_list(None)
+        )
+        with_errors = [n["_id"] for n in unreviewed if issue_count(n, is_error=True)]
+        without_errors = [
+            n["_id"] for n in unreviewed if not issue_count(n, is_error=True)
+        ]
+        seen = set(with_errors) | set(without_errors)
+        rest = [_id for _id in candidates if _id not in seen]
+        random.shuffle(with_errors)
+        random.shuffle(without_errors)
+        return (with_errors + without_errors + rest)[: self.size]
+
+    async def _sample_any(
+        self, graph_id: ObjectId, db: AsyncIOMotorDatabase
+    ) -> Optional[ObjectId]:
+        """Falls back to `$sample` for graphs without triples."""
+        sample = (
+            await db["nodes"]
+            .aggregate([{"$match": {"graph_id": graph_id}}, {"$sample": {"size": 1}}])
+            .to_list(None)
+        )
+        return sample[0]["_id"] if sample else None
+
+    def invalidate(self, graph_id: ObjectId) -> None:
+        """Drops the pool of a graph (e.g. when the graph is deleted)."""
+        graph_id = ObjectId(graph_id)
+        self._pools.pop(graph_id, None)
+        task = self._refills.pop(graph_id, None)
+        if task is not None:
+            task.cancel()
+
+
+sample_pool = SamplePool(
+    size=settings.SAMPLE_POOL_SIZE,
+    refill_fraction=settings.SAMPLE_POOL_REFILL_FRACTION,
+    prioritise=settings.SAMPLE_POOL_PRIORITISE,
+)
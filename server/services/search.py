@@ -0,0 +1,247 @@
+"""Full-text and fuzzy search of graph nodes.
+
+Each graph gets an in-memory inverted index of the tokens in its node names and
+property values. Query tokens match index tokens exactly, as a prefix (so results
+appear while typing) or within a small edit distance (typos, including swapped
+letters); fuzzy candidates are found through a trigram index of the vocabulary so
+only tokens sharing enough trigrams with the query token are compared. Matches are ranked by
+
+    score = sum over query tokens of max(match weight * field weight * idf)
+
+where exact matches weigh more than prefix and fuzzy matches and name tokens weigh
+more than property tokens. Nodes matching more query tokens rank first. Services that
+create, change or remove nodes call `search_index.refresh` with the affected node ids
+so cached indexes stay in sync (see `services.node_index`).
+"""
+
+import bisect
+import math
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from settings import settings
+from services.node_index import NodeIndexCache
+
+_PROJECTION = {"_id": 1, "name": 1, "type": 1, "properties.value": 1}
+
+_TOKEN = re.compile(r"\w+")
+
+NAME_WEIGHT = 3.0
+PROPERTY_WEIGHT = 1.0
+EXACT_MATCH = 1.0
+PREFIX_MATCH = 0.7
+FUZZY_MATCH = 0.5
+
+
+def tokenize(text) -> List[str]:
+    return _TOKEN.findall(str(text).casefold())
+
+
+def _trigrams(token: str) -> Set[str]:
+    padded = f"  {token} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def _max_typos(token: str) -> int:
+    """Edits tolerated for a query token (none for very short tokens)."""
+    if len(token) < 4:
+        return 0
+    return min(settings.SEARCH_MAX_TYPOS, 1 if len(token) < 8 else 2)
+
+
+def edit_distance(a: str, b: str, bound: int) -> int:
+    """Edit distance of `a` and `b` counting adjacent transpositions as one edit.
+
+    Returns `bound + 1` once the distance is known to exceed `bound`.
+    """
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            distance = min(
+                previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)
+            )
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                distance = min(distance, before[j - 2] + 1)
+            current.append(distance)
+        if min(current) > bound:
+            return bound + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+class GraphSearchIndex:
+    """Inverted index of the node names and property values of a single graph."""
+
+    def __init__(self, nodes: Iterable[Dict]):
+        self._nodes: Dict[ObjectId, Tuple[str, ObjectId, Dict[str, float]]] = {}
+        self._postings: Dict[str, Dict[ObjectId, float]] = defaultdict(dict)
+        self._trigrams: Dict[str, Set[str]] = defaultdict(set)
+        self._vocabulary: List[str] = []
+        for node in nodes:
+            self._add(node)
+        self._vocabulary = sorted(self._postings)
+
+    @staticmethod
+    def _terms(node: Dict) -> Dict[str, float]:
+        terms = {}
+        for prop in node.get("properties") or []:
+            for token in tokenize(prop.get("value", "")):
+                terms[token] = PROPERTY_WEIGHT
+        for token in tokenize(node.get("name") or ""):
+            terms[token] = NAME_WEIGHT
+        return terms
+
+    def _add(self, node: Dict) -> List[str]:
+        """Indexes a node; returns the tokens new to the vocabulary."""
+        terms = self._terms(node)
+        self._nodes[node["_id"]] = (node.get("name") or "", node.get("type"), terms)
+        new_tokens = []
+        for token, weight in terms.items():
+            if token not in self._postings:
+                new_tokens.append(token)
+                for trigram in _trigrams(token):
+                    self._trigrams[trigram].add(token)
+            self._postings[token][node["_id"]] = weight
+        return new_tokens
+
+    def _remove(self, node_id: ObjectId) -> None:
+        entry = self._nodes.pop(node_id, None)
+        if entry is None:
+            return
+        for token in entry[2]:
+            postings = self._postings[token]
+            postings.pop(node_id, None)
+            if not postings:
+                del self._postings[token]
+                for trigram in _trigrams(token):
+                    self._trigrams[trigram].discard(token)
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+
+    def update(
+        self, nodes: Iterable[Dict] = (), removed_node_ids: Iterable[ObjectId] = ()
+    ) -> None:
+        """Re-indexes `nodes` and forgets the removed nodes."""
+        nodes = list(nodes)
+        for node_id in [*removed_node_ids, *(n["_id"] for n in nodes)]:
+            self._remove(node_id)
+        for node in nodes:
+            for token in self._add(node):
+                bisect.insort(self._vocabulary, token)
+
+    def _expand(self, token: str) -> Dict[str, float]:
+        """Returns the indexed tokens matching a query token and their match weight."""
+        matches = {}
+        start = bisect.bisect_left(self._vocabulary, token)
+        for candidate in self._vocabulary[start:]:
+            if not candidate.startswith(token):
+                break
+            matches[candidate] = EXACT_MATCH if candidate == token else PREFIX_MATCH
+
+        max_typos = _max_typos(token)
+        if max_typos:
+            trigrams = _trigrams(token)
+            shared = defaultdict(int)
+            for trigram in trigrams:
+                for candidate in self._trigrams.get(trigram, ()):
+                    shared[candidate] += 1
+            # Each edit changes at most 4 trigrams (3, or 4 for a transposition)
+            required = len(trigrams) - 4 * max_typos
+            for candidate, count in shared.items():
+                if (
+                    count >= required
+                    and candidate not in matches
+                    and edit_distance(token, candidate, max_typos) <= max_typos
+                ):
+                    matches[candidate] = FUZZY_MATCH
+        return matches
+
+    def search(
+        self, query: str, node_type: Optional[ObjectId] = None
+    ) -> List[Tuple[ObjectId, float]]:
+        """Returns the (node id, score) of every node matching `query`, best first."""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        n_nodes = max(len(self._nodes), 1)
+        scores: Dict[ObjectId, float] = defaultdict(float)
+        matched: Dict[ObjectId, int] = defaultdict(int)
+        for token in tokens:
+            best: Dict[ObjectId, float] = {}
+            for candidate, match_weight in self._expand(token).items():
+                postings = self._postings[candidate]
+                idf = math.log(1 + n_nodes / len(postings))
+                for node_id, field_weight in postings.items():
+                    score = match_weight * field_weight * idf
+                    if score > best.get(node_id, 0):
+                        best[node_id] = score
+            for node_id, score in best.items():
+                scores[node_id] += score
+                matched[node_id] += 1
+
+        if node_type is not None:
+            scores = {
+                node_id: score
+                for node_id, score in scores.items()
+                if self._nodes[node_id][1] == node_type
+            }
+        return sorted(
+            scores.items(),
+            key=lambda s: (-matched[s[0]], -s[1], self._nodes[s[0]][0].casefold()),
+        )
+
+    def node(self, node_id: ObjectId) -> Tuple[str, ObjectId]:
+        """Returns the (name, type) of an indexed node."""
+        name, node_type, _ = self._nodes[node_id]
+        return name, node_type
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+
+class SearchIndexCache(NodeIndexCache[GraphSearchIndex]):
+    """LRU cache of per-graph search indexes, loaded on first use."""
+
+    def __init__(self, max_graphs: int, ttl_seconds: float):
+        super().__init__(
+            name="search",
+            build=GraphSearchIndex,
+            projection=_PROJECTION,
+            max_graphs=max_graphs,
+            ttl_seconds=ttl_seconds,
+        )
+
+    async def search(
+        self,
+        graph_id: ObjectId,
+        db: AsyncIOMotorDatabase,
+        query: str,
+        limit: int,
+        offset: int = 0,
+        node_type: Optional[ObjectId] = None,
+    ) -> Tuple[List[Dict], int]:
+        """Returns a page of the nodes matching `query` and the total number of matches.
+
+        Results are {_id, name, type, score} ordered by relevance.
+        """
+        index = await self.get(graph_id=graph_id, db=db)
+        ranked = index.search(query=query, node_type=node_type)
+        page = []
+        for node_id, score in ranked[offset : offset + limit]:
+            name, match_type = index.node(node_id)
+            page.append(
+                {"_id": node_id, "name": name, "type": match_type, "score": score}
+            )
+        return page, len(ranked)
+
+
+search_index = SearchIndexCache(
+    max_graphs=settings.SEARCH_INDEX_MAX_GRAPHS,
+    ttl_seconds=settings.SEARCH_INDEX_TTL_SECONDS,
+)
@@ -0,0 +1,178 @@
+"""Fast JSON serialization of graph read responses.
+
+By default `read_graph` and `get_subgraph` return pydantic models which FastAPI
+validates again against the route's response model and encodes with
+`jsonable_encoder` and the standard `json` module. With `FAST_JSON_RESPONSES` they
+return plain dicts in the shape of those models instead (ids already stringified)
+and the routers serialize them with orjson, skipping both the second validation
+and the encoder.
+
+Plain dicts carry the stored values as they are: fields missing from a document
+get the model's static default (None for generated ids and timestamps) rather than
+a freshly generated one.
+
+`compact_ids` shrinks large payloads further by replacing their hex ids with small
+integers indexing a lookup table sent along with the response.
+"""
+
+import json
+from functools import lru_cache
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Dict,
+    List,
+    Tuple,
+    Type,
+    Union,
+)
+
+import orjson
+from bson import ObjectId
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from settings import settings
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, BaseModel):
+        return obj.dict(by_alias=True)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Serializes `content` with orjson (ObjectIds as strings)."""
+    return orjson.dumps(content, default=_default)
+
+
+# Keys whose values are ids in graph payloads
+ID_FIELDS = frozenset({"_id", "id", "item_id", "graph_id", "type"})
+
+
+def _is_id(value: Any) -> bool:
+    return isinstance(value, ObjectId) or (
+        isinstance(value, str) and len(value) == 24 and ObjectId.is_valid(value)
+    )
+
+
+def compact_ids(content: Any) -> Dict:
+    """Replaces the ids in a payload by indexes into a per-response lookup table.
+
+    Id values of the `ID_FIELDS` keys become integers `i` such that `ids[i]` is the
+    id; other ObjectIds are stringified. Returns `{"ids": [...], "data": content}`.
+    """
+    index: Dict[str, int] = {}
+
+    def local_id(value: Any) -> int:
+        return index.setdefault(str(value), len(index))
+
+    def walk(value: Any) -> Any:
+        if isinstance(value, BaseModel):
+            value = value.dict(by_alias=True)
+        if isinstance(value, dict):
+            return {
+                k: local_id(v) if k in ID_FIELDS and _is_id(v) else walk(v)
+                for k, v in value.items()
+            }
+        if isinstance(value, (list, tuple)):
+            return [walk(v) for v in value]
+        if isinstance(value, ObjectId):
+            return str(value)
+        return value
+
+    data = walk(content)
+    return {"ids": list(index), "data": data}
+
+
+def render(content: Any) -> bytes:
+    """Serializes a response body with the configured serializer."""
+    if settings.FAST_JSON_RESPONSES:
+        return dumps(content)
+    return JSONResponse(
+        content=jsonable_encoder(content, custom_encoder={ObjectId: str})
+    ).body
+
+
+async def _chunks(items: Union[List, AsyncIterable], size: int) -> AsyncIterator[List]:
+    if isinstance(items, list):
+        for start in range(0, len(items), size):
+            yield items[start : start + size]
+        return
+    chunk = []
+    async for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def iter_json(
+    fields: Dict[str, Any], chunk_size: int = 1000
+) -> AsyncIterator[bytes]:
+    """Serializes an object piece by piece for a `StreamingResponse`.
+
+    List values and async iterables (e.g. of documents read from a cursor) are
+    rendered `chunk_size` items at a time, so neither they nor the encoded body have
+    to be held in memory at once.
+    """
+    yield b"{"
+    for i, (key, value) in enumerate(fields.items()):
+        prefix = (b"," if i else b"") + json.dumps(key).encode() + b":"
+        if not isinstance(value, list) and not hasattr(value, "__aiter__"):
+            yield prefix + render(value)
+            continue
+        yield prefix + b"["
+        separator = b""
+        async for chunk in _chunks(value, chunk_size):
+            # Strip the brackets of the rendered chunk
+            yield separator + render(chunk)[1:-1]
+            separator = b","
+        yield b"]"
+    yield b"}"
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_response(content: Any, validate: bool = True) -> Any:
+    """Wraps plain content in a `FastJSONResponse` when fast responses are enabled.
+
+    Returning a response object bypasses the route's response model, which content
+    that does not match it (`validate=False`, e.g. from `compact_ids`) must do.
+    Other content (and None, so failures still surface as before) is returned
+    unchanged.
+    """
+    if content is None:
+        return content
+    if settings.FAST_JSON_RESPONSES:
+        return FastJSONResponse(content=content)
+    if not validate:
+        return Response(content=render(content), media_type="application/json")
+    return content
+
+
+@lru_cache(maxsize=None)
+def model_fields(model: Type[BaseModel]) -> Tuple[Tuple[str, Any], ...]:
+    """Returns the (alias, static default) of each field of a model in order."""
+    return tuple((f.alias, f.default) for f in model.__fields__.values())
+
+
+def project(doc: Dict, model: Type[BaseModel]) -> Dict:
+    """Returns the fields of `model` from a document as a plain dict keyed by alias."""
+    return {alias: doc.get(alias, default) for alias, default in model_fields(model)}
+
+
+def project_many(docs: List[Dict], model: Type[BaseModel]) -> List[Dict]:
+    return [project(doc, model) for doc in docs or []]
@@ -0,0 +1,154 @@
+"""Atomic multi-document mutations.
+
+Services that insert and delete many documents at once (e.g. node merges) describe
+the change as a `Mutation` and apply it with `apply_mutation`.
+
+On replica sets and sharded clusters the mutation runs inside a transaction. Standalone
+servers do not support transactions, so the mutation is journaled instead: a journal
+document listing the inserted ids and the deletes is written (journaled write concern)
+before any change, inserts are applied before deletes and the journal is removed once
+done. If the mutation fails while inserting, the inserts are rolled back; once every
+insert has been written, the deletes are rolled forward. Journals left behind by a
+crashed process are recovered with `recover_journals` (see `db_manager.py`).
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from bson import ObjectId
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import WriteConcern
+
+from settings import settings
+
+JOURNAL_COLLECTION = "journal"
+
+# Whether the server supports transactions (checked once per process)
+_supports_transactions: Optional[bool] = None
+
+
+class Delete(NamedTuple):
+    collection: str
+    field: str  # Documents whose `field` is in `values` are deleted
+    values: List[Any]
+
+
+class Mutation(NamedTuple):
+    operation: str  # Name recorded in the journal/logs (e.g. "merge")
+    inserts: Dict[str, List[Dict]]  # collection -> documents (with `_id`s)
+    deletes: List[Delete]
+
+
+async def supports_transactions(db: AsyncIOMotorDatabase) -> bool:
+    """Returns True if the server is a replica set member or mongos."""
+    global _supports_transactions
+    if _supports_transactions is None:
+        try:
+            hello = await db.client.admin.command("hello")
+            _supports_transactions = (
+                "setName" in hello or hello.get("msg") == "isdbgrid"
+            )
+        except Exception as e:
+            logger.debug(f"Unable to determine transaction support: {e}")
+            _supports_transactions = False
+    return _supports_transactions
+
+
+async def _write(
+    db: AsyncIOMotorDatabase, mutation: Mutation, session=None, deletes: bool = True
+) -> None:
+    for collection, documents in mutation.inserts.items():
+        if documents:
+            await db[collection].insert_many(documents, ordered=False, session=session)
+    if deletes:
+        await _delete(db, mutation.deletes, session=session)
+
+
+async def _delete(db: AsyncIOMotorDatabase, deletes: List[Delete], session=None):
+    for delete in deletes:
+        if delete.values:
+            await db[delete.collection].delete_many(
+                {delete.field: {"$in": delete.values}}, session=session
+            )
+
+
+async def apply_mutation(db: AsyncIOMotorDatabase, mutation: Mutation) -> None:
+    """Applies all inserts and deletes of a mutation or none of them.
+
+    Raises the error of the failed write after rolling back.
+    """
+    if settings.MUTATION_TRANSACTIONS and await supports_transactions(db):
+        async with await db.client.start_session() as session:
+
+            async def callback(session):
+                await _write(db, mutation, session=session)
+
+            await session.with_transaction(callback)
+        return
+
+    journal = db.get_collection(
+        JOURNAL_COLLECTION, write_concern=WriteConcern(w=1, j=True)
+    )
+    entry = {
+        "_id": ObjectId(),
+        "operation": mutation.operation,
+        "phase": "insert",
+        "inserted": {
+            collection: [d["_id"] for d in documents]
+            for collection, documents in mutation.inserts.items()
+        },
+        "deletes": [d._asdict() for d in mutation.deletes],
+        "created_at": datetime.utcnow(),
+    }
+    await journal.insert_one(entry)
+    try:
+        await _write(db, mutation, deletes=False)
+        await journal.update_one({"_id": entry["_id"]}, {"$set": {"phase": "delete"}})
+        entry["phase"] = "delete"
+        await _delete(db, mutation.deletes)
+    except Exception as e:
+        logger.error(f"Failed to apply {mutation.operation}, recovering: {e}")
+        try:
+            await _recover(db, entry)
+        except Exception as recovery_error:
+            logger.error(
+                f"Failed to recover {mutation.operation} journal {entry['_id']}: {recovery_error}"
+            )
+        raise
+    await journal.delete_one({"_id": entry["_id"]})
+
+
+async def _recover(db: AsyncIOMotorDatabase, entry: Dict) -> None:
+    """Rolls an interrupted journaled mutation back (insert phase) or forward."""
+    if entry["phase"] == "insert":
+        for collection, ids in entry["inserted"].items():
+            await db[collection].delete_many({"_id": {"$in": ids}})
+    else:
+        await _delete(db, [Delete(**d) for d in entry["deletes"]])
+    await db[JOURNAL_COLLECTION].delete_one({"_id": entry["_id"]})
+    logger.info(
+        "Recovered {} ({} phase) journal {}",
+        entry["operation"],
+        entry["phase"],
+        entry["_id"],
+    )
+
+
+async def recover_journals(
+    db: AsyncIOMotorDatabase, older_than_seconds: float = 0
+) -> int:
+    """Recovers journaled mutations left behind by crashed processes.
+
+    Only journals older than `older_than_seconds` are recovered so mutations still in
+    progress elsewhere are left alone. Returns the number of recovered journals.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=older_than_seconds)
+    entries = (
+        await db[JOURNAL_COLLECTION]
+        .find({"created_at": {"$lte": cutoff}})
+        .to_list(None)
+    )
+    for entry in entries:
+        await _recover(db, entry)
+    return len(entries)
@@ -0,0 +1,195 @@
+"""Per-graph version counters and change log.
+
+Every service that changes a graph (its nodes, edges, triples, errors/suggestions,
+classes or settings) calls `bump_graph_version` once its writes are done. The version
+is kept on the graph document so all workers agree on it; read endpoints use it to
+tag and cache their responses (see `services.response_cache`).
+
+Each bump also appends an entry to the `changes` collection with the ids of the
+nodes, edges and triples it touched (issue changes are recorded against their
+items). `get_changes` turns the entries after a client's version into the current
+documents of those items, so clients can patch their state instead of reloading it,
+and each entry is pushed to the graph's event subscribers (see `services.events`).
+The same ids keep the graph's per-class counters up to date (see
+`services.class_stats`).
+Bumps that do not say what changed, or touch more than `CHANGE_LOG_MAX_IDS` items,
+are logged as resets, which tell clients to reload. Entries expire after
+`CHANGE_LOG_TTL_SECONDS`.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+from settings import settings
+from services.class_stats import counts_changes, update_class_stats
+from services.events import change_broker
+from services.hydration import load_documents
+from services.issue_store import attach_issues
+
+VERSION_FIELD = "version"
+CHANGES_COLLECTION = "changes"
+CHANGE_KINDS = ("nodes", "edges", "triples")
+
+
+async def get_graph_version(
+    graph_id: ObjectId, db: AsyncIOMotorDatabase
+) -> Optional[int]:
+    """Returns the version of a graph (None if it does not exist or is being deleted)."""
+    graph = await db["graphs"].find_one(
+        # Graphs being deleted (see `services.deletion`) are read as missing
+        {"_id": graph_id, "deletion": {"$exists": False}},
+        {VERSION_FIELD: 1},
+    )
+    return None if graph is None else graph.get(VERSION_FIELD, 0)
+
+
+async def _update_class_stats(
+    graph_id: ObjectId,
+    db: AsyncIOMotorDatabase,
+    changes: Optional[Dict[str, Iterable]],
+) -> None:
+    """Updates the per-class counters of a graph, dropping them if that fails."""
+    try:
+        await update_class_stats(graph_id=graph_id, db=db, changes=changes)
+        return
+    except Exception as e:
+        logger.error(f"Failed to update class stats of graph {graph_id}: {e}")
+    if changes is None:
+        return
+    try:
+        # Dropped counters are recounted on the next read
+        await update_class_stats(graph_id=graph_id, db=db, changes=None)
+    except Exception as e:
+        logger.error(f"Failed to drop class stats of graph {graph_id}: {e}")
+
+
+async def bump_graph_version(
+    graph_id: ObjectId,
+    db: AsyncIOMotorDatabase,
+    changes: Optional[Dict[str, Iterable]] = None,
+) -> Optional[int]:
+    """Increments the version of a graph after a change and returns the new version.
+
+    `changes` lists the changed (or deleted) "nodes", "edges" and "triples" by id and
+    sets "graph" if the graph document (classes, settings) changed. Without it the
+    change is logged as a reset.
+    """
+    graph_id = ObjectId(graph_id)
+    graph = await db["graphs"].find_one_and_update(
+        {"_id": graph_id},
+        {"$inc": {VERSION_FIELD: 1}},
+        projection={VERSION_FIELD: 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if graph is None:
+        return None
+    version = graph[VERSION_FIELD]
+
+    if counts_changes(changes):
+        await _update_class_stats(graph_id=graph_id, db=db, changes=changes)
+
+    entry = {
+        "graph_id": graph_id,
+        "version": version,
+        "created_at": datetime.utcnow(),
+        "reset": changes is None,
+        "graph": bool(changes and changes.get("graph")),
+    }
+    for kind in CHANGE_KINDS:
+        entry[kind] = list({ObjectId(_id) for _id in (changes or {}).get(kind) or []})
+    if sum(len(entry[kind]) for kind in CHANGE_KINDS) > settings.CHANGE_LOG_MAX_IDS:
+        entry.update({"reset": True, **{kind: [] for kind in CHANGE_KINDS}})
+
+    try:
+        await db[CHANGES_COLLECTION].insert_one(entry)
+    except Exception as e:
+        # Clients find the version missing from the log and reload
+        logger.error(f"Failed to log changes of graph {graph_id}: {e}")
+        return version
+    if settings.CHANGE_EVENTS_SOURCE == "local":
+        change_broker.publish(entry)
+    return version
+
+
+async def get_change_entries(
+    graph_id: ObjectId,
+    since: int,
+    db: AsyncIOMotorDatabase,
+    until: Optional[int] = None,
+    limit: int = 0,
+) -> List[Dict]:
+    """Returns the change log entries of a graph after version `since` in order.
+
+    At most `limit` entries are returned (all of them if 0).
+    """
+    versions = {"$gt": since}
+    if until is not None:
+        versions["$lte"] = until
+    return (
+        await db[CHANGES_COLLECTION]
+        .find({"graph_id": graph_id, "version": versions})
+        .sort("version", 1)
+        .limit(limit)
+        .to_list(None)
+    )
+
+
+async def get_changes(
+    graph_id: ObjectId, since: int, db: AsyncIOMotorDatabase
+) -> Optional[Dict]:
+    """Returns the changes of a graph after version `since` (None if it does not exist).
+
+    The result has the current `version`, the current documents of the changed
+    "nodes", "edges" and "triples", the ids of those since deleted under "deleted",
+    and the graph's classes and settings under "graph" if they changed. If the
+    changes cannot be reconstructed (expired or unlogged versions, resets, too many
+    items) `reset` is set and the client must reload the graph instead.
+    """
+    version = await get_graph_version(graph_id=graph_id, db=db)
+    if version is None:
+        return None
+
+    result = {
+        "since": since,
+        "version": version,
+        "reset": False,
+        "graph": None,
+        **{kind: [] for kind in CHANGE_KINDS},
+        "deleted": {kind: [] for kind in CHANGE_KINDS},
+    }
+    if since == version:
+        return result
+
+    entries = await get_change_entries(
+        graph_id=graph_id, since=since, db=db, until=version
+    )
+    changed = {kind: set() for kind in CHANGE_KINDS}
+    for entry in entries:
+        for kind in CHANGE_KINDS:
+            changed[kind].update(entry[kind])
+    if (
+        since > version
+        or len(entries) != version - since
+        or any(entry["reset"] for entry in entries)
+        or sum(len(ids) for ids in changed.values()) > settings.CHANGE_LOG_MAX_IDS
+    ):
+        result["reset"] = True
+        return result
+
+    for kind in CHANGE_KINDS:
+        documents = await load_documents(db[kind], changed[kind])
+        result[kind] = [d for d in documents.values() if d["graph_id"] == graph_id]
+        result["deleted"][kind] = [_id for _id in changed[kind] if _id not in documents]
+    await attach_issues(db, nodes=result["nodes"], edges=result["edges"])
+
+    if any(entry["graph"] for entry in entries):
+        result["graph"] = await db["graphs"].find_one(
+            {"_id": graph_id},
+            {"name": 1, "settings": 1, "node_classes": 1, "edge_classes": 1},
+        )
+    return result
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import BaseSettings
 
 
@@ -14,6 +16,80 @@ class Settings(BaseSettings):
 
     PLUGIN_DIRECTORY: str = "./plugins"
 
+    LOG_LEVEL: str = "INFO"
+    LOG_TO_FILES: bool = True
+    LOG_SERIALIZE: bool = False  # Write file sinks as JSON lines (structured logs)
+    LOG_ROTATION: str = "100 MB"
+    LOG_RETENTION: str = "10 days"
+    LOG_REQUESTS: bool = True  # Emit one summary line per request
+    LOG_MAX_SUMMARY_ITEMS: int = 5  # Items shown when summarising collections
+    LOG_MAX_CHARS: int = 500  # Hard cap on the length of a summarised value
+    LOG_SAMPLE_RATE: float = 1.0  # Probability a per-item message is emitted
+    LOG_SAMPLE_MAX_MESSAGES: int = 10  # Per-item messages emitted per operation
+
+    METRICS_ENABLED: bool = True  # Collect request/db/plugin metrics for /metrics
+    METRICS_SERVER_TIMING: bool = False  # Add a Server-Timing header to responses
+
+    ADJACENCY_CACHE_MAX_BYTES: int = (
+        512 * 1024 * 1024
+    )  # Memory budget for graph adjacencies
+    ADJACENCY_CACHE_TTL_SECONDS: float = 300  # Reload cached adjacencies after this age
+    ADJACENCY_COMPACT_THRESHOLD: float = (
+        0.1  # Rebuild CSR arrays once this fraction changed
+    )
+
+    SUBGRAPH_MAX_HOPS: int = 3  # Upper bound for multi-hop subgraph requests
+    SUBGRAPH_MAX_NODES: int = 500  # Nodes returned by a multi-hop subgraph
+    SUBGRAPH_MAX_EDGES: int = 1000  # Triples returned by a multi-hop subgraph
+    SUBGRAPH_MAX_FANOUT: int = 100  # Triples followed per node while expanding
+    HYDRATION_BATCH_SIZE: int = 10000  # Ids per $in query when populating triples
+
+    SAMPLE_POOL_SIZE: int = 256  # Random focus node candidates kept per graph
+    SAMPLE_POOL_REFILL_FRACTION: float = 0.25  # Refill in the background below this
+    SAMPLE_POOL_PRIORITISE: bool = True  # Prefer unreviewed nodes with errors
+
+    REVIEW_QUEUE_MAX_GRAPHS: int = 32  # Review priority queues kept in memory
+    REVIEW_QUEUE_TTL_SECONDS: float = 300  # Rebuild queues after this age
+    REVIEW_PRIORITY_ERROR_WEIGHT: float = 3.0  # Per open error on a node/its edges
+    REVIEW_PRIORITY_SUGGESTION_WEIGHT: float = 1.0  # Per open suggestion
+    REVIEW_PRIORITY_UNREVIEWED_WEIGHT: float = 2.0  # Times the unreviewed fraction
+    REVIEW_PRIORITY_DEGREE_WEIGHT: float = 1.0  # Times log(1 + degree)
+
+    NAME_INDEX_MAX_GRAPHS: int = 32  # Node name autocomplete indexes kept in memory
+    NAME_INDEX_TTL_SECONDS: float = 300  # Rebuild name indexes after this age
+    AUTOCOMPLETE_MAX_RESULTS: int = 100  # Upper bound for autocomplete `limit`
+    SEARCH_INDEX_MAX_GRAPHS: int = 16  # Node full-text search indexes kept in memory
+    SEARCH_INDEX_TTL_SECONDS: float = 300  # Rebuild search indexes after this age
+    SEARCH_MAX_TYPOS: int = 2  # Edits tolerated per query token (0 disables fuzzy)
+    SEARCH_MAX_RESULTS: int = 100  # Upper bound for search `limit`
+    ANALYTICS_CACHE_MAX_ENTRIES: int = 32  # Graph analytics results kept in memory
+    ANALYTICS_MAX_TOP_K: int = 100  # Upper bound for analytics `top_k`
+
+    RESPONSE_CACHE_ENABLED: bool = True  # ETags and caching of graph read responses
+    RESPONSE_CACHE_MAX_BYTES: int = 128 * 1024 * 1024  # Cached response bodies
+    CHANGE_LOG_TTL_SECONDS: int = 7 * 24 * 3600  # Retention of the change log
+    CHANGE_LOG_MAX_IDS: int = 10000  # Larger changes are logged as resets
+    CHANGE_EVENTS_SOURCE: str = "local"  # or "change_stream" (all workers, replica set)
+    CHANGE_EVENTS_QUEUE_SIZE: int = 100  # Events buffered per client before a reset
+    CHANGE_EVENTS_MAX_SUBSCRIBERS: int = 1000  # Event streams per graph and worker
+    CHANGE_EVENTS_MAX_REPLAY: int = 1000  # Older `since` versions are sent a reset
+    CHANGE_EVENTS_HEARTBEAT_SECONDS: float = 15
+    FAST_JSON_RESPONSES: bool = False  # Plain dicts + orjson for graph/subgraph reads
+
+    COMPRESSION_ENABLED: bool = True  # gzip/brotli responses (see compression.py)
+    COMPRESSION_MIN_BYTES: int = 1024  # Smaller bodies are sent uncompressed
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4  # 0-11, higher is smaller but slower
+
+    BULK_MAX_ITEMS: int = 1000  # Items (by id or filter) updated by a bulk request
+    BULK_MAX_MERGE_NODES: int = 10000  # Nodes accepted by a bulk merge request
+
+    CREATE_INDEXES_ON_STARTUP: bool = True  # See services/indexes.py
+    ISSUE_STORAGE: Literal["embedded", "collection"] = "embedded"  # See issue_store.py
+    MUTATION_TRANSACTIONS: bool = True  # Use transactions when the server supports them
+    GRAPH_DELETE_BATCH_SIZE: int = 5000  # Documents removed per graph delete batch
+    GRAPH_DELETE_PAUSE_SECONDS: float = 0  # Pause between batches for other writes
+
     UNTYPED_GRAPH_NODE_CLASS: str = (
         "Untyped"  # This is the "type" given to nodes in untyped graphs
     )